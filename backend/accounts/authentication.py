@@ -1,12 +1,44 @@
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from .cache import get_cached_user
 
-class CSRFExemptJWTAuthentication(JWTAuthentication):
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT Authentication that resolves the token's user through the user cache
+    instead of querying the database on every request
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        
+        try:
+            user = get_cached_user(user_id)
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        
+        return user
+
+
+class CSRFExemptJWTAuthentication(CachedJWTAuthentication):
     """
     JWT Authentication that bypasses CSRF for API endpoints
     """
     def authenticate(self, request):
         # Set CSRF exempt flag
         setattr(request, '_dont_enforce_csrf_checks', True)
-        return super().authenticate(request) 
\ No newline at end of file
+        return super().authenticate(request) 
@@ -0,0 +1,131 @@
+"""
+Cache of authenticated users, keyed by user id
+
+JWT authentication (HTTP and WebSocket) only needs the user row, which
+rarely changes, so it is kept in an in-process LRU with a TTL. When
+``AUTH_USER_CACHE_ALIAS`` names a Django cache (e.g. Redis), rows are also
+shared through it, and the local copies are kept for at most
+``AUTH_USER_CACHE_LOCAL_TTL_SECONDS`` so every process sees changes quickly.
+
+Credentials (``UNCACHED_FIELDS``) are never cached; they load from the
+database on access. Entries are dropped by the ``post_save``/``post_delete``
+receivers in ``accounts.signals``. Lookups are counted as
+``auth.user_cache.hit`` and ``auth.user_cache.miss`` in
+``localconnect_backend.metrics``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from localconnect_backend import metrics
+
+# Left deferred on cached users, so password hashes never reach a shared cache
+UNCACHED_FIELDS = {'password'}
+
+
+class UserCache:
+    """LRU + TTL cache of user rows, optionally backed by a shared Django cache"""
+
+    def __init__(self, max_size=None, ttl=None, alias=None, local_ttl=None):
+        self.max_size = settings.AUTH_USER_CACHE_MAX_SIZE if max_size is None else max_size
+        self.ttl = settings.AUTH_USER_CACHE_TTL_SECONDS if ttl is None else ttl
+        alias = settings.AUTH_USER_CACHE_ALIAS if alias is None else alias
+        self.shared = caches[alias] if alias else None
+        if self.shared is None:
+            self.local_ttl = self.ttl
+        else:
+            local_ttl = settings.AUTH_USER_CACHE_LOCAL_TTL_SECONDS if local_ttl is None else local_ttl
+            self.local_ttl = min(local_ttl, self.ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id):
+        return f'auth:user:{user_id}'
+
+    def get(self, user_id):
+        """Return the user with ``user_id``; raises ``User.DoesNotExist``"""
+        User = get_user_model()
+        key = str(user_id)
+        values = self._get_local(key)
+        if values is None and self.shared is not None:
+            values = self.shared.get(self._key(key))
+            if values is not None:
+                self._set_local(key, values)
+
+        if values is not None:
+            metrics.incr('auth.user_cache.hit')
+        else:
+            metrics.incr('auth.user_cache.miss')
+            user = User.objects.get(pk=user_id)
+            values = self._values(user)
+            self._set_local(key, values)
+            if self.shared is not None:
+                self.shared.set(self._key(key), values, self.ttl)
+            return user
+
+        # Each caller gets its own instance, so cached state is never shared.
+        # Uncached fields, and fields missing from an entry written by an older
+        # release, load lazily.
+        return User.from_db(None, list(values), list(values.values()))
+
+    def invalidate(self, user_id):
+        """Forget a user, locally and in the shared cache"""
+        key = str(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self._key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _values(user):
+        return {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields
+            if field.attname not in UNCACHED_FIELDS
+        }
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return values
+
+    def _set_local(self, key, values):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_user_cache = None
+
+
+def get_user_cache():
+    """Return the process-wide user cache"""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache()
+    return _user_cache
+
+
+def get_cached_user(user_id):
+    """Look up a user by id through the cache, or directly when it is disabled"""
+    if not settings.AUTH_USER_CACHE_ENABLED:
+        return get_user_model().objects.get(pk=user_id)
+    return get_user_cache().get(user_id)
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import get_user_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the cached copy of a changed user so role changes and deactivation
+    apply to the next request
+    """
+    user_cache = get_user_cache()
+    user_cache.invalidate(instance.pk)
+    # Again after commit, in case the old row was re-cached in the meantime
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
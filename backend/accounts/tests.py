@@ -1,3 +1,62 @@
+from unittest import mock
+
+from django.core.cache import caches
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import UserCache, get_user_cache
+from .models import User
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def current_user(self):
+        return self.client.get('/api/accounts/current-user/')
+
+    def test_repeated_requests_reuse_the_cached_row(self):
+        self.assertEqual(self.current_user().status_code, 200)
+        with self.assertNumQueries(0):
+            get_user_cache().get(self.user.pk)
+
+    def test_role_change_applies_to_the_next_request(self):
+        self.assertEqual(self.current_user().json()['role'], 'USER')
+        self.user.role = User.Role.VOLUNTEER
+        self.user.save()
+        self.assertEqual(self.current_user().json()['role'], 'VOLUNTEER')
+        self.user.role = User.Role.USER
+        self.user.save()
+        self.assertEqual(self.current_user().json()['role'], 'USER')
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.current_user().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.current_user().status_code, 401)
+
+    def test_entries_expire_after_the_ttl(self):
+        user_cache = UserCache(ttl=60, alias='')
+        with mock.patch('accounts.cache.time.monotonic', return_value=1000):
+            user_cache.get(self.user.pk)
+        # Written without signals, so only expiry picks the change up
+        User.objects.filter(pk=self.user.pk).update(role=User.Role.ADMIN)
+        with mock.patch('accounts.cache.time.monotonic', return_value=1059):
+            self.assertEqual(user_cache.get(self.user.pk).role, User.Role.USER)
+        with mock.patch('accounts.cache.time.monotonic', return_value=1060):
+            self.assertEqual(user_cache.get(self.user.pk).role, User.Role.ADMIN)
+
+    def test_password_hash_stays_out_of_the_shared_cache(self):
+        user_cache = UserCache(alias='default')
+        self.addCleanup(caches['default'].clear)
+        user_cache.get(self.user.pk)
+        self.assertNotIn('password', caches['default'].get(f'auth:user:{self.user.pk}'))
 
-# Create your tests here.
+        user_cache.clear()
+        cached = user_cache.get(self.user.pk)
+        self.assertEqual(cached.username, 'neighbour')
+        self.assertTrue(cached.check_password('pass'))
@@ -0,0 +1,35 @@
+import json
+from django.conf import settings
+
+
+# Channel layer event type for frames that are already encoded for the socket.
+# Channels maps "broadcast.frame" to the consumer's ``broadcast_frame`` handler.
+BROADCAST_FRAME_EVENT = 'broadcast.frame'
+
+
+def encode_frame(payload, binary=None):
+    """
+    Encode a WebSocket payload once so it can be fanned out to every member.
+
+    Returns a channel layer event carrying either ``text`` or ``bytes``.
+    """
+    if binary is None:
+        binary = getattr(settings, 'CHAT_BROADCAST_BINARY_FRAMES', False)
+
+    encoded = json.dumps(payload, separators=(',', ':'))
+    if binary:
+        return {'type': BROADCAST_FRAME_EVENT, 'bytes': encoded.encode('utf-8')}
+    return {'type': BROADCAST_FRAME_EVENT, 'text': encoded}
+
+
+async def group_send_frame(channel_layer, group_name, payload, **extra):
+    """
+    Encode ``payload`` once and send the pre-encoded frame to a group.
+
+    Extra keyword arguments are attached to the event (not the frame) so that
+    receivers can inspect them without decoding the payload.
+    """
+    event = encode_frame(payload)
+    event.update(extra)
+    await channel_layer.group_send(group_name, event)
+    return event
@@ -1,10 +1,17 @@
 import json
 import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from django.utils import timezone
 from .models import ChatRoom, ChatParticipant, Message, ChatNotification
+from .broadcast import group_send_frame
+from .persistence import get_write_behind
+from .presence import get_presence_registry
+from .typing_state import get_typing_tracker
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -12,73 +19,83 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for real-time chat"""
+def message_payload(message):
+    """Serialize a message the way it is pushed over the WebSocket"""
+    return {
+        'id': str(message.id),
+        'seq': message.seq,
+        'content': message.content,
+        'message_type': message.message_type,
+        'file_url': message.file_url,
+        'file_name': message.file_name,
+        'file_size': message.file_size,
+        'sender': {
+            'id': str(message.sender.id),
+            'username': message.sender.username,
+            'profile_picture': message.sender.profile_picture.url if message.sender.profile_picture else None
+        },
+        'created_at': message.created_at.isoformat(),
+        'is_edited': message.is_edited,
+        'edited_at': message.edited_at.isoformat() if message.edited_at else None
+    }
+
+
+class ChatRoomMixin:
+    """
+    Chat room operations shared by the per-room and multiplexed consumers.
     
-    async def connect(self):
-        """Handle WebSocket connection"""
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+    Every handler takes the room it acts on, so one connection can serve any
+    number of rooms. Frames sent to the client carry ``room_id``.
+    """
+    
+    def init_rooms(self):
+        self.rooms = set()
+        # Highest message seq already replayed per room, to drop duplicates
+        self.replayed_seqs = {}
+    
+    async def join_room(self, room_id, since_seq=None):
+        """Subscribe this connection to a room (participation already checked)"""
+        await self.channel_layer.group_add(f'chat_{room_id}', self.channel_name)
+        self.rooms.add(room_id)
         
-        logger.info(f"WebSocket connection attempt for room {self.room_id}")
-        logger.info(f"User: {self.scope.get('user', 'No user in scope')}")
+        # Catch a reconnecting client up before live delivery starts. Group
+        # events queue up on the channel until this handler returns.
+        if since_seq is not None:
+            await self.replay_missed_messages(room_id, since_seq)
         
-        # Check if user is authenticated
-        if not self.scope['user'].is_authenticated:
-            logger.warning(f"Unauthorized connection attempt for room {self.room_id}")
-            await self.close(code=4001)  # Custom close code for unauthorized
+        # Update user's online status
+        await self.update_user_status(room_id, True)
+    
+    async def leave_room(self, room_id):
+        """Unsubscribe this connection from a room"""
+        if room_id not in self.rooms:
             return
+        self.rooms.discard(room_id)
+        self.replayed_seqs.pop(room_id, None)
         
-        # Check if user is participant of the chat room
-        is_participant = await self.is_participant()
-        if not is_participant:
-            logger.warning(f"User {self.scope['user'].username} is not a participant in room {self.room_id}")
-            await self.close(code=4003)  # Custom close code for not a participant
-            return
+        await self.channel_layer.group_discard(f'chat_{room_id}', self.channel_name)
         
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        
-        await self.accept()
-        logger.info(f"WebSocket connection accepted for user {self.scope['user'].username} in room {self.room_id}")
-        
-        # Send connection confirmation
-        await self.send(text_data=json.dumps({
-            'type': 'connection_established',
-            'room_id': self.room_id,
-            'user': self.scope['user'].username
-        }))
-        
-        # Update user's online status
-        await self.update_user_status(True)
-    
-    async def disconnect(self, close_code):
-        """Handle WebSocket disconnection"""
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Clear a typing indicator left behind by this connection
+        if get_typing_tracker().is_typing(room_id, self.scope['user'].username):
+            await self.handle_typing(room_id, {'is_typing': False})
         
         # Update user's online status
-        await self.update_user_status(False)
+        await self.update_user_status(room_id, False)
     
-    async def receive(self, text_data):
-        """Handle incoming WebSocket messages"""
-        text_data_json = json.loads(text_data)
-        message_type = text_data_json.get('type', 'chat_message')
+    async def handle_room_frame(self, room_id, data):
+        """Dispatch a client frame addressed to a room"""
+        message_type = data.get('type', 'chat_message')
         
         if message_type == 'chat_message':
-            await self.handle_chat_message(text_data_json)
+            await self.handle_chat_message(room_id, data)
         elif message_type == 'typing':
-            await self.handle_typing(text_data_json)
+            await self.handle_typing(room_id, data)
         elif message_type == 'read_messages':
-            await self.handle_read_messages(text_data_json)
+            await self.handle_read_messages(room_id, data)
+        elif message_type == 'heartbeat':
+            await get_presence_registry().heartbeat(room_id, self.scope['user'])
     
-    async def handle_chat_message(self, data):
+    async def handle_chat_message(self, room_id, data):
         """Handle chat message"""
         message_content = data.get('message', '').strip()
         message_type = data.get('message_type', 'text')
@@ -90,94 +107,121 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
         
         # Save message to database
-        message = await self.save_message(
-            message_content, message_type, file_url, file_name, file_size
-        )
+        if settings.CHAT_WRITE_BEHIND_ENABLED:
+            message = await self.queue_message(
+                room_id, message_content, message_type, file_url, file_name, file_size
+            )
+        else:
+            message = await self.save_message(
+                room_id, message_content, message_type, file_url, file_name, file_size
+            )
         
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        if message is None:
+            return
+        
+        # Send message to room group, encoded once for every member
+        await group_send_frame(
+            self.channel_layer,
+            f'chat_{room_id}',
             {
                 'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'content': message.content,
-                    'message_type': message.message_type,
-                    'file_url': message.file_url,
-                    'file_name': message.file_name,
-                    'file_size': message.file_size,
-                    'sender': {
-                        'id': str(message.sender.id),
-                        'username': message.sender.username,
-                        'profile_picture': message.sender.profile_picture.url if message.sender.profile_picture else None
-                    },
-                    'created_at': message.created_at.isoformat(),
-                    'is_edited': message.is_edited,
-                    'edited_at': message.edited_at.isoformat() if message.edited_at else None
-                }
-            }
+                'room_id': room_id,
+                'message': message_payload(message)
+            },
+            room_id=room_id,
+            seq=message.seq
         )
         
         # Create notifications for other participants
         await self.create_notifications(message)
     
-    async def handle_typing(self, data):
+    async def handle_typing(self, room_id, data):
         """Handle typing indicator"""
-        is_typing = data.get('is_typing', False)
+        is_typing = bool(data.get('is_typing', False))
+        
+        # Drop duplicate and too frequent frames; deferred and expired
+        # states are sent by the tracker's ticker
+        tracker = get_typing_tracker()
+        should_send = tracker.observe(room_id, self.scope['user'].username, is_typing)
+        tracker.ensure_ticker()
+        if not should_send:
+            return
         
         # Send typing indicator to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        await group_send_frame(
+            self.channel_layer,
+            f'chat_{room_id}',
             {
-                'type': 'user_typing',
+                'type': 'typing',
+                'room_id': room_id,
                 'user': self.scope['user'].username,
                 'is_typing': is_typing
             }
         )
     
-    async def handle_read_messages(self, data):
+    async def handle_read_messages(self, room_id, data):
         """Handle marking messages as read"""
-        await self.mark_messages_as_read()
+        await self.mark_messages_as_read(room_id)
         
         # Send read confirmation to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        await group_send_frame(
+            self.channel_layer,
+            f'chat_{room_id}',
             {
                 'type': 'messages_read',
+                'room_id': room_id,
                 'user': self.scope['user'].username,
                 'timestamp': timezone.now().isoformat()
             }
         )
     
-    async def chat_message(self, event):
-        """Send chat message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message']
-        }))
-    
-    async def user_typing(self, event):
-        """Send typing indicator to WebSocket"""
+    async def replay_missed_messages(self, room_id, since_seq):
+        """Send messages newer than ``since_seq`` in bounded pages"""
+        page_size = settings.CHAT_RESUME_PAGE_SIZE
+        remaining = settings.CHAT_RESUME_MAX_MESSAGES
+        last_seq = since_seq
+        truncated = False
+        
+        while True:
+            if remaining <= 0:
+                truncated = await self.has_messages_after(room_id, last_seq)
+                break
+            page = await self.get_messages_after(room_id, last_seq, min(page_size, remaining))
+            if not page:
+                break
+            
+            await self.send(text_data=json.dumps({
+                'type': 'replay',
+                'room_id': room_id,
+                'messages': page
+            }))
+            last_seq = page[-1]['seq']
+            remaining -= len(page)
+            if len(page) < page_size:
+                break
+        
+        # Live events up to this point were already replayed
+        self.replayed_seqs[room_id] = last_seq
         await self.send(text_data=json.dumps({
-            'type': 'typing',  # Changed from 'user_typing' to 'typing'
-            'user': event['user'],
-            'is_typing': event['is_typing']
+            'type': 'replay_complete',
+            'room_id': room_id,
+            'last_seq': last_seq,
+            'truncated': truncated
         }))
     
-    async def messages_read(self, event):
-        """Send read confirmation to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'messages_read',
-            'user': event['user'],
-            'timestamp': event['timestamp']
-        }))
+    async def broadcast_frame(self, event):
+        """Write a pre-encoded group frame straight to the WebSocket"""
+        seq = event.get('seq')
+        if seq is not None and seq <= self.replayed_seqs.get(event.get('room_id'), 0):
+            return
+        await self.send(text_data=event.get('text'), bytes_data=event.get('bytes'))
     
     @database_sync_to_async
-    def is_participant(self):
+    def is_participant(self, room_id):
         """Check if user is participant of the chat room"""
         try:
             return ChatParticipant.objects.filter(
-                chat_room_id=self.room_id,
+                chat_room_id=room_id,
                 user=self.scope['user'],
                 is_active=True
             ).exists()
@@ -185,11 +229,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return False
     
     @database_sync_to_async
-    def save_message(self, content, message_type, file_url, file_name, file_size):
+    def get_messages_after(self, room_id, since_seq, limit):
+        """Get up to ``limit`` messages newer than ``since_seq``"""
+        messages = Message.objects.filter(
+            chat_room_id=room_id,
+            seq__gt=since_seq,
+            is_deleted=False
+        ).select_related('sender').order_by('seq')[:limit]
+        return [message_payload(message) for message in messages]
+    
+    @database_sync_to_async
+    def has_messages_after(self, room_id, since_seq):
+        """Check if the room has messages newer than ``since_seq``"""
+        return Message.objects.filter(
+            chat_room_id=room_id,
+            seq__gt=since_seq,
+            is_deleted=False
+        ).exists()
+    
+    @database_sync_to_async
+    def save_message(self, room_id, content, message_type, file_url, file_name, file_size):
         """Save message to database"""
         try:
-            chat_room = ChatRoom.objects.get(id=self.room_id)
-            message = Message.objects.create(
+            chat_room = ChatRoom.objects.get(id=room_id)
+            # Also bumps the chat room's updated_at
+            return Message.objects.create(
                 chat_room=chat_room,
                 sender=self.scope['user'],
                 message_type=message_type,
@@ -198,68 +262,218 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 file_name=file_name,
                 file_size=file_size
             )
-            
-            # Update chat room's updated_at timestamp
-            chat_room.save()
-            
-            return message
         except ChatRoom.DoesNotExist:
             return None
     
+    async def queue_message(self, room_id, content, message_type, file_url, file_name, file_size):
+        """Save message through the batched write-behind queue"""
+        message = Message(
+            chat_room_id=room_id,
+            sender=self.scope['user'],
+            message_type=message_type,
+            content=content,
+            file_url=file_url,
+            file_name=file_name,
+            file_size=file_size
+        )
+        try:
+            return await get_write_behind().submit(message)
+        except (IntegrityError, ChatRoom.DoesNotExist):
+            return None
+    
     @database_sync_to_async
     def create_notifications(self, message):
         """Create notifications for other participants"""
-        participants = ChatParticipant.objects.filter(
-            chat_room=message.chat_room,
-            is_active=True
-        ).exclude(user=message.sender)
-        
-        notifications = []
-        for participant in participants:
-            notifications.append(
-                ChatNotification(
-                    recipient=participant.user,
-                    chat_room=message.chat_room,
-                    message=message,
-                    notification_type='message',
-                    content=f'New message from {message.sender.username}'
-                )
-            )
-        
-        if notifications:
-            ChatNotification.objects.bulk_create(notifications)
+        ChatNotification.create_for_message(message)
     
     @database_sync_to_async
-    def mark_messages_as_read(self):
+    def mark_messages_as_read(self, room_id):
         """Mark messages as read for the user"""
         try:
             participant = ChatParticipant.objects.get(
-                chat_room_id=self.room_id,
+                chat_room_id=room_id,
                 user=self.scope['user']
             )
-            participant.last_read_at = timezone.now()
-            participant.save()
+            participant.mark_read()
         except ChatParticipant.DoesNotExist:
             pass
     
-    @database_sync_to_async
-    def update_user_status(self, is_online):
-        """Update user's online status"""
-        # This would typically update a presence system
-        # For now, we'll just update the last_read_at timestamp
+    async def update_user_status(self, room_id, is_online):
+        """Update user's online status in the presence registry"""
+        registry = get_presence_registry()
+        if is_online:
+            await registry.connect(room_id, self.scope['user'])
+        else:
+            await registry.disconnect(room_id, self.scope['user'])
+
+
+class NotificationEventsMixin:
+    """Delivers user notification group events to the WebSocket"""
+    
+    async def notification_message(self, event):
+        """Send notification to WebSocket"""
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'notification': event['notification']
+        }))
+    
+    async def chat_notification(self, event):
+        """Send chat notification to WebSocket"""
+        await self.send(text_data=json.dumps({
+            'type': 'chat_notification',
+            'notification': event['notification']
+        }))
+
+
+class ChatConsumer(ChatRoomMixin, AsyncWebsocketConsumer):
+    """WebSocket consumer for real-time chat"""
+    
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.init_rooms()
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        self.room_group_name = f'chat_{self.room_id}'
+        
+        logger.info(f"WebSocket connection attempt for room {self.room_id}")
+        logger.info(f"User: {self.scope.get('user', 'No user in scope')}")
+        
+        # Check if user is authenticated
+        if not self.scope['user'].is_authenticated:
+            logger.warning(f"Unauthorized connection attempt for room {self.room_id}")
+            await self.close(code=4001)  # Custom close code for unauthorized
+            return
+        
+        # Check if user is participant of the chat room
+        is_participant = await self.is_participant(self.room_id)
+        if not is_participant:
+            logger.warning(f"User {self.scope['user'].username} is not a participant in room {self.room_id}")
+            await self.close(code=4003)  # Custom close code for not a participant
+            return
+        
+        await self.accept()
+        logger.info(f"WebSocket connection accepted for user {self.scope['user'].username} in room {self.room_id}")
+        
+        # Send connection confirmation
+        await self.send(text_data=json.dumps({
+            'type': 'connection_established',
+            'room_id': self.room_id,
+            'user': self.scope['user'].username
+        }))
+        
+        # Join room group, replaying missed messages if the client resumes
+        await self.join_room(self.room_id, since_seq=self.get_since_seq())
+    
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        await self.leave_room(self.room_id)
+    
+    async def receive(self, text_data):
+        """Handle incoming WebSocket messages"""
+        text_data_json = json.loads(text_data)
+        await self.handle_room_frame(self.room_id, text_data_json)
+    
+    def get_since_seq(self):
+        """Read the ``since_seq`` resume position from the query string"""
+        query_params = parse_qs(self.scope.get('query_string', b'').decode())
         try:
-            participant = ChatParticipant.objects.get(
-                chat_room_id=self.room_id,
-                user=self.scope['user']
-            )
-            if is_online:
-                participant.last_read_at = timezone.now()
-            participant.save()
-        except ChatParticipant.DoesNotExist:
-            pass
+            return int(query_params['since_seq'][0])
+        except (KeyError, ValueError):
+            return None
+
+
+class MultiplexConsumer(ChatRoomMixin, NotificationEventsMixin, AsyncWebsocketConsumer):
+    """
+    Single WebSocket per user for all chat rooms and notifications.
+    
+    Control frames ``{"type": "subscribe", "room_id": ..., "since_seq": ...}``
+    and ``{"type": "unsubscribe", "room_id": ...}`` manage room subscriptions.
+    Room frames (``chat_message``, ``typing``, ``read_messages``,
+    ``heartbeat``) carry the ``room_id`` they are meant for. Notification
+    events are delivered on the same connection.
+    """
+    
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.init_rooms()
+        
+        if not self.scope['user'].is_authenticated:
+            await self.close(code=4001)  # Custom close code for unauthorized
+            return
+        
+        self.user_group_name = f'notifications_{self.scope["user"].id}'
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        
+        await self.accept()
+        
+        # Send connection confirmation
+        await self.send(text_data=json.dumps({
+            'type': 'connection_established',
+            'user': self.scope['user'].username,
+            'user_id': str(self.scope['user'].id)
+        }))
+    
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        for room_id in list(self.rooms):
+            await self.leave_room(room_id)
+        
+        if hasattr(self, 'user_group_name'):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+    
+    async def receive(self, text_data):
+        """Handle incoming WebSocket messages"""
+        data = json.loads(text_data)
+        message_type = data.get('type')
+        room_id = data.get('room_id')
+        if room_id is not None:
+            room_id = str(room_id)
+        
+        if message_type == 'subscribe':
+            await self.handle_subscribe(room_id, data)
+        elif message_type == 'unsubscribe':
+            await self.leave_room(room_id)
+            await self.send(text_data=json.dumps({'type': 'unsubscribed', 'room_id': room_id}))
+        elif room_id in self.rooms:
+            await self.handle_room_frame(room_id, data)
+        else:
+            await self.send_error(room_id, 4004, 'Not subscribed to this room')
+    
+    async def handle_subscribe(self, room_id, data):
+        """Subscribe to a room, optionally resuming from ``since_seq``"""
+        if not room_id:
+            await self.send_error(room_id, 4000, 'room_id is required')
+            return
+        if room_id in self.rooms:
+            await self.send(text_data=json.dumps({'type': 'subscribed', 'room_id': room_id}))
+            return
+        if len(self.rooms) >= settings.CHAT_MULTIPLEX_MAX_ROOMS:
+            await self.send_error(room_id, 4029, 'Too many subscriptions')
+            return
+        
+        since_seq = data.get('since_seq')
+        try:
+            since_seq = int(since_seq) if since_seq is not None else None
+        except (TypeError, ValueError):
+            since_seq = None
+        
+        if not await self.is_participant(room_id):
+            await self.send_error(room_id, 4003, 'Not a participant')
+            return
+        
+        # Acknowledge first so replay frames follow the confirmation
+        await self.send(text_data=json.dumps({'type': 'subscribed', 'room_id': room_id}))
+        await self.join_room(room_id, since_seq=since_seq)
+    
+    async def send_error(self, room_id, code, detail):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'room_id': room_id,
+            'code': code,
+            'detail': detail
+        }))
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(NotificationEventsMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time notifications"""
     
     async def connect(self):
@@ -295,17 +509,3 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         """Handle incoming WebSocket messages"""
         # Notifications are typically one-way from server to client
         pass
-    
-    async def notification_message(self, event):
-        """Send notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'notification': event['notification']
-        }))
-    
-    async def chat_notification(self, event):
-        """Send chat notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_notification',
-            'notification': event['notification']
-        })) 
\ No newline at end of file
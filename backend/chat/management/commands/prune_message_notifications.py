@@ -0,0 +1,45 @@
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from chat.models import ChatNotification
+from notifications.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored 'new message' chat notifications after switching "
+        "CHAT_MESSAGE_NOTIFICATIONS to 'cursor'. Unread messages are then derived "
+        "from participants' read cursors; mention and system rows are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted')
+        parser.add_argument('--force', action='store_true', help="Run even while the mode is still 'rows'")
+
+    def handle(self, *args, **options):
+        if settings.CHAT_MESSAGE_NOTIFICATIONS != 'cursor' and not options['force']:
+            raise CommandError(
+                "CHAT_MESSAGE_NOTIFICATIONS is not 'cursor'; new messages would lose their "
+                "notifications. Switch the mode first or pass --force."
+            )
+
+        rows = ChatNotification.objects.filter(notification_type='message')
+        if options['dry_run']:
+            self.stdout.write(f"{rows.count()} message notifications would be deleted")
+            return
+
+        deleted = 0
+        while True:
+            batch = list(rows.order_by('pk').values_list('pk', 'recipient_id', 'is_read')[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                deleted += ChatNotification.objects.filter(pk__in=[pk for pk, _, _ in batch]).delete()[0]
+                # Release the unread counts of the deleted rows
+                for user_id, unread in Counter(user_id for _, user_id, is_read in batch if not is_read).items():
+                    UnreadCounter.adjust(user_id, chat_notifications=-unread)
+            self.stdout.write(f"Deleted {deleted} message notifications...")
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} message notifications"))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_message_seqs(apps, schema_editor):
+    """Number existing messages per room in creation order"""
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+
+    for room_id in ChatRoom.objects.values_list('id', flat=True).iterator():
+        messages = []
+        for seq, message in enumerate(
+            Message.objects.filter(chat_room_id=room_id).order_by('created_at', 'id').only('id').iterator(),
+            start=1
+        ):
+            message.seq = seq
+            messages.append(message)
+        Message.objects.bulk_update(messages, ['seq'], batch_size=1000)
+        ChatRoom.objects.filter(id=room_id).update(last_message_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_reply_to'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_message_seqs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'seq'), name='unique_message_seq_per_room'),
+        ),
+    ]
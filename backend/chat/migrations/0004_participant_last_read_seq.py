@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_read_seqs(apps, schema_editor):
+    """Place each participant's read cursor at the last message sent before last_read_at"""
+    ChatParticipant = apps.get_model('chat', 'ChatParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    last_read = Message.objects.filter(
+        chat_room_id=OuterRef('chat_room_id'),
+        created_at__lte=OuterRef('last_read_at'),
+        seq__isnull=False
+    ).order_by('-seq').values('seq')[:1]
+    ChatParticipant.objects.filter(last_read_at__isnull=False).update(
+        last_read_seq=Coalesce(Subquery(last_read), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='last_read_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_last_read_seqs, migrations.RunPython.noop),
+    ]
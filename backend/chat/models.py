@@ -1,6 +1,12 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from localconnect_backend.tracking import exclude_maintained_fields
+from notifications.models import UnreadCounter
+import re
 import uuid
 
 User = get_user_model()
@@ -22,6 +28,8 @@ class ChatRoom(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_chat_rooms')
     participants = models.ManyToManyField(User, through='ChatParticipant', related_name='chat_rooms')
     is_active = models.BooleanField(default=True)
+    # Sequence number of the newest message in this room
+    last_message_seq = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -31,6 +39,28 @@ class ChatRoom(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_room_type_display()})"
     
+    def save(self, *args, **kwargs):
+        # last_message_seq only moves through reserve_message_seqs
+        exclude_maintained_fields(self, kwargs, ['last_message_seq'])
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def reserve_message_seqs(cls, room_id, count=1, touch=False):
+        """
+        Reserve ``count`` consecutive message sequence numbers for a room and
+        return the first one.
+        
+        Must run inside a transaction: the room row stays locked until commit,
+        so numbers are handed out in commit order and a rollback leaves no gap.
+        With ``touch`` the room's ``updated_at`` is bumped in the same UPDATE.
+        """
+        updates = {'last_message_seq': F('last_message_seq') + count}
+        if touch:
+            updates['updated_at'] = timezone.now()
+        cls.objects.filter(pk=room_id).update(**updates)
+        last_seq = cls.objects.filter(pk=room_id).values_list('last_message_seq', flat=True).get()
+        return last_seq - count + 1
+    
     @property
     def participant_count(self):
         return self.participants.count()
@@ -54,6 +84,8 @@ class ChatParticipant(models.Model):
     role = models.CharField(max_length=20, choices=PARTICIPANT_ROLES, default='member')
     joined_at = models.DateTimeField(auto_now_add=True)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    # Sequence number of the newest message this participant has read
+    last_read_seq = models.PositiveBigIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     
     class Meta:
@@ -66,10 +98,35 @@ class ChatParticipant(models.Model):
     @property
     def unread_count(self):
         """Get count of unread messages for this participant"""
-        if not self.last_read_at:
-            return self.chat_room.messages.count()
+        return max(self.chat_room.last_message_seq - self.last_read_seq, 0)
+    
+    @classmethod
+    def active_for(cls, user):
+        """Active room participations of ``user``"""
+        return cls.objects.filter(user=user, is_active=True, chat_room__is_active=True)
+    
+    @classmethod
+    def unread_messages(cls, user):
+        """Unread messages across ``user``'s rooms, from the read cursors"""
+        return cls.active_for(user).aggregate(
+            total=Sum(F('chat_room__last_message_seq') - F('last_read_seq'))
+        )['total'] or 0
+    
+    def mark_read(self, seq=None):
+        """
+        Advance the read cursor to ``seq`` (default: the room's newest message).
         
-        return self.chat_room.messages.filter(created_at__gt=self.last_read_at).count()
+        The cursor never moves backwards, so concurrent or out-of-order read
+        receipts are safe.
+        """
+        if seq is None:
+            seq = ChatRoom.objects.filter(pk=self.chat_room_id).values_list('last_message_seq', flat=True).get()
+        self.last_read_at = timezone.now()
+        ChatParticipant.objects.filter(pk=self.pk).update(
+            last_read_at=self.last_read_at,
+            last_read_seq=Greatest(F('last_read_seq'), Value(seq))
+        )
+        self.last_read_seq = max(self.last_read_seq, seq)
 
 
 class Message(models.Model):
@@ -87,6 +144,8 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES, default='text')
     content = models.TextField()
+    # Monotonic, gapless position of the message within its chat room
+    seq = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
     file_url = models.URLField(blank=True, null=True)
     file_name = models.CharField(max_length=255, blank=True)
     file_size = models.IntegerField(null=True, blank=True)
@@ -101,10 +160,25 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['chat_room', 'created_at', 'id'], name='chat_msg_room_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['chat_room', 'seq'], name='unique_message_seq_per_room'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}..."
     
+    def save(self, *args, **kwargs):
+        """Assign the next room sequence number to new messages and touch the room"""
+        if self._state.adding and self.seq is None:
+            with transaction.atomic():
+                self.seq = ChatRoom.reserve_message_seqs(self.chat_room_id, touch=True)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+    
     def soft_delete(self):
         """Soft delete the message"""
         self.is_deleted = True
@@ -136,6 +210,10 @@ class Message(models.Model):
         return self.content
 
 
+# @username mentions (usernames may contain letters, digits and @.+-_)
+MENTION_PATTERN = re.compile(r'(?<![\w@])@([\w.@+-]*\w)')
+
+
 class ChatNotification(models.Model):
     """Model for chat notifications"""
     
@@ -160,7 +238,62 @@ class ChatNotification(models.Model):
     def __str__(self):
         return f"{self.notification_type} for {self.recipient.username}"
     
+    @classmethod
+    def create_for_message(cls, message):
+        """
+        Create notifications for a new chat message and advance the sender's
+        read cursor past it.
+        
+        Sending reads the room: messages from others that arrived before the
+        sender's own message stop counting as unread for the sender, the way
+        chat clients clear a room's badge once you post in it.
+        
+        With ``CHAT_MESSAGE_NOTIFICATIONS = 'rows'`` every other active
+        participant gets a ``'message'`` row, as before read cursors existed.
+        In ``'cursor'`` mode unread messages are derived from
+        ``ChatParticipant.last_read_seq`` and only participants @mentioned in
+        the message get a row, of type ``'mention'``.
+        """
+        if message.seq is not None:
+            ChatParticipant.objects.filter(chat_room_id=message.chat_room_id, user_id=message.sender_id).update(
+                last_read_seq=Greatest(F('last_read_seq'), Value(message.seq))
+            )
+        
+        participants = ChatParticipant.objects.filter(
+            chat_room_id=message.chat_room_id,
+            is_active=True
+        ).exclude(user_id=message.sender_id).select_related('user')
+        
+        if settings.CHAT_MESSAGE_NOTIFICATIONS == 'cursor':
+            mentions = set(MENTION_PATTERN.findall(message.content or ''))
+            if not mentions:
+                return []
+            participants = participants.filter(user__username__in=mentions)
+            notification_type = 'mention'
+            content = f'{message.sender.username} mentioned you'
+        else:
+            notification_type = 'message'
+            content = f'New message from {message.sender.username}'
+        
+        notifications = [
+            cls(
+                recipient=participant.user,
+                chat_room_id=message.chat_room_id,
+                message=message,
+                notification_type=notification_type,
+                content=content
+            )
+            for participant in participants
+        ]
+        
+        with transaction.atomic():
+            notifications = cls.objects.bulk_create(notifications)
+            UnreadCounter.adjust_many('chat_notifications', [notification.recipient_id for notification in notifications])
+        return notifications
+    
     def mark_as_read(self):
         """Mark notification as read"""
+        with transaction.atomic():
+            if ChatNotification.objects.filter(pk=self.pk, is_read=False).update(is_read=True):
+                UnreadCounter.adjust(self.recipient_id, chat_notifications=-1)
         self.is_read = True
-        self.save()
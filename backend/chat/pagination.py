@@ -0,0 +1,10 @@
+from django.conf import settings
+from localconnect_backend.pagination import KeysetPagination
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """Chat history pages, served from the (chat_room, created_at, id) index"""
+    ordering = ('created_at', 'id')
+    
+    def __init__(self):
+        self.page_size = settings.CHAT_MESSAGE_PAGE_SIZE
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import weakref
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import ChatRoom, Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBehind:
+    """
+    Per-process write-behind queue for chat messages.
+
+    Consumers submit unsaved ``Message`` instances and await the result. A
+    single flusher task drains the queue every ``flush_interval_ms`` or as soon
+    as ``max_batch_size`` messages are pending, inserts the batch with one
+    ``bulk_create`` and touches each affected ``ChatRoom.updated_at`` once.
+
+    A submitter is only resumed after its batch has committed, so a message is
+    never broadcast before it is durable. Batches are flushed one at a time in
+    submission order.
+    """
+
+    def __init__(self, flush_interval_ms=None, max_batch_size=None):
+        if flush_interval_ms is None:
+            flush_interval_ms = settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS
+        if max_batch_size is None:
+            max_batch_size = settings.CHAT_WRITE_BEHIND_MAX_BATCH_SIZE
+
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = asyncio.Queue()
+        self._flusher = None
+
+    async def submit(self, message):
+        """Queue a message for insertion and wait until it is committed"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        return await future
+
+    async def _run(self):
+        """Collect batches from the queue and flush them in order"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        """Persist a batch and resolve the waiting submitters"""
+        messages = [message for message, _ in batch]
+        try:
+            results = await database_sync_to_async(self.write_batch)(messages)
+        except Exception as e:
+            logger.exception("Chat write-behind flush failed")
+            results = [e] * len(messages)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def write_batch(messages):
+        """
+        Insert messages in one transaction, numbering them per room.
+
+        Each affected room gets one UPDATE that reserves its sequence numbers
+        and bumps ``updated_at``. If the batch fails (e.g. a room was deleted
+        meanwhile) the messages are retried one by one so only the offending
+        ones fail. Returns one entry per message: the saved instance or the
+        exception.
+        """
+        try:
+            with transaction.atomic():
+                MessageWriteBehind._insert(messages)
+            return messages
+        except (IntegrityError, ChatRoom.DoesNotExist):
+            logger.warning("Chat write-behind batch of %s rejected, retrying individually", len(messages))
+
+        results = []
+        for message in messages:
+            try:
+                with transaction.atomic():
+                    MessageWriteBehind._insert([message])
+                results.append(message)
+            except (IntegrityError, ChatRoom.DoesNotExist) as e:
+                message.seq = None
+                results.append(e)
+        return results
+
+    @staticmethod
+    def _insert(messages):
+        by_room = {}
+        for message in messages:
+            by_room.setdefault(message.chat_room_id, []).append(message)
+
+        # Lock rooms in a stable order so concurrent flushes cannot deadlock
+        for room_id in sorted(by_room, key=str):
+            room_messages = by_room[room_id]
+            first_seq = ChatRoom.reserve_message_seqs(room_id, len(room_messages), touch=True)
+            for offset, message in enumerate(room_messages):
+                message.seq = first_seq + offset
+
+        Message.objects.bulk_create(messages)
+
+
+_write_behind_queues = weakref.WeakKeyDictionary()
+
+
+def get_write_behind():
+    """Return the write-behind queue bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    queue = _write_behind_queues.get(loop)
+    if queue is None:
+        queue = _write_behind_queues[loop] = MessageWriteBehind()
+    return queue
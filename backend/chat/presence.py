@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .broadcast import group_send_frame
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPresenceBackend:
+    """
+    In-memory presence store for single-process deployments.
+
+    Keeps one ``{user_id: (expires_at, username)}`` map per room.
+    """
+    blocking = False
+
+    def __init__(self):
+        self._rooms = defaultdict(dict)
+
+    def touch(self, entries, expires_at):
+        """Mark ``(room_id, user_id, username)`` entries online until ``expires_at``"""
+        for room_id, user_id, username in entries:
+            self._rooms[room_id][user_id] = (expires_at, username)
+
+    def discard(self, room_id, user_id, username):
+        members = self._rooms.get(room_id)
+        if members is not None:
+            members.pop(user_id, None)
+            if not members:
+                del self._rooms[room_id]
+
+    def online(self, room_id, now):
+        """Return ``{user_id: expires_at}`` for users online in a room"""
+        members = self._rooms.get(room_id, {})
+        return {user_id: expires for user_id, (expires, _) in members.items() if expires > now}
+
+    def sweep(self, now):
+        """Drop expired entries and return the ``(room_id, user_id, username)`` entries removed"""
+        expired = []
+        for room_id, members in list(self._rooms.items()):
+            for user_id, (expires, username) in list(members.items()):
+                if expires <= now:
+                    expired.append((room_id, user_id, username))
+                    del members[user_id]
+            if not members:
+                del self._rooms[room_id]
+        return expired
+
+
+class RedisPresenceBackend:
+    """
+    Shared presence store for multi-process deployments.
+
+    Each room is a sorted set of ``<user_id>|<node>|<username>`` members
+    scored by expiry, so a user connected through several processes stays
+    online until the last one lets its entry lapse, and whichever process
+    sweeps an expired entry can still name the user. Reading a room is a range
+    query over live entries. Expired entries are read and removed in one
+    transaction, so each is reported by exactly one process.
+    """
+    blocking = True
+
+    def __init__(self, url=None, prefix='presence'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.prefix = prefix
+        self.node = uuid.uuid4().hex
+
+    def _room_key(self, room_id):
+        return f'{self.prefix}:room:{room_id}'
+
+    def _member(self, user_id, username):
+        return f'{user_id}|{self.node}|{username}'
+
+    @staticmethod
+    def _parse_member(member):
+        """``(user_id, username)`` of a sorted set member"""
+        user_id, _, username = member.split('|', 2)
+        return user_id, username
+
+    def touch(self, entries, expires_at):
+        pipe = self._redis.pipeline(transaction=False)
+        for room_id, user_id, username in entries:
+            pipe.zadd(self._room_key(room_id), {self._member(user_id, username): expires_at})
+            pipe.sadd(f'{self.prefix}:rooms', str(room_id))
+        pipe.execute()
+
+    def discard(self, room_id, user_id, username):
+        self._redis.zrem(self._room_key(room_id), self._member(user_id, username))
+
+    def online(self, room_id, now):
+        online = {}
+        for member, expires in self._redis.zrangebyscore(self._room_key(room_id), f'({now}', '+inf', withscores=True):
+            user_id, _ = self._parse_member(member)
+            online[user_id] = max(expires, online.get(user_id, 0))
+        return online
+
+    def sweep(self, now):
+        expired = []
+        for room_id in self._redis.smembers(f'{self.prefix}:rooms'):
+            key = self._room_key(room_id)
+            pipe = self._redis.pipeline()
+            pipe.zrangebyscore(key, '-inf', now)
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zcard(key)
+            stale, _, remaining = pipe.execute()
+            expired.extend((room_id, *self._parse_member(member)) for member in stale)
+            if not remaining:
+                self._redis.srem(f'{self.prefix}:rooms', room_id)
+        return expired
+
+
+class PresenceRegistry:
+    """
+    Tracks which users are online in each chat room.
+
+    Connections register with ``connect``/``disconnect``. Their entries are
+    kept alive by heartbeats: the process refreshes every open connection every
+    ``CHAT_PRESENCE_TTL_SECONDS / 3`` seconds and clients may send explicit
+    ``heartbeat`` frames. Entries that stop being refreshed (e.g. their process
+    died) expire after the TTL.
+
+    Joins and leaves are buffered per room and sent to the room group as one
+    ``presence`` frame every ``CHAT_PRESENCE_FLUSH_INTERVAL_MS``; a join and a
+    leave for the same user inside one window cancel out.
+    """
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = import_string(settings.CHAT_PRESENCE_BACKEND)()
+        self.backend = backend
+        self.ttl = settings.CHAT_PRESENCE_TTL_SECONDS
+        self.flush_interval = settings.CHAT_PRESENCE_FLUSH_INTERVAL_MS / 1000
+        self.refresh_interval = max(self.ttl / 3, self.flush_interval)
+        self._connections = Counter()
+        self._usernames = {}
+        self._pending = defaultdict(dict)
+        self._last_refresh = 0
+        self._flusher = None
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run())
+
+    def _mark(self, room_id, user_id, joined):
+        """Record a join/leave, cancelling an opposite change still pending"""
+        pending = self._pending[room_id]
+        if pending.get(user_id) is (not joined):
+            del pending[user_id]
+        else:
+            pending[user_id] = joined
+
+    async def connect(self, room_id, user):
+        """Register a WebSocket connection for ``user`` in ``room_id``"""
+        key = (str(room_id), str(user.id))
+        self._usernames[key[1]] = user.username
+        self._connections[key] += 1
+        await self._call(self.backend.touch, [(*key, user.username)], time.time() + self.ttl)
+        if self._connections[key] == 1:
+            self._mark(*key, joined=True)
+        self._ensure_flusher()
+
+    async def heartbeat(self, room_id, user):
+        """Refresh a connection's presence entry"""
+        await self._call(self.backend.touch, [(str(room_id), str(user.id), user.username)], time.time() + self.ttl)
+
+    async def disconnect(self, room_id, user):
+        """Unregister a WebSocket connection"""
+        key = (str(room_id), str(user.id))
+        if key not in self._connections:
+            return
+        if self._connections[key] == 1:
+            del self._connections[key]
+            await self._call(self.backend.discard, *key, self._usernames.get(key[1]))
+            self._mark(*key, joined=False)
+        else:
+            self._connections[key] -= 1
+        self._ensure_flusher()
+
+    def online_users(self, room_id):
+        """Return ``{user_id: last_seen}`` for users currently online in a room"""
+        online = self.backend.online(str(room_id), time.time())
+        return {
+            user_id: datetime.fromtimestamp(expires - self.ttl, tz=dt_timezone.utc)
+            for user_id, expires in online.items()
+        }
+
+    async def _run(self):
+        """Refresh, sweep and flush presence changes until nothing is tracked"""
+        channel_layer = get_channel_layer()
+        while self._connections or self._pending:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._tick(channel_layer)
+            except Exception:
+                logger.exception("Presence flush failed")
+
+    async def _tick(self, channel_layer):
+        now = time.time()
+        if now - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = now
+            if self._connections:
+                entries = [(room_id, user_id, self._usernames.get(user_id)) for room_id, user_id in self._connections]
+                await self._call(self.backend.touch, entries, now + self.ttl)
+            for room_id, user_id, username in await self._call(self.backend.sweep, now):
+                # The entry may belong to a connection held by another process
+                self._usernames.setdefault(str(user_id), username)
+                self._mark(str(room_id), str(user_id), joined=False)
+
+        pending, self._pending = self._pending, defaultdict(dict)
+        for room_id, changes in pending.items():
+            if not changes:
+                continue
+            left = [user_id for user_id, joined in changes.items() if not joined]
+            if left:
+                # Another process may still hold a connection for these users
+                still_online = await self._call(self.backend.online, room_id, now)
+                left = [user_id for user_id in left if user_id not in still_online]
+            joined = [user_id for user_id, is_joined in changes.items() if is_joined]
+            if not joined and not left:
+                continue
+
+            await group_send_frame(channel_layer, f'chat_{room_id}', {
+                'type': 'presence',
+                'room_id': room_id,
+                'joined': [self._describe(user_id) for user_id in joined],
+                'left': [self._describe(user_id) for user_id in left],
+            })
+
+        if pending:
+            connected = {user_id for _, user_id in self._connections}
+            self._usernames = {
+                user_id: username for user_id, username in self._usernames.items() if user_id in connected
+            }
+
+    def _describe(self, user_id):
+        return {'id': user_id, 'username': self._usernames.get(user_id)}
+
+
+_presence_registry = None
+
+
+def get_presence_registry():
+    """Return the process-wide presence registry"""
+    global _presence_registry
+    if _presence_registry is None:
+        _presence_registry = PresenceRegistry()
+    return _presence_registry
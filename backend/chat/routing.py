@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<room_id>[^/]+)/?$', consumers.ChatConsumer.as_asgi()),  # Made trailing slash optional
     re_path(r'ws/notifications/?$', consumers.NotificationConsumer.as_asgi()),  # Made trailing slash optional
+    re_path(r'ws/multiplex/?$', consumers.MultiplexConsumer.as_asgi()),  # One socket for all rooms and notifications
 ] 
\ No newline at end of file
@@ -1,6 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import ChatRoom, ChatParticipant, Message, ChatNotification
 from accounts.serializers import UserProfileSerializer as UserSerializer
+from .pagination import MessageKeysetPagination
 
 
 class ChatParticipantSerializer(serializers.ModelSerializer):
@@ -30,12 +32,12 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = [
-            'id', 'chat_room', 'sender', 'sender_id', 'message_type', 
+            'id', 'chat_room', 'seq', 'sender', 'sender_id', 'message_type', 
             'message_type_display', 'content', 'file_url', 'file_name', 
             'file_size', 'reply_to', 'is_edited', 'edited_at', 'is_deleted', 
             'deleted_at', 'created_at', 'updated_at', 'display_content'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'display_content']
+        read_only_fields = ['id', 'seq', 'created_at', 'updated_at', 'display_content']
     
     def get_reply_to(self, obj):
         """Serialize reply_to with sender information"""
@@ -151,10 +153,14 @@ class ChatNotificationSerializer(serializers.ModelSerializer):
 
 
 class ChatRoomListSerializer(serializers.ModelSerializer):
-    """Simplified serializer for chat room listings"""
-    participant_count = serializers.IntegerField(read_only=True)
+    """
+    Simplified serializer for chat room listings
+    
+    Expects rooms annotated by ``ChatRoomViewSet.annotate_room_list``.
+    """
+    participant_count = serializers.IntegerField(source='active_participant_count', read_only=True)
     last_message = serializers.SerializerMethodField()
-    unread_count = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(source='unread_messages', read_only=True)
     room_type_display = serializers.CharField(source='get_room_type_display', read_only=True)
     
     class Meta:
@@ -165,7 +171,7 @@ class ChatRoomListSerializer(serializers.ModelSerializer):
         ]
     
     def get_last_message(self, obj):
-        last_message = obj.last_message
+        last_message = obj.latest_messages[0] if obj.latest_messages else None
         if last_message:
             return {
                 'id': str(last_message.id),
@@ -174,22 +180,41 @@ class ChatRoomListSerializer(serializers.ModelSerializer):
                 'created_at': last_message.created_at
             }
         return None
-    
-    def get_unread_count(self, obj):
-        user = self.context['request'].user
-        try:
-            participant = obj.chat_participants.get(user=user)
-            return participant.unread_count
-        except ChatParticipant.DoesNotExist:
-            return 0
 
 
 class ChatRoomDetailSerializer(ChatRoomSerializer):
-    """Detailed serializer for chat room with messages"""
-    messages = MessageSerializer(many=True, read_only=True)
+    """
+    Detailed serializer for chat room with its most recent messages
+    
+    Only the newest ``CHAT_ROOM_DETAIL_MESSAGES`` are embedded; when there are
+    more, ``messages_cursor`` fetches the page before them from
+    ``messages/by_room/?room_id=<id>&before=<messages_cursor>``.
+    """
+    messages = serializers.SerializerMethodField()
+    messages_cursor = serializers.SerializerMethodField()
     
     class Meta(ChatRoomSerializer.Meta):
-        fields = ChatRoomSerializer.Meta.fields + ['messages']
+        fields = ChatRoomSerializer.Meta.fields + ['messages', 'messages_cursor']
+    
+    def get_recent_messages(self, obj):
+        if not hasattr(obj, '_recent_messages'):
+            paginator = MessageKeysetPagination()
+            messages, has_more = paginator.slice_before(
+                obj.messages.select_related('sender', 'reply_to__sender'),
+                None,
+                settings.CHAT_ROOM_DETAIL_MESSAGES
+            )
+            cursor = paginator.encode_cursor(messages[0]) if has_more else None
+            obj._recent_messages = (messages, cursor)
+        return obj._recent_messages
+    
+    def get_messages(self, obj):
+        messages, _ = self.get_recent_messages(obj)
+        return MessageSerializer(messages, many=True, context=self.context).data
+    
+    def get_messages_cursor(self, obj):
+        _, cursor = self.get_recent_messages(obj)
+        return cursor
 
 
 class OnlineUserSerializer(serializers.Serializer):
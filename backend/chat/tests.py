@@ -1,3 +1,424 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import time
+import uuid
+from io import StringIO
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from accounts.models import User
+from notifications.models import UnreadCounter
+from .models import ChatRoom, ChatParticipant, ChatNotification, Message
+from .persistence import MessageWriteBehind
+from .presence import LocalPresenceBackend, PresenceRegistry
+from .routing import websocket_urlpatterns
+from .typing_state import TypingTracker
 
-# Create your tests here.
+
+async def connect_socket(user, path):
+    """Open a WebSocket as ``user`` and consume the connection confirmation"""
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    await communicator.receive_json_from()
+    return communicator
+
+
+class ChatRoomListQueryTests(TestCase):
+    """The room list must not issue per-room queries"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='lister', password='password123')
+        self.other = User.objects.create_user(username='other', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def create_rooms(self, count):
+        for index in range(count):
+            room = ChatRoom.objects.create(name=f'Room {index}', created_by=self.user)
+            ChatParticipant.objects.create(chat_room=room, user=self.user, role='admin')
+            ChatParticipant.objects.create(chat_room=room, user=self.other)
+            for number in range(3):
+                Message.objects.create(chat_room=room, sender=self.other, content=f'Message {number}')
+    
+    def test_list_query_count_is_constant(self):
+        self.create_rooms(2)
+        # Pagination count, room page and the last message prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/chat/rooms/')
+        self.assertEqual(response.data['count'], 2)
+        
+        self.create_rooms(10)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/chat/rooms/')
+        self.assertEqual(response.data['count'], 12)
+    
+    def test_list_annotations(self):
+        self.create_rooms(1)
+        room = ChatRoom.objects.get()
+        ChatParticipant.objects.get(chat_room=room, user=self.user).mark_read(seq=1)
+        
+        response = self.client.get('/api/chat/rooms/')
+        listed = response.data['results'][0]
+        self.assertEqual(listed['participant_count'], 2)
+        self.assertEqual(listed['unread_count'], 2)
+        self.assertEqual(listed['last_message']['content'], 'Message 2')
+        self.assertEqual(listed['last_message']['sender'], 'other')
+
+
+class MessageHistoryPaginationTests(TestCase):
+    """Message history is paged by (created_at, id) cursors"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='password123')
+        self.room = ChatRoom.objects.create(name='History', created_by=self.user)
+        ChatParticipant.objects.create(chat_room=self.room, user=self.user)
+        for number in range(7):
+            Message.objects.create(chat_room=self.room, sender=self.user, content=f'Message {number}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def contents(self, response):
+        return [message['content'] for message in response.data['results']]
+    
+    def test_pages_older_and_newer(self):
+        response = self.client.get('/api/chat/messages/by_room/', {'room_id': self.room.id, 'page_size': 3})
+        self.assertEqual(self.contents(response), ['Message 4', 'Message 5', 'Message 6'])
+        self.assertIsNone(response.data['newer'])
+        
+        response = self.client.get(response.data['older'])
+        self.assertEqual(self.contents(response), ['Message 1', 'Message 2', 'Message 3'])
+        
+        oldest = self.client.get(response.data['older'])
+        self.assertEqual(self.contents(oldest), ['Message 0'])
+        self.assertIsNone(oldest.data['older'])
+        
+        newer = self.client.get(response.data['newer'])
+        self.assertEqual(self.contents(newer), ['Message 4', 'Message 5', 'Message 6'])
+        self.assertIsNone(newer.data['newer'])
+    
+    def test_invalid_cursor(self):
+        malformed = [['yesterday', str(uuid.uuid4())], ['2026-01-01T00:00:00+00:00', 'not-a-uuid'], [None, None]]
+        cursors = ['nope'] + [base64.urlsafe_b64encode(json.dumps(values).encode()).decode() for values in malformed]
+        for cursor in cursors:
+            response = self.client.get('/api/chat/messages/by_room/', {'room_id': self.room.id, 'before': cursor})
+            self.assertEqual(response.status_code, 404)
+    
+    def test_room_detail_embeds_recent_window(self):
+        with self.settings(CHAT_ROOM_DETAIL_MESSAGES=5):
+            response = self.client.get(f'/api/chat/rooms/{self.room.id}/')
+        self.assertEqual([m['content'] for m in response.data['messages']][0], 'Message 2')
+        
+        older = self.client.get('/api/chat/messages/by_room/', {
+            'room_id': self.room.id, 'before': response.data['messages_cursor']
+        })
+        self.assertEqual(self.contents(older), ['Message 0', 'Message 1'])
+
+
+class MessageSequenceTests(TestCase):
+    """Every write path numbers a room's messages 1..N"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='password123')
+        self.room = ChatRoom.objects.create(name='Sequence', created_by=self.user)
+        ChatParticipant.objects.create(chat_room=self.room, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def seqs(self):
+        return list(Message.objects.filter(chat_room=self.room).order_by('seq').values_list('seq', flat=True))
+    
+    def test_rest_create_and_reply(self):
+        for number in range(3):
+            response = self.client.post('/api/chat/messages/', {
+                'chat_room': self.room.id, 'content': f'Message {number}'
+            })
+            self.assertEqual(response.status_code, 201)
+        first = Message.objects.get(seq=1)
+        response = self.client.post(f'/api/chat/messages/{first.id}/reply/', {'content': 'Reply'})
+        self.assertEqual(response.status_code, 201)
+        
+        self.assertEqual(self.seqs(), [1, 2, 3, 4])
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message_seq, 4)
+    
+    def test_stale_room_save_keeps_sequence(self):
+        stale = ChatRoom.objects.get(pk=self.room.pk)
+        Message.objects.create(chat_room=self.room, sender=self.user, content='First')
+        stale.name = 'Renamed'
+        stale.save()
+        Message.objects.create(chat_room=self.room, sender=self.user, content='Second')
+        self.assertEqual(self.seqs(), [1, 2])
+    
+    async def test_socket_messages_and_resume(self):
+        path = f'ws/chat/{self.room.id}/'
+        communicator = await connect_socket(self.user, path)
+        for number in range(3):
+            await communicator.send_json_to({'type': 'chat_message', 'message': f'Message {number}'})
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['message']['seq'], number + 1)
+        await communicator.disconnect()
+        
+        communicator = await connect_socket(self.user, f'{path}?since_seq=1')
+        replay = await communicator.receive_json_from()
+        self.assertEqual([message['seq'] for message in replay['messages']], [2, 3])
+        complete = await communicator.receive_json_from()
+        self.assertEqual(complete['last_seq'], 3)
+        await communicator.disconnect()
+
+
+class MessageWriteBehindTests(TestCase):
+    """Queued messages are inserted in batches, in submission order"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='batcher', password='password123')
+        self.rooms = [ChatRoom.objects.create(name=f'Batch {index}', created_by=self.user) for index in range(2)]
+    
+    def message(self, room, content):
+        return Message(chat_room=room, sender=self.user, content=content)
+    
+    async def test_batches_in_submission_order(self):
+        queue = MessageWriteBehind(flush_interval_ms=50, max_batch_size=3)
+        batch_sizes = []
+        
+        def write_batch(messages):
+            batch_sizes.append(len(messages))
+            return MessageWriteBehind.write_batch(messages)
+        
+        messages = [self.message(self.rooms[index % 2], f'Message {index}') for index in range(7)]
+        with mock.patch.object(queue, 'write_batch', write_batch):
+            saved = await asyncio.gather(*(queue.submit(message) for message in messages))
+        
+        self.assertEqual(batch_sizes, [3, 3, 1])
+        self.assertEqual([message.seq for message in saved], [1, 1, 2, 2, 3, 3, 4])
+    
+    def test_rejected_batch_is_retried_per_message(self):
+        existing = Message.objects.create(chat_room=self.rooms[0], sender=self.user, content='Existing')
+        duplicate = self.message(self.rooms[0], 'Duplicate')
+        duplicate.id = existing.id
+        batch = [self.message(self.rooms[0], 'First'), duplicate, self.message(self.rooms[1], 'Second')]
+        
+        with self.assertLogs('chat.persistence', 'WARNING'):
+            results = MessageWriteBehind.write_batch(batch)
+        
+        self.assertIsInstance(results[1], IntegrityError)
+        self.assertIsNone(duplicate.seq)
+        self.assertEqual([results[0].seq, results[2].seq], [2, 1])
+        self.assertEqual(Message.objects.count(), 3)
+        # The failed insert released its sequence number
+        self.rooms[0].refresh_from_db()
+        self.assertEqual(self.rooms[0].last_message_seq, 2)
+
+
+class ChatNotificationModeTests(TestCase):
+    """Message notifications are stored rows or derived from read cursors"""
+    
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', password='password123')
+        self.ana = User.objects.create_user(username='ana', password='password123')
+        self.ben = User.objects.create_user(username='ben', password='password123')
+        self.room = ChatRoom.objects.create(name='Modes', created_by=self.sender)
+        for user in (self.sender, self.ana, self.ben):
+            ChatParticipant.objects.create(chat_room=self.room, user=user)
+    
+    def send(self, content):
+        message = Message.objects.create(chat_room=self.room, sender=self.sender, content=content)
+        return ChatNotification.create_for_message(message)
+    
+    def participant(self, user):
+        return ChatParticipant.objects.select_related('chat_room').get(chat_room=self.room, user=user)
+    
+    def test_rows_mode_stores_message_rows(self):
+        notifications = self.send('Hello @ana')
+        self.assertEqual(
+            sorted((n.recipient.username, n.notification_type) for n in notifications),
+            [('ana', 'message'), ('ben', 'message')]
+        )
+    
+    @override_settings(CHAT_MESSAGE_NOTIFICATIONS='cursor')
+    def test_cursor_mode_stores_mentions_only(self):
+        self.assertEqual(self.send('Hello'), [])
+        notifications = self.send('Hello @ana')
+        self.assertEqual([(n.recipient, n.notification_type) for n in notifications], [(self.ana, 'mention')])
+        
+        self.assertEqual(self.participant(self.ana).unread_count, 2)
+        self.assertEqual(self.participant(self.sender).unread_count, 0)
+        client = APIClient()
+        client.force_authenticate(self.ana)
+        response = client.get('/api/chat/notifications/unread_count/')
+        self.assertEqual(response.data, {'unread_count': 3, 'unread_messages': 2, 'unread_notifications': 1})
+    
+    def test_read_cursor_never_moves_back(self):
+        for number in range(3):
+            self.send(f'Message {number}')
+        participant = self.participant(self.ana)
+        participant.mark_read()
+        participant.mark_read(seq=1)
+        self.assertEqual(self.participant(self.ana).last_read_seq, 3)
+        self.assertEqual(self.participant(self.ana).unread_count, 0)
+        
+        self.send('Message 3')
+        self.assertEqual(self.participant(self.ana).unread_count, 1)
+    
+    def test_reply_notifies_others_and_reads_the_room_for_its_sender(self):
+        original = self.send('Anyone free on Saturday?')[0].message
+        self.send('I can bring tools')
+        self.assertEqual(self.participant(self.ana).unread_count, 2)
+        
+        client = APIClient()
+        client.force_authenticate(self.ana)
+        response = client.post(f'/api/chat/messages/{original.id}/reply/', {'content': 'Count me in'})
+        self.assertEqual(response.status_code, 201)
+        
+        # Replying reads the earlier messages too, and the reply itself
+        self.assertEqual(self.participant(self.ana).unread_count, 0)
+        self.assertEqual(self.participant(self.sender).unread_count, 1)
+        self.assertEqual(
+            sorted(ChatNotification.objects.filter(message_id=response.data['id']).values_list(
+                'recipient__username', flat=True
+            )),
+            ['ben', 'sender']
+        )
+    
+    def test_prune_message_notifications(self):
+        self.send('Hello')
+        with override_settings(CHAT_MESSAGE_NOTIFICATIONS='cursor'):
+            self.send('Hello @ana')
+        with self.assertRaises(CommandError):
+            call_command('prune_message_notifications', stdout=StringIO())
+        
+        with override_settings(CHAT_MESSAGE_NOTIFICATIONS='cursor'):
+            call_command('prune_message_notifications', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(ChatNotification.objects.values_list('notification_type', flat=True)), ['mention'])
+        self.assertEqual(UnreadCounter.for_user(self.ana).chat_notifications, 1)
+        self.assertEqual(UnreadCounter.for_user(self.ben).chat_notifications, 0)
+
+
+@override_settings(CHAT_PRESENCE_TTL_SECONDS=30, CHAT_PRESENCE_FLUSH_INTERVAL_MS=60000)
+class PresenceRegistryTests(TestCase):
+    """Presence changes are coalesced per room and expire without heartbeats"""
+    
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='password123')
+        self.ben = User.objects.create_user(username='ben', password='password123')
+    
+    async def listen(self):
+        """Create the registry and subscribe to the room group"""
+        self.channel_layer = get_channel_layer()
+        self.channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add('chat_lobby', self.channel)
+        self.backend = LocalPresenceBackend()
+        self.registry = PresenceRegistry(backend=self.backend)
+    
+    async def tick(self):
+        """Run one flush and return the presence frame sent to the room, if any"""
+        await self.registry._tick(self.channel_layer)
+        self.registry._flusher.cancel()
+        try:
+            event = await asyncio.wait_for(self.channel_layer.receive(self.channel), 0.1)
+        except asyncio.TimeoutError:
+            return None
+        frame = json.loads(event['text'])
+        return sorted(user['username'] for user in frame['joined']), sorted(user['username'] for user in frame['left'])
+    
+    async def test_joins_are_coalesced(self):
+        await self.listen()
+        await self.registry.connect('lobby', self.ana)
+        await self.registry.connect('lobby', self.ben)
+        self.assertEqual(await self.tick(), (['ana', 'ben'], []))
+        self.assertEqual(set(self.registry.online_users('lobby')), {str(self.ana.id), str(self.ben.id)})
+    
+    async def test_join_and_leave_in_one_window_cancel_out(self):
+        await self.listen()
+        await self.registry.connect('lobby', self.ana)
+        await self.registry.disconnect('lobby', self.ana)
+        self.assertIsNone(await self.tick())
+        self.assertEqual(self.registry.online_users('lobby'), {})
+    
+    async def test_user_stays_online_until_last_connection_closes(self):
+        await self.listen()
+        await self.registry.connect('lobby', self.ana)
+        await self.registry.connect('lobby', self.ana)
+        await self.tick()
+        await self.registry.disconnect('lobby', self.ana)
+        self.assertIsNone(await self.tick())
+        await self.registry.disconnect('lobby', self.ana)
+        self.assertEqual(await self.tick(), ([], ['ana']))
+    
+    async def test_entries_without_heartbeats_expire(self):
+        await self.listen()
+        await self.registry.connect('lobby', self.ana)
+        await self.tick()
+        # Another process held ben's connection and died without a leave
+        self.backend.touch([('lobby', str(self.ben.id), 'ben')], time.time() - 1)
+        self.registry._last_refresh = 0
+        self.assertEqual(await self.tick(), ([], ['ben']))
+        self.assertEqual(set(self.registry.online_users('lobby')), {str(self.ana.id)})
+
+
+class TypingTrackerTests(TestCase):
+    """Typing indicators are deduplicated, throttled and expired on the server"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='typist', password='password123')
+        self.tracker = TypingTracker(min_interval_ms=1000, timeout_seconds=5)
+    
+    def test_repeated_frames_are_dropped(self):
+        self.assertTrue(self.tracker.observe('lobby', 'ana', True, now=0))
+        self.assertFalse(self.tracker.observe('lobby', 'ana', True, now=2))
+        self.assertTrue(self.tracker.observe('lobby', 'ana', False, now=3))
+        self.assertFalse(self.tracker.observe('lobby', 'ana', False, now=4))
+    
+    def test_changes_inside_the_interval_are_deferred(self):
+        self.assertTrue(self.tracker.observe('lobby', 'ana', True, now=0))
+        self.assertFalse(self.tracker.observe('lobby', 'ana', False, now=0.2))
+        self.assertEqual(self.tracker.due(now=0.5), [])
+        self.assertEqual(self.tracker.due(now=1), [('lobby', 'ana', False)])
+        self.assertFalse(self.tracker.is_typing('lobby', 'ana'))
+    
+    def test_reverted_change_is_never_sent(self):
+        self.assertTrue(self.tracker.observe('lobby', 'ana', True, now=0))
+        self.assertFalse(self.tracker.observe('lobby', 'ana', False, now=0.2))
+        self.assertFalse(self.tracker.observe('lobby', 'ana', True, now=0.4))
+        self.assertEqual(self.tracker.due(now=1), [])
+        self.assertTrue(self.tracker.is_typing('lobby', 'ana'))
+    
+    def test_typing_expires_without_new_frames(self):
+        self.assertTrue(self.tracker.observe('lobby', 'ana', True, now=0))
+        self.assertTrue(self.tracker.observe('lobby', 'ben', True, now=0))
+        self.assertFalse(self.tracker.observe('lobby', 'ben', True, now=4))
+        self.assertEqual(self.tracker.due(now=5), [('lobby', 'ana', False)])
+        self.assertEqual(self.tracker.due(now=9), [('lobby', 'ben', False)])
+        self.assertEqual(self.tracker.due(now=11), [])
+        self.assertEqual(self.tracker._states, {})
+    
+    async def test_disconnect_without_typing_sends_nothing(self):
+        room = await database_sync_to_async(ChatRoom.objects.create)(name='Quiet', created_by=self.user)
+        await database_sync_to_async(ChatParticipant.objects.create)(chat_room=room, user=self.user)
+        communicator = await connect_socket(self.user, f'ws/chat/{room.id}/')
+        with mock.patch('chat.consumers.get_typing_tracker', return_value=self.tracker):
+            with mock.patch.object(self.tracker, 'observe', wraps=self.tracker.observe) as observe:
+                await communicator.disconnect()
+        observe.assert_not_called()
+    
+    async def test_ticker_frames_carry_room_id(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add('chat_lobby', channel)
+        tracker = TypingTracker(min_interval_ms=10, timeout_seconds=0.05)
+        
+        self.assertTrue(tracker.observe('lobby', 'ana', True))
+        tracker.ensure_ticker()
+        # The expiry stop event comes from the ticker
+        event = await channel_layer.receive(channel)
+        self.assertEqual(json.loads(event['text']), {
+            'type': 'typing', 'room_id': 'lobby', 'user': 'ana', 'is_typing': False
+        })
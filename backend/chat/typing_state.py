@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from localconnect_backend import metrics
+from .broadcast import group_send_frame
+
+logger = logging.getLogger(__name__)
+
+
+class TypingState:
+    """Typing state of one user in one room"""
+    __slots__ = ('announced', 'pending', 'last_emit', 'expires_at')
+
+    def __init__(self):
+        self.announced = False   # state last sent to the room
+        self.pending = None      # state change waiting for the interval to pass
+        self.last_emit = float('-inf')
+        self.expires_at = None
+
+
+class TypingTracker:
+    """
+    Server-side typing indicator state machine.
+
+    - Repeated frames with the same ``is_typing`` value are dropped.
+    - At most one event per user per room is sent every
+      ``CHAT_TYPING_MIN_INTERVAL_MS``; a change arriving sooner is deferred and
+      sent when the interval has passed (or dropped if it is reverted first).
+    - Typing expires after ``CHAT_TYPING_TIMEOUT_SECONDS`` without a new
+      ``is_typing: true`` frame, and a stop event is sent for the client.
+
+    Counters ``chat.typing.received``, ``.emitted``, ``.deferred``,
+    ``.suppressed`` (frames that never produced an event) and ``.expired`` are
+    recorded in ``localconnect_backend.metrics``.
+    """
+
+    def __init__(self, min_interval_ms=None, timeout_seconds=None):
+        if min_interval_ms is None:
+            min_interval_ms = settings.CHAT_TYPING_MIN_INTERVAL_MS
+        if timeout_seconds is None:
+            timeout_seconds = settings.CHAT_TYPING_TIMEOUT_SECONDS
+
+        self.min_interval = min_interval_ms / 1000
+        self.timeout = timeout_seconds
+        self._states = {}
+        self._ticker = None
+
+    def observe(self, room_id, user, is_typing, now=None):
+        """
+        Record a typing frame from ``user`` and return True if it should be
+        broadcast right away.
+        """
+        now = time.monotonic() if now is None else now
+        metrics.incr('chat.typing.received')
+        key = (room_id, user)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = TypingState()
+
+        if is_typing:
+            state.expires_at = now + self.timeout
+
+        current = state.announced if state.pending is None else state.pending
+        if is_typing == current:
+            metrics.incr('chat.typing.suppressed')
+            return False
+
+        if is_typing == state.announced:
+            # Reverts a deferred change, so neither frame is ever sent
+            state.pending = None
+            metrics.incr('chat.typing.suppressed', 2)
+            return False
+
+        if now - state.last_emit >= self.min_interval:
+            self._announce(state, is_typing, now)
+            return True
+
+        state.pending = is_typing
+        metrics.incr('chat.typing.deferred')
+        return False
+
+    def is_typing(self, room_id, user):
+        """Whether ``user`` is typing in ``room_id``, counting a deferred change"""
+        state = self._states.get((room_id, user))
+        if state is None:
+            return False
+        return state.announced if state.pending is None else state.pending
+
+    def due(self, now=None):
+        """Return ``(room_id, user, is_typing)`` events that are now due"""
+        now = time.monotonic() if now is None else now
+        events = []
+        for key, state in list(self._states.items()):
+            typing = state.announced if state.pending is None else state.pending
+            if typing and state.expires_at is not None and state.expires_at <= now:
+                metrics.incr('chat.typing.expired')
+                state.pending = None
+                if state.announced:
+                    self._announce(state, False, now)
+                    events.append((*key, False))
+            elif state.pending is not None and now - state.last_emit >= self.min_interval:
+                self._announce(state, state.pending, now)
+                events.append((*key, state.announced))
+
+            idle = not state.announced and state.pending is None
+            if idle and now - state.last_emit >= self.min_interval:
+                del self._states[key]
+        return events
+
+    def _announce(self, state, is_typing, now):
+        state.announced = is_typing
+        state.pending = None
+        state.last_emit = now
+        if not is_typing:
+            state.expires_at = None
+        metrics.incr('chat.typing.emitted')
+
+    def ensure_ticker(self):
+        """Start the task that sends deferred and expired typing events"""
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        tick = min(self.min_interval, self.timeout) / 2
+        while self._states:
+            await asyncio.sleep(tick)
+            for room_id, user, is_typing in self.due():
+                try:
+                    await group_send_frame(channel_layer, f'chat_{room_id}', {
+                        'type': 'typing',
+                        'room_id': room_id,
+                        'user': user,
+                        'is_typing': is_typing
+                    })
+                except Exception:
+                    logger.exception("Failed to send typing event")
+
+
+_typing_tracker = None
+
+
+def get_typing_tracker():
+    """Return the process-wide typing tracker"""
+    global _typing_tracker
+    if _typing_tracker is None:
+        _typing_tracker = TypingTracker()
+    return _typing_tracker
@@ -2,8 +2,13 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count
+from django.conf import settings
+from django.db.models import Q, Count, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.db import transaction
 from django.utils import timezone
+from notifications.models import UnreadCounter
+
 from .models import ChatRoom, ChatParticipant, Message, ChatNotification
 from .serializers import (
     ChatRoomSerializer, ChatRoomCreateSerializer, ChatRoomListSerializer, ChatRoomDetailSerializer,
@@ -11,7 +16,9 @@ from .serializers import (
     ChatParticipantSerializer, ChatNotificationSerializer, OnlineUserSerializer
 )
 from accounts.permissions import IsOwnerOrAdmin
+from .pagination import MessageKeysetPagination
 from .permissions import IsParticipantOrReadOnly
+from .presence import get_presence_registry
 
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
@@ -31,11 +38,41 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Return chat rooms where user is a participant"""
         user = self.request.user
-        return ChatRoom.objects.filter(
+        queryset = ChatRoom.objects.filter(
             is_active=True,
             chat_participants__user=user,
             chat_participants__is_active=True
         ).distinct()
+        if self.action == 'list':
+            queryset = self.annotate_room_list(queryset, user)
+        return queryset
+    
+    @staticmethod
+    def annotate_room_list(queryset, user):
+        """
+        Annotate the fields shown in room listings so a page of rooms is
+        loaded with a fixed number of queries: participant count and the
+        user's unread count as subqueries, and the last message (looked up by
+        the room's last_message_seq) in a single prefetch.
+        """
+        active_participants = ChatParticipant.objects.filter(
+            chat_room=OuterRef('pk'),
+            is_active=True
+        ).order_by().values('chat_room').annotate(count=Count('pk')).values('count')
+        last_read_seq = ChatParticipant.objects.filter(
+            chat_room=OuterRef('pk'),
+            user=user
+        ).values('last_read_seq')[:1]
+        last_messages = Message.objects.filter(
+            seq=F('chat_room__last_message_seq')
+        ).select_related('sender')
+        
+        return queryset.annotate(
+            active_participant_count=Coalesce(Subquery(active_participants), 0),
+            unread_messages=F('last_message_seq') - Coalesce(Subquery(last_read_seq), F('last_message_seq'))
+        ).prefetch_related(
+            Prefetch('messages', queryset=last_messages, to_attr='latest_messages')
+        )
     
     def perform_create(self, serializer):
         """Create chat room and add creator as participant"""
@@ -93,16 +130,18 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     def online_users(self, request, pk=None):
         """Get online users in a chat room"""
         chat_room = self.get_object()
-        # This would typically integrate with a presence system
-        # For now, return all active participants
-        participants = chat_room.chat_participants.filter(is_active=True)
+        online = get_presence_registry().online_users(chat_room.id)
+        participants = chat_room.chat_participants.filter(
+            is_active=True,
+            user_id__in=online.keys()
+        ).select_related('user')
         online_users = []
         
         for participant in participants:
             online_users.append({
                 'user': participant.user,
-                'is_online': True,  # Placeholder
-                'last_seen': participant.last_read_at or participant.joined_at
+                'is_online': True,
+                'last_seen': online[str(participant.user_id)]
             })
         
         serializer = OnlineUserSerializer(online_users, many=True)
@@ -116,8 +155,7 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         
         try:
             participant = ChatParticipant.objects.get(chat_room=chat_room, user=user)
-            participant.last_read_at = timezone.now()
-            participant.save()
+            participant.mark_read()
             return Response({'detail': 'Marked as read'}, status=status.HTTP_200_OK)
         except ChatParticipant.DoesNotExist:
             return Response({'detail': 'Not a participant'}, status=status.HTTP_400_BAD_REQUEST)
@@ -186,24 +224,11 @@ class MessageViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """Create message and update chat room"""
+        # Saving the message also bumps the chat room's updated_at
         message = serializer.save(sender=self.request.user)
         
-        # Update chat room's updated_at timestamp
-        message.chat_room.save()
-        
         # Create notifications for other participants
-        participants = message.chat_room.chat_participants.filter(
-            is_active=True
-        ).exclude(user=self.request.user)
-        
-        for participant in participants:
-            ChatNotification.objects.create(
-                recipient=participant.user,
-                chat_room=message.chat_room,
-                message=message,
-                notification_type='message',
-                content=f'New message from {self.request.user.username}'
-            )
+        ChatNotification.create_for_message(message)
     
     def perform_destroy(self, instance):
         """Soft delete message"""
@@ -235,7 +260,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         if not content:
             return Response({'detail': 'Content is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create reply message
+        # Create reply message; this also bumps the chat room's updated_at
         reply_message = Message.objects.create(
             chat_room=original_message.chat_room,
             sender=request.user,
@@ -243,9 +268,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             message_type='text',
             reply_to=original_message
         )
-        
-        # Update chat room's updated_at timestamp
-        reply_message.chat_room.save()
+        ChatNotification.create_for_message(reply_message)
         
         serializer = self.get_serializer(reply_message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -261,10 +284,13 @@ class MessageViewSet(viewsets.ModelViewSet):
         messages = Message.objects.filter(
             chat_room_id=room_id,
             is_deleted=False
-        ).select_related('sender', 'chat_room').order_by('created_at')
+        ).select_related('sender', 'chat_room', 'reply_to__sender')
         
-        serializer = self.get_serializer(messages, many=True)
-        return Response(serializer.data)
+        # Page by (created_at, id) keyset: ?before=<cursor> for older, ?after=<cursor> for newer
+        paginator = MessageKeysetPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ChatParticipantViewSet(viewsets.ModelViewSet):
@@ -316,9 +342,13 @@ class ChatNotificationViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return notifications for the current user"""
-        return ChatNotification.objects.filter(recipient=self.request.user).select_related(
+        queryset = ChatNotification.objects.filter(recipient=self.request.user).select_related(
             'chat_room', 'message', 'recipient'
         )
+        if settings.CHAT_MESSAGE_NOTIFICATIONS == 'cursor':
+            # New messages are tracked by read cursors; leftover rows are ignored
+            queryset = queryset.exclude(notification_type='message')
+        return queryset
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
@@ -330,12 +360,37 @@ class ChatNotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
         """Mark all notifications as read"""
-        notifications = self.get_queryset().filter(is_read=False)
-        notifications.update(is_read=True)
+        with transaction.atomic():
+            updated_count = self.get_queryset().filter(is_read=False).update(is_read=True)
+            UnreadCounter.adjust(request.user.pk, chat_notifications=-updated_count)
+        if settings.CHAT_MESSAGE_NOTIFICATIONS == 'cursor':
+            self.get_participations().update(
+                last_read_at=timezone.now(),
+                last_read_seq=Subquery(
+                    ChatRoom.objects.filter(pk=OuterRef('chat_room_id')).values('last_message_seq')[:1]
+                )
+            )
         return Response({'detail': 'All notifications marked as read'}, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Get count of unread notifications"""
-        count = self.get_queryset().filter(is_read=False).count()
-        return Response({'unread_count': count}, status=status.HTTP_200_OK)
+        """
+        Get count of unread notifications (from the user's UnreadCounter)
+        
+        In 'cursor' mode the counter also includes leftover 'message' rows
+        until prune_message_notifications has run.
+        """
+        count = UnreadCounter.for_user(request.user).chat_notifications
+        if settings.CHAT_MESSAGE_NOTIFICATIONS != 'cursor':
+            return Response({'unread_count': count}, status=status.HTTP_200_OK)
+        
+        unread_messages = ChatParticipant.unread_messages(request.user)
+        return Response({
+            'unread_count': count + unread_messages,
+            'unread_messages': unread_messages,
+            'unread_notifications': count
+        }, status=status.HTTP_200_OK)
+    
+    def get_participations(self):
+        """Active room participations of the current user"""
+        return ChatParticipant.active_for(self.request.user)
@@ -13,6 +13,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from localconnect_backend.middleware import JWTAuthMiddlewareStack
 from chat.routing import websocket_urlpatterns
+from posts.suggestions import warm
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
 
@@ -24,3 +25,5 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+warm()
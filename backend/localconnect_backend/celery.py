@@ -0,0 +1,15 @@
+"""
+Celery application for background and periodic tasks
+
+Worker: celery -A localconnect_backend worker -l info
+Beat:   celery -A localconnect_backend beat -l info (schedule in CELERY_BEAT_SCHEDULE)
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
+
+app = Celery('localconnect_backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,68 @@
+"""
+Conditional GET (ETag / Last-Modified)
+
+Validators are derived from aggregates over the rows behind a response: the
+latest ``updated_at``, the row count and any extra aggregates that catch
+changes ``updated_at`` misses (e.g. counters maintained with ``UPDATE``).
+Writes that should invalidate clients must therefore touch ``updated_at``,
+or be covered by the count or an extra aggregate (only the ETag sees hard
+deletes; it takes precedence when a client sends both validators).
+Validators are checked before the response is built, so an unchanged
+resource is answered with 304 Not Modified without serializing anything.
+
+ETags are weak (``W/"..."``) and include the requesting user, because bodies
+carry per-user fields.
+"""
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def aggregate_validators(queryset, field='updated_at', **extra):
+    """
+    Return ``(fingerprint, last_modified)`` for the rows of ``queryset``;
+    ``extra`` aggregates are folded into the fingerprint
+    """
+    values = queryset.order_by().aggregate(last_modified=Max(field), count=Count('pk'), **extra)
+    fingerprint = repr(sorted((name, str(value)) for name, value in values.items()))
+    return fingerprint, values['last_modified']
+
+
+def combine_validators(*validators):
+    """Validators for a response built from several sets of rows"""
+    fingerprint = '|'.join(fingerprint for fingerprint, _ in validators)
+    timestamps = [last_modified for _, last_modified in validators if last_modified]
+    return fingerprint, max(timestamps) if timestamps else None
+
+
+def make_etag(request, validators):
+    fingerprint, _ = validators
+    signature = f'{request.user.pk}:{fingerprint}'
+    return 'W/"%s"' % hashlib.sha256(signature.encode()).hexdigest()[:32]
+
+
+def check_preconditions(request, validators):
+    """
+    Return 304 Not Modified if the client's copy is current (or 412 for a
+    failed If-Match), else None
+    """
+    _, last_modified = validators
+    response = get_conditional_response(
+        request._request,
+        etag=make_etag(request, validators),
+        last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+    if response is not None:
+        set_validators(response, request, validators)
+    return response
+
+
+def set_validators(response, request, validators):
+    """Add ETag and Last-Modified headers to a response"""
+    _, last_modified = validators
+    response['ETag'] = make_etag(request, validators)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,71 @@
+"""
+Lightweight in-process metrics
+
+Counters are recorded with ``incr`` and timings/sizes with ``observe``. Every
+sample is also passed to the callable named by the ``METRICS_HOOK`` setting
+(``hook(name, value)``), e.g. to forward it to StatsD or Prometheus.
+"""
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_observations = {}
+_hook = None
+_hook_loaded = False
+
+
+def _get_hook():
+    global _hook, _hook_loaded
+    if not _hook_loaded:
+        hook_path = getattr(settings, 'METRICS_HOOK', None)
+        _hook = import_string(hook_path) if hook_path else None
+        _hook_loaded = True
+    return _hook
+
+
+def _emit(name, value):
+    hook = _get_hook()
+    if hook is None:
+        return
+    try:
+        hook(name, value)
+    except Exception:
+        logger.exception(f"Metrics hook failed for {name}")
+
+
+def incr(name, value=1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] += value
+    _emit(name, value)
+
+
+def observe(name, value):
+    """Record a timing or size sample (count, total and max are kept)"""
+    with _lock:
+        stats = _observations.setdefault(name, {'count': 0, 'total': 0, 'max': 0})
+        stats['count'] += 1
+        stats['total'] += value
+        stats['max'] = max(stats['max'], value)
+    _emit(name, value)
+
+
+def snapshot(prefix=''):
+    """Return current counters and observations, optionally filtered by prefix"""
+    with _lock:
+        counters = {name: value for name, value in _counters.items() if name.startswith(prefix)}
+        observations = {name: dict(stats) for name, stats in _observations.items() if name.startswith(prefix)}
+    return {'counters': counters, 'observations': observations}
+
+
+def reset():
+    """Clear all recorded metrics"""
+    with _lock:
+        _counters.clear()
+        _observations.clear()
@@ -23,6 +23,7 @@ from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from urllib.parse import parse_qs
 import jwt
+from accounts.cache import get_cached_user
 
 User = get_user_model()
 
@@ -84,7 +85,10 @@ class JWTAuthMiddleware(BaseMiddleware):
             # Decode and verify the token
             access_token = AccessToken(token)
             user_id = access_token['user_id']
-            user = User.objects.get(id=user_id)
+            user = get_cached_user(user_id)
+            if not user.is_active:
+                logger.warning("WebSocket middleware - User from token is inactive")
+                return AnonymousUser()
             logger.info(f"WebSocket middleware - Token valid for user: {user.username}")
             return user
         except (InvalidToken, TokenError) as e:
@@ -0,0 +1,217 @@
+"""
+Keyset (cursor) pagination
+
+Pages are selected with a WHERE clause on the ordering columns instead of an
+OFFSET, so fetching a page deep in a large table costs the same as fetching
+the first one when an index covers the ordering.
+
+``KeysetPagination`` serves chat history (oldest first, ``older``/``newer``
+links); ``FeedKeysetPagination`` serves feeds in their own order with
+``next``/``previous`` links.
+"""
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset by a unique ordering such as ``('created_at', 'id')``
+    (fields may be prefixed with ``-`` for descending order).
+
+    Without a cursor the newest page is returned. ``?before=<cursor>`` returns
+    the page just older than the cursor and ``?after=<cursor>`` the page just
+    newer. Results are always in ascending order, and the response links the
+    neighbouring pages as ``older`` and ``newer`` (null when there are none).
+
+    Cursor values are parsed with the ordering fields, so a malformed cursor
+    is answered with 404 before the query is built.
+    """
+    ordering = ('created_at', 'id')
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    before_query_param = 'before'
+    after_query_param = 'after'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = self.get_fields(queryset)
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+
+        if after is not None:
+            results, has_more = self.slice_after(queryset, after, page_size)
+            self.older_cursor = self.encode_cursor(results[0]) if results else None
+            self.newer_cursor = self.encode_cursor(results[-1]) if has_more else None
+        else:
+            results, has_more = self.slice_before(queryset, before, page_size)
+            self.older_cursor = self.encode_cursor(results[0]) if has_more else None
+            self.newer_cursor = self.encode_cursor(results[-1]) if before is not None and results else None
+        return results
+
+    def slice_before(self, queryset, position, size):
+        """Return up to ``size`` items preceding ``position`` (or the newest) and whether more exist"""
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, 'lt'))
+        reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        items = list(queryset.order_by(*reverse)[:size + 1])
+        has_more = len(items) > size
+        return items[:size][::-1], has_more
+
+    def slice_after(self, queryset, position, size):
+        """Return up to ``size`` items following ``position`` (or the first) and whether more exist"""
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, 'gt'))
+        items = list(queryset.order_by(*self.ordering)[:size + 1])
+        return items[:size], len(items) > size
+
+    def keyset_filter(self, position, lookup):
+        """
+        Items before (``lt``) or after (``gt``) ``position`` in the ordering:
+        ``(f1, f2, ...) < (v1, v2, ...)`` expanded into a Q object, with the
+        comparison flipped for descending fields
+        """
+        flipped = {'lt': 'gt', 'gt': 'lt'}
+        fields = [field.lstrip('-') for field in self.ordering]
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            field_lookup = flipped[lookup] if field.startswith('-') else lookup
+            term = Q(**{f'{fields[index]}__{field_lookup}': position[index]})
+            for previous in range(index):
+                term &= Q(**{fields[previous]: position[previous]})
+            condition |= term
+        return condition
+
+    def get_fields(self, queryset):
+        """The model fields or annotations of the ordering, used to parse cursor values"""
+        return [self.resolve_field(queryset, field.lstrip('-')) for field in self.ordering]
+
+    def resolve_field(self, queryset, name):
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return queryset.query.annotations[name].output_field
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance):
+        return self.dump_cursor(self.cursor_values(instance))
+
+    def cursor_values(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return values
+
+    def dump_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def load_cursor(self, cursor):
+        """The JSON list inside a cursor"""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def parse_values(self, values):
+        """Convert raw cursor values with ``self.fields``"""
+        if len(values) != len(self.fields) or None in values:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        return self.parse_values(self.load_cursor(cursor))
+
+    def get_link(self, query_param, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'older': self.get_link(self.before_query_param, self.older_cursor),
+            'newer': self.get_link(self.after_query_param, self.newer_cursor),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'older': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'newer': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class FeedKeysetPagination(KeysetPagination):
+    """
+    Keyset pages in the order of ``ordering`` (e.g. newest first for
+    ``('-created_at', '-id')``), for feeds read from the top
+
+    Without a cursor the first page is returned. ``next`` links the
+    following page and ``previous`` the preceding one (null when there are
+    none). No COUNT query is run.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = self.get_fields(queryset)
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+
+        if before is not None:
+            results, has_more = self.slice_before(queryset, before, page_size)
+            self.previous_cursor = self.encode_cursor(results[0]) if has_more else None
+            self.next_cursor = self.encode_cursor(results[-1]) if results else None
+        else:
+            results, has_more = self.slice_after(queryset, after, page_size)
+            self.previous_cursor = self.encode_cursor(results[0]) if after is not None and results else None
+            self.next_cursor = self.encode_cursor(results[-1]) if has_more else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.after_query_param, self.next_cursor),
+            'previous': self.get_link(self.before_query_param, self.previous_cursor),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
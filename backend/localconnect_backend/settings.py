@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -112,6 +113,96 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat WebSocket Settings
+# Group broadcasts are JSON-encoded once per message; set to True to send them as binary frames
+CHAT_BROADCAST_BINARY_FRAMES = os.getenv('CHAT_BROADCAST_BINARY_FRAMES', 'False') == 'True'
+
+# Batch chat message inserts per process (flush every N ms or every M messages)
+CHAT_WRITE_BEHIND_ENABLED = os.getenv('CHAT_WRITE_BEHIND_ENABLED', 'False') == 'True'
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS', '20'))
+CHAT_WRITE_BEHIND_MAX_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_MAX_BATCH_SIZE', '100'))
+
+# Reconnect resume: clients pass ?since_seq=N and get missed messages replayed in pages
+CHAT_RESUME_PAGE_SIZE = int(os.getenv('CHAT_RESUME_PAGE_SIZE', '100'))
+CHAT_RESUME_MAX_MESSAGES = int(os.getenv('CHAT_RESUME_MAX_MESSAGES', '1000'))
+
+# Message history pages (keyset on created_at, id) and the recent window embedded in room detail
+CHAT_MESSAGE_PAGE_SIZE = int(os.getenv('CHAT_MESSAGE_PAGE_SIZE', '50'))
+CHAT_ROOM_DETAIL_MESSAGES = int(os.getenv('CHAT_ROOM_DETAIL_MESSAGES', '50'))
+
+# Maximum rooms a single multiplexed connection (ws/multiplex/) may subscribe to
+CHAT_MULTIPLEX_MAX_ROOMS = int(os.getenv('CHAT_MULTIPLEX_MAX_ROOMS', '200'))
+
+# New-message notifications: 'rows' stores a ChatNotification per recipient, 'cursor' derives
+# unread counts from each participant's read position and only stores rows for mentions
+CHAT_MESSAGE_NOTIFICATIONS = os.getenv('CHAT_MESSAGE_NOTIFICATIONS', 'rows')
+
+# Presence registry: use chat.presence.RedisPresenceBackend when running more than one process
+CHAT_PRESENCE_BACKEND = os.getenv('CHAT_PRESENCE_BACKEND', 'chat.presence.LocalPresenceBackend')
+CHAT_PRESENCE_TTL_SECONDS = int(os.getenv('CHAT_PRESENCE_TTL_SECONDS', '60'))
+CHAT_PRESENCE_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_PRESENCE_FLUSH_INTERVAL_MS', '1000'))
+
+# Typing indicators: at most one event per user per interval, expire without a stop frame
+CHAT_TYPING_MIN_INTERVAL_MS = int(os.getenv('CHAT_TYPING_MIN_INTERVAL_MS', '1000'))
+CHAT_TYPING_TIMEOUT_SECONDS = int(os.getenv('CHAT_TYPING_TIMEOUT_SECONDS', '5'))
+
+# Redis
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Caches: 'default' is local to each process, 'shared' is visible to every worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', REDIS_URL),
+    },
+}
+
+# Notification outbox (notifications.outbox): dispatch in the request process after commit
+# (development) or in Celery workers, polled every NOTIFICATIONS_OUTBOX_POLL_SECONDS
+NOTIFICATIONS_OUTBOX_INLINE = os.getenv('NOTIFICATIONS_OUTBOX_INLINE', str(DEBUG)) == 'True'
+NOTIFICATIONS_OUTBOX_BATCH_SIZE = int(os.getenv('NOTIFICATIONS_OUTBOX_BATCH_SIZE', '500'))
+NOTIFICATIONS_OUTBOX_POLL_SECONDS = float(os.getenv('NOTIFICATIONS_OUTBOX_POLL_SECONDS', '10'))
+# Comments on one post (or replies to one comment) within this window share a notification; 0 disables
+NOTIFICATIONS_AGGREGATION_WINDOW_SECONDS = int(os.getenv('NOTIFICATIONS_AGGREGATION_WINDOW_SECONDS', '3600'))
+
+# Notification retention (notifications.retention): days kept per type ('*' for the other types,
+# None keeps them), read notifications kept per user, and the pace of the batched deletes
+NOTIFICATIONS_RETENTION_DAYS = {
+    '*': int(os.getenv('NOTIFICATIONS_RETENTION_DAYS', '180')),
+    'SYSTEM': 30,
+    'POST_STATUS': 90,
+}
+CHAT_NOTIFICATIONS_RETENTION_DAYS = {
+    '*': int(os.getenv('CHAT_NOTIFICATIONS_RETENTION_DAYS', '30')),
+    'mention': 90,
+}
+NOTIFICATIONS_MAX_READ_PER_USER = int(os.getenv('NOTIFICATIONS_MAX_READ_PER_USER', '500'))
+NOTIFICATIONS_RETENTION_BATCH_SIZE = int(os.getenv('NOTIFICATIONS_RETENTION_BATCH_SIZE', '1000'))
+NOTIFICATIONS_RETENTION_PAUSE_SECONDS = float(os.getenv('NOTIFICATIONS_RETENTION_PAUSE_SECONDS', '0.2'))
+
+# Celery (localconnect_backend/celery.py)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
+CELERY_BEAT_SCHEDULE = {
+    # Correct any drift in the post statistics rollups
+    'reconcile-post-rollups': {
+        'task': 'posts.tasks.reconcile_post_rollups',
+        'schedule': crontab(minute=15, hour=3),
+    },
+    # Purge notifications past their retention
+    'apply-notification-retention': {
+        'task': 'notifications.tasks.apply_notification_retention',
+        'schedule': crontab(minute=45, hour=3),
+    },
+    # Deliver notifications whose dispatch could not be queued
+    'dispatch-notification-outbox': {
+        'task': 'notifications.tasks.dispatch_notification_outbox',
+        'schedule': NOTIFICATIONS_OUTBOX_POLL_SECONDS,
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -180,7 +271,7 @@ AUTH_USER_MODEL = 'accounts.User'
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -229,6 +320,36 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=7),
 }
 
+# Comment threads: levels of replies nested below top-level comments, and replies shown per
+# comment; the rest are fetched with the more_replies cursor
+COMMENT_TREE_MAX_DEPTH = int(os.getenv('COMMENT_TREE_MAX_DEPTH', '5'))
+COMMENT_TREE_MAX_REPLIES = int(os.getenv('COMMENT_TREE_MAX_REPLIES', '20'))
+
+# Post search: dotted path to a posts.search backend; empty picks full-text search on PostgreSQL
+# and the in-process inverted index elsewhere
+POSTS_SEARCH_BACKEND = os.getenv('POSTS_SEARCH_BACKEND', '')
+
+# Search suggestions: in-memory prefix index, built when the server starts and rebuilt in the
+# background after POSTS_SUGGESTIONS_REFRESH_SECONDS; recency weight halves every HALF_LIFE_DAYS
+POSTS_SUGGESTIONS_WARM_ON_STARTUP = os.getenv('POSTS_SUGGESTIONS_WARM_ON_STARTUP', 'True') == 'True'
+POSTS_SUGGESTIONS_REFRESH_SECONDS = int(os.getenv('POSTS_SUGGESTIONS_REFRESH_SECONDS', '300'))
+POSTS_SUGGESTIONS_HALF_LIFE_DAYS = float(os.getenv('POSTS_SUGGESTIONS_HALF_LIFE_DAYS', '14'))
+
+# Posts list/detail response cache (posts.response_cache): 'default' is per process, 'shared'
+# (Redis) lets every worker reuse and invalidate the same bodies
+POSTS_RESPONSE_CACHE_ENABLED = os.getenv('POSTS_RESPONSE_CACHE_ENABLED', 'True') == 'True'
+POSTS_RESPONSE_CACHE_ALIAS = os.getenv('POSTS_RESPONSE_CACHE_ALIAS', 'default')
+POSTS_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('POSTS_RESPONSE_CACHE_TTL_SECONDS', '300'))
+
+# Authenticated user cache (JWT over HTTP and WebSocket)
+# AUTH_USER_CACHE_ALIAS optionally names a shared cache in CACHES; local copies then live at most
+# AUTH_USER_CACHE_LOCAL_TTL_SECONDS so changes made by other processes are picked up quickly
+AUTH_USER_CACHE_ENABLED = os.getenv('AUTH_USER_CACHE_ENABLED', 'True') == 'True'
+AUTH_USER_CACHE_MAX_SIZE = int(os.getenv('AUTH_USER_CACHE_MAX_SIZE', '10000'))
+AUTH_USER_CACHE_TTL_SECONDS = int(os.getenv('AUTH_USER_CACHE_TTL_SECONDS', '300'))
+AUTH_USER_CACHE_LOCAL_TTL_SECONDS = int(os.getenv('AUTH_USER_CACHE_LOCAL_TTL_SECONDS', '5'))
+AUTH_USER_CACHE_ALIAS = os.getenv('AUTH_USER_CACHE_ALIAS', '')
+
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -262,6 +383,9 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Metrics: optional dotted path to a callable hook(name, value) receiving every sample
+METRICS_HOOK = os.getenv('METRICS_HOOK') or None
+
 # Email Backend Settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development, prints emails to console
 DEFAULT_FROM_EMAIL = 'noreply@localconnect.com'
@@ -0,0 +1,11 @@
+"""Helpers shared by the apps' test suites"""
+
+
+def follow_pages(client, url, params=None):
+    """GET ``url`` and every page linked by ``next``; returns the decoded pages"""
+    response = client.get(url, params or {}).json()
+    pages = [response]
+    while response['next']:
+        response = client.get(response['next']).json()
+        pages.append(response)
+    return pages
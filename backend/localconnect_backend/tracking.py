@@ -0,0 +1,71 @@
+"""
+Field-level dirty tracking for models
+
+``DirtyFieldsMixin`` snapshots the ``tracked_fields`` of an instance when it
+is created or loaded and again after each save, so ``post_save`` receivers
+can compare the saved values with the previous ones in memory instead of
+reading the row back. Fields that were deferred when the instance was loaded
+are missing from the snapshot, and their previous value is unknown.
+
+``exclude_maintained_fields`` keeps columns that are only written by
+targeted ``UPDATE`` statements out of full saves.
+"""
+
+
+class DirtyFieldsMixin:
+    # Names of the concrete fields to snapshot
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_values = {}
+        self.snapshot_fields()
+
+    def _tracked_attnames(self, fields=None):
+        tracked = [self._meta.get_field(name) for name in self.tracked_fields]
+        if fields is not None:
+            # Fields may be given by name or attname (e.g. ``post`` or ``post_id``)
+            tracked = [field for field in tracked if field.name in fields or field.attname in fields]
+        return [field.attname for field in tracked]
+
+    def snapshot_fields(self, fields=None):
+        """Remember the current values of the tracked ``fields`` (all by default)"""
+        for attname in self._tracked_attnames(fields):
+            if attname in self.__dict__:
+                self._loaded_values[attname] = self.__dict__[attname]
+
+    @property
+    def loaded_values(self):
+        """Tracked values as of the last load or save, by attname"""
+        return self._loaded_values
+
+    def get_dirty_fields(self):
+        """``{attname: previous value}`` of the tracked fields changed since then"""
+        return {
+            attname: value for attname, value in self._loaded_values.items()
+            if attname in self.__dict__ and self.__dict__[attname] != value
+        }
+
+    def has_changed(self, field):
+        return self._meta.get_field(field).attname in self.get_dirty_fields()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have seen the previous values by now
+        self.snapshot_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.snapshot_fields(fields)
+
+
+def exclude_maintained_fields(instance, kwargs, maintained):
+    """
+    Leave columns maintained with targeted UPDATEs (counters, tree paths) out
+    of a full UPDATE, so saving a stale instance never overwrites them
+    """
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in maintained
+        ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
 
 application = get_wsgi_application()
+
+from posts.suggestions import warm  # noqa: E402
+
+warm()
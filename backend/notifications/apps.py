@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class NotificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'notifications' 
\ No newline at end of file
+    name = 'notifications'
+    
+    def ready(self):
+        """Import signals when the app is ready"""
+        import notifications.signals
@@ -0,0 +1,23 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.outbox import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = "Deliver pending notification outbox entries (once, or continuously with --loop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Entries per batch (default: NOTIFICATIONS_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.NOTIFICATIONS_OUTBOX_BATCH_SIZE
+        while True:
+            dispatched = dispatch_pending(batch_size)
+            if dispatched or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Dispatched {dispatched} notifications"))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from notifications.retention import BatchDeleter, apply_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Purge notifications and chat notifications past their retention "
+        "(per-type TTLs and the per-user read limit), in small batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per batch (default: NOTIFICATIONS_RETENTION_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, help='Seconds between batches (default: NOTIFICATIONS_RETENTION_PAUSE_SECONDS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be purged')
+
+    def handle(self, *args, **options):
+        deleter = BatchDeleter(batch_size=options['batch_size'], pause=options['pause'])
+        results = apply_retention(dry_run=options['dry_run'], deleter=deleter)
+
+        verb = "would be purged" if options['dry_run'] else "purged"
+        for policy, rows in results.items():
+            self.stdout.write(f"{policy}: {rows} rows {verb}")
+        self.stdout.write(self.style.SUCCESS(f"{sum(results.values())} rows {verb}"))
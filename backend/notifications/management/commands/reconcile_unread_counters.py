@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from notifications.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Recount the per-user unread notification counters from the notification tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        counters = UnreadCounter.reconcile(options['users'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {counters} unread counters"))
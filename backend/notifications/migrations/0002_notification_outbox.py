@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='dedup_key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dedup_key', models.CharField(max_length=100)),
+                ('notification_type', models.CharField(choices=[('COMMENT', 'New Comment'), ('REPLY', 'New Reply'), ('POST_STATUS', 'Post Status Change'), ('MENTION', 'User Mention'), ('ADMIN', 'Admin Notification'), ('SYSTEM', 'System Notification')], max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Notification outbox entry',
+                'verbose_name_plural': 'Notification outbox',
+                'ordering': ['id'],
+            },
+        ),
+    ]
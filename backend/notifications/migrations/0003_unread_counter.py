@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    ChatNotification = apps.get_model('chat', 'ChatNotification')
+    UnreadCounter = apps.get_model('notifications', 'UnreadCounter')
+    unread = {}
+    for field, model in (('notifications', Notification), ('chat_notifications', ChatNotification)):
+        counts = model.objects.filter(is_read=False).order_by().values('recipient_id').annotate(count=Count('pk'))
+        for row in counts:
+            unread.setdefault(row['recipient_id'], {})[field] = row['count']
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=user_id, **counts) for user_id, counts in unread.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_profile_picture'),
+        ('chat', '0005_message_room_created_index'),
+        ('notifications', '0002_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('notifications', models.IntegerField(default=0)),
+                ('chat_notifications', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Unread counter',
+                'verbose_name_plural': 'Unread counters',
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0003_unread_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actors',
+            field=models.JSONField(blank=True, default=list, help_text='Latest actors, newest first'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='actor',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'group_key', 'created_at'], name='notif_recipient_group_idx'),
+        ),
+    ]
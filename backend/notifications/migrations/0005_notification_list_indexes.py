@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_search_indexes(apps, schema_editor):
+    """Trigram indexes for the case-insensitive substring search (UPPER(...) LIKE ...) on PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('notifications', 'Notification')._meta.db_table
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in ('title', 'message'):
+        schema_editor.execute(
+            f'CREATE INDEX notif_{column}_trgm_idx ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for column in ('title', 'message'):
+            schema_editor.execute(f'DROP INDEX IF EXISTS notif_{column}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0004_notification_aggregation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'created_at'], name='notif_recipient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'notification_type', 'created_at'], name='notif_recipient_type_idx'),
+        ),
+        # Prefix of notif_recipient_read_idx
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notificatio_recipie_4e3567_idx',
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='actors',
+            field=models.JSONField(blank=True, default=list, help_text='Distinct actors, newest first'),
+        ),
+    ]
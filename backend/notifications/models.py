@@ -1,16 +1,23 @@
-from django.db import models
+import uuid
+from collections import Counter, defaultdict
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
+from localconnect_backend.tracking import DirtyFieldsMixin
 
 User = get_user_model()
 
 
-class Notification(models.Model):
+class Notification(DirtyFieldsMixin, models.Model):
     """
     Notification model for handling various types of notifications
     """
+    # Snapshotted for the unread counters (notifications.signals)
+    tracked_fields = ('is_read',)
+    
     NOTIFICATION_TYPES = [
         ('COMMENT', 'New Comment'),
         ('REPLY', 'New Reply'),
@@ -45,6 +52,15 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
     
+    # Identifies the event, so a redelivered outbox entry is stored once
+    dedup_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    
+    # Aggregation: events with the same recipient and group key inside
+    # NOTIFICATIONS_AGGREGATION_WINDOW_SECONDS are folded into one row
+    group_key = models.CharField(max_length=100, null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    actors = models.JSONField(default=list, blank=True, help_text="Distinct actors, newest first")
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -52,27 +68,74 @@ class Notification(models.Model):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['notification_type']),
             models.Index(fields=['created_at']),
+            # Newest-first pages of a user's notifications (all, unread, by type)
+            models.Index(fields=['recipient', 'created_at'], name='notif_recipient_created_idx'),
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+            models.Index(fields=['recipient', 'notification_type', 'created_at'], name='notif_recipient_type_idx'),
+            models.Index(fields=['recipient', 'group_key', 'created_at'], name='notif_recipient_group_idx'),
         ]
     
+    # How folded notifications read, e.g. "ana and 14 others commented on your post"
+    AGGREGATE_VERBS = {
+        'COMMENT': 'commented on your post',
+        'REPLY': 'replied to your comment',
+    }
+    # Actors listed by the API
+    MAX_ACTORS = 3
+    
     def __str__(self):
         return f"{self.notification_type} - {self.recipient.username}: {self.title}"
     
+    def fold(self, actor, now):
+        """
+        Fold another event by ``actor`` into this notification and mark it
+        unread again; returns whether it was read before
+        
+        ``actors`` keeps every distinct actor of the group (bounded by the
+        aggregation window), so ``actor_count`` counts people, not events.
+        """
+        was_read = self.is_read
+        self.actors = [actor] + [name for name in self.actors if name != actor]
+        self.actor_count = len(self.actors)
+        others = self.actor_count - 1
+        verb = self.AGGREGATE_VERBS.get(self.notification_type, 'sent you notifications')
+        if others:
+            self.message = f'{actor} and {others} other{"s" if others != 1 else ""} {verb}'
+        else:
+            self.message = f'{actor} {verb}'
+        self.is_read = False
+        self.read_at = None
+        self.updated_at = now
+        return was_read
+    
+    def save(self, *args, **kwargs):
+        """Save the notification and its unread counter update (notifications.signals) atomically"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        """Delete the notification, releasing its unread count"""
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if not self.is_read:
+                UnreadCounter.adjust(self.recipient_id, notifications=-1)
+        return result
+    
     def mark_as_read(self):
         """Mark notification as read"""
         if not self.is_read:
             self.is_read = True
             self.read_at = timezone.now()
-            self.save(update_fields=['is_read', 'read_at'])
+            self.save(update_fields=['is_read', 'read_at', 'updated_at'])
     
     def mark_as_unread(self):
         """Mark notification as unread"""
         if self.is_read:
             self.is_read = False
             self.read_at = None
-            self.save(update_fields=['is_read', 'read_at'])
+            self.save(update_fields=['is_read', 'read_at', 'updated_at'])
     
     @classmethod
     def create_notification(cls, recipient, notification_type, title, message, content_object=None, data=None):
@@ -89,13 +152,35 @@ class Notification(models.Model):
         )
         return notification
     
+    @classmethod
+    def enqueue_notification(cls, recipient, notification_type, title, message, content_object=None, data=None,
+                             dedup_key=None, group_key=None, actor=''):
+        """
+        Queue a notification in the outbox, in the caller's transaction; it
+        is stored and pushed to the recipient by notifications.outbox
+        
+        Notifications with a ``group_key`` are folded into a recent one with
+        the same key, listing ``actor`` among its actors.
+        """
+        return NotificationOutbox.enqueue(
+            recipient=recipient,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            content_object=content_object,
+            data=data,
+            dedup_key=dedup_key,
+            group_key=group_key,
+            actor=actor
+        )
+    
     @classmethod
     def create_comment_notification(cls, comment, post):
         """
-        Create notification for new comment on a post
+        Queue notification for new comment on a post
         """
         if comment.author != post.author:  # Don't notify the post author of their own comment
-            return cls.create_notification(
+            return cls.enqueue_notification(
                 recipient=post.author,
                 notification_type='COMMENT',
                 title=f'New comment on "{post.title}"',
@@ -106,17 +191,20 @@ class Notification(models.Model):
                     'post_title': post.title,
                     'comment_id': comment.id,
                     'comment_author': comment.author.username
-                }
+                },
+                dedup_key=f'comment:{comment.id}',
+                group_key=f'post:{post.id}',
+                actor=comment.author.username
             )
         return None
     
     @classmethod
     def create_reply_notification(cls, reply, parent_comment):
         """
-        Create notification for new reply to a comment
+        Queue notification for new reply to a comment
         """
         if reply.author != parent_comment.author:  # Don't notify the comment author of their own reply
-            return cls.create_notification(
+            return cls.enqueue_notification(
                 recipient=parent_comment.author,
                 notification_type='REPLY',
                 title=f'New reply to your comment',
@@ -128,14 +216,17 @@ class Notification(models.Model):
                     'comment_id': reply.id,
                     'reply_author': reply.author.username,
                     'parent_comment_id': parent_comment.id
-                }
+                },
+                dedup_key=f'reply:{reply.id}',
+                group_key=f'comment:{parent_comment.id}',
+                actor=reply.author.username
             )
         return None
     
     @classmethod
     def create_post_status_notification(cls, post, old_status, new_status):
         """
-        Create notification for post status change
+        Queue notification for post status change
         """
         status_messages = {
             'CLOSED': 'Your post has been closed',
@@ -145,7 +236,7 @@ class Notification(models.Model):
         }
         
         if new_status in status_messages:
-            return cls.create_notification(
+            return cls.enqueue_notification(
                 recipient=post.author,
                 notification_type='POST_STATUS',
                 title=f'Post status updated: {new_status}',
@@ -163,9 +254,9 @@ class Notification(models.Model):
     @classmethod
     def create_mention_notification(cls, mentioned_user, mentioner, content, content_object):
         """
-        Create notification for user mention
+        Queue notification for user mention
         """
-        return cls.create_notification(
+        return cls.enqueue_notification(
             recipient=mentioned_user,
             notification_type='MENTION',
             title=f'You were mentioned by {mentioner.username}',
@@ -181,12 +272,183 @@ class Notification(models.Model):
     @classmethod
     def create_admin_notification(cls, recipient, title, message, data=None):
         """
-        Create admin notification
+        Queue admin notification
         """
-        return cls.create_notification(
+        return cls.enqueue_notification(
             recipient=recipient,
             notification_type='ADMIN',
             title=title,
             message=message,
             data=data or {}
-        ) 
\ No newline at end of file
+        ) 
+
+class UnreadCounter(models.Model):
+    """
+    Unread Notification and ChatNotification rows per user
+    
+    Adjusted in the same transaction as every change to those rows, so
+    badges are read from one row instead of counting notifications. Rows are
+    created on first use; ``reconcile_unread_counters`` recounts them.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='unread_counter'
+    )
+    notifications = models.IntegerField(default=0)
+    chat_notifications = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Unread counter"
+        verbose_name_plural = "Unread counters"
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.notifications} notifications, {self.chat_notifications} chat"
+    
+    @classmethod
+    def for_user(cls, user):
+        """The user's counters (zero when nothing was counted yet), without writing"""
+        return cls.objects.filter(user=user).first() or cls(user=user)
+    
+    @classmethod
+    def adjust(cls, user_id, notifications=0, chat_notifications=0):
+        """Add the deltas to a user's counters, creating the row on first use"""
+        if not notifications and not chat_notifications:
+            return
+        counter = cls.objects.filter(user_id=user_id)
+        changes = {
+            'notifications': F('notifications') + notifications,
+            'chat_notifications': F('chat_notifications') + chat_notifications
+        }
+        if counter.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, notifications=notifications, chat_notifications=chat_notifications
+                )
+        except IntegrityError:
+            # Created concurrently
+            counter.update(**changes)
+    
+    @classmethod
+    def adjust_many(cls, field, user_ids):
+        """
+        Add one to ``field`` for every occurrence of a user id, with one
+        UPDATE per distinct delta instead of one per user
+        """
+        by_delta = defaultdict(list)
+        for user_id, delta in Counter(user_ids).items():
+            by_delta[delta].append(user_id)
+        for delta, ids in by_delta.items():
+            existing = set(cls.objects.filter(user_id__in=ids).values_list('user_id', flat=True))
+            cls.objects.filter(user_id__in=existing).update(**{field: F(field) + delta})
+            missing = [user_id for user_id in ids if user_id not in existing]
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(user_id=user_id, **{field: delta}) for user_id in missing])
+            except IntegrityError:
+                for user_id in missing:
+                    cls.adjust(user_id, **{field: delta})
+    
+    @classmethod
+    def reconcile(cls, user_ids=None):
+        """Recount the counters of ``user_ids`` (or every user); returns the number of rows written"""
+        from chat.models import ChatNotification
+        
+        counters = cls.objects.all()
+        notifications = Notification.objects.filter(is_read=False)
+        chat_notifications = ChatNotification.objects.filter(is_read=False)
+        if user_ids is not None:
+            counters = counters.filter(user_id__in=user_ids)
+            notifications = notifications.filter(recipient_id__in=user_ids)
+            chat_notifications = chat_notifications.filter(recipient_id__in=user_ids)
+        
+        with transaction.atomic():
+            # Lock existing counters first: writers still waiting on them are counted after this commits
+            stale = list(counters.select_for_update().values_list('user_id', flat=True))
+            unread = {}
+            for field, rows in (('notifications', notifications), ('chat_notifications', chat_notifications)):
+                counts = rows.order_by().values('recipient_id').annotate(count=Count('pk'))
+                for row in counts:
+                    unread.setdefault(row['recipient_id'], {})[field] = row['count']
+            for user_id in stale:
+                unread.setdefault(user_id, {})
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, **counts) for user_id, counts in unread.items()],
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['notifications', 'chat_notifications']
+            )
+        return len(unread)
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notifications written in the transaction of the event that caused them
+    and not delivered yet
+    
+    notifications.outbox drains entries in batches: it stores them as
+    Notification rows (deduplicated by ``dedup_key``) and pushes them to the
+    recipients' WebSocket groups.
+    """
+    dedup_key = models.CharField(max_length=100)
+    group_key = models.CharField(max_length=100, null=True, blank=True)
+    actor = models.CharField(max_length=150, blank=True)
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Notification outbox entry"
+        verbose_name_plural = "Notification outbox"
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.dedup_key} for {self.recipient_id}"
+    
+    @classmethod
+    def enqueue(cls, recipient, notification_type, title, message, content_object=None, data=None, dedup_key=None,
+                group_key=None, actor=''):
+        """Add an entry and have it dispatched once the transaction commits"""
+        from .outbox import schedule_dispatch
+        
+        entry = cls.objects.create(
+            dedup_key=dedup_key or uuid.uuid4().hex,
+            group_key=group_key,
+            actor=actor,
+            recipient=recipient,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            content_type=ContentType.objects.get_for_model(content_object) if content_object is not None else None,
+            object_id=content_object.pk if content_object is not None else None,
+            data=data or {}
+        )
+        transaction.on_commit(schedule_dispatch, robust=True)
+        return entry
+    
+    def to_notification(self):
+        return Notification(
+            recipient_id=self.recipient_id,
+            notification_type=self.notification_type,
+            title=self.title,
+            message=self.message,
+            content_type_id=self.content_type_id,
+            object_id=self.object_id,
+            data=self.data,
+            dedup_key=self.dedup_key,
+            group_key=self.group_key,
+            actors=[self.actor] if self.actor else []
+        )
@@ -0,0 +1,149 @@
+"""
+Dispatcher for the notification outbox
+
+Events enqueue ``NotificationOutbox`` entries inside their own transaction,
+so creating a comment only pays for one INSERT. ``dispatch_batch`` drains
+the oldest entries: in one transaction it bulk-inserts them as
+``Notification`` rows, adds them to the unread counters and deletes them,
+then pushes the stored rows to the ``notifications_<user_id>`` groups of
+``chat.consumers.NotificationConsumer``.
+
+Entries with a ``group_key`` (e.g. comments on one post) are folded into the
+recipient's latest notification of the same type and group created within
+``NOTIFICATIONS_AGGREGATION_WINDOW_SECONDS``: the row is updated in place
+with the new actor, an actor count and a message such as "ana and 14 others
+commented on your post", and becomes unread again.
+
+Delivery is at least once: an entry is only deleted together with its
+notification, and a batch that is retried after a crash is deduplicated by
+``Notification.dedup_key``. Folding happens in the transaction that deletes
+the entries, so it is never applied twice. Pushes happen after the commit
+and may repeat.
+
+Where batches run depends on ``NOTIFICATIONS_OUTBOX_INLINE``: in the
+committing process after each transaction (development), or in the Celery
+task ``notifications.tasks.dispatch_notification_outbox``, queued after
+each transaction and run every ``NOTIFICATIONS_OUTBOX_POLL_SECONDS`` by beat.
+"""
+import logging
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from localconnect_backend import metrics
+from .models import Notification, NotificationOutbox, UnreadCounter
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_batch(batch_size=None):
+    """Deliver up to ``batch_size`` outbox entries; returns how many were taken"""
+    batch_size = settings.NOTIFICATIONS_OUTBOX_BATCH_SIZE if batch_size is None else batch_size
+    with transaction.atomic():
+        # Concurrent dispatchers take disjoint batches
+        entries = list(NotificationOutbox.objects.select_for_update(skip_locked=True).order_by('pk')[:batch_size])
+        if not entries:
+            return 0
+        notifications = store(entries)
+        NotificationOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+
+    push(notifications)
+    metrics.incr('notifications.outbox.dispatched', len(entries))
+    return len(entries)
+
+
+def store(entries):
+    """
+    Insert the entries as notifications, folding grouped ones into recent
+    notifications in place; returns the notifications that were written
+    """
+    keys = [entry.dedup_key for entry in entries]
+    stored = set(Notification.objects.filter(dedup_key__in=keys).values_list('dedup_key', flat=True))
+    entries = list({entry.dedup_key: entry for entry in entries if entry.dedup_key not in stored}.values())
+    
+    now = timezone.now()
+    groups = open_groups(entries, now)
+    new, folded, unread = [], {}, []
+    for entry in entries:
+        group = (entry.recipient_id, entry.notification_type, entry.group_key)
+        aggregate = groups.get(group) if entry.group_key else None
+        if aggregate is None:
+            notification = entry.to_notification()
+            new.append(notification)
+            unread.append(entry.recipient_id)
+            if entry.group_key:
+                groups[group] = notification
+            continue
+        if aggregate.fold(entry.actor, now):
+            unread.append(entry.recipient_id)
+        if aggregate.pk is not None:
+            folded[aggregate.pk] = aggregate
+    
+    Notification.objects.bulk_create(new, ignore_conflicts=True)
+    Notification.objects.bulk_update(
+        folded.values(), ['actor_count', 'actors', 'message', 'is_read', 'read_at', 'updated_at']
+    )
+    UnreadCounter.adjust_many('notifications', unread)
+    metrics.incr('notifications.outbox.folded', len(entries) - len(new))
+    inserted = Notification.objects.filter(dedup_key__in=[notification.dedup_key for notification in new])
+    return sorted([*inserted, *folded.values()], key=lambda notification: notification.pk)
+
+
+def open_groups(entries, now):
+    """Latest notification of each entry's group still inside the aggregation window, locked"""
+    window = settings.NOTIFICATIONS_AGGREGATION_WINDOW_SECONDS
+    grouped = [entry for entry in entries if entry.group_key]
+    if not window or not grouped:
+        return {}
+    candidates = Notification.objects.select_for_update().filter(
+        recipient_id__in={entry.recipient_id for entry in grouped},
+        group_key__in={entry.group_key for entry in grouped},
+        created_at__gte=now - timedelta(seconds=window)
+    ).order_by('created_at')
+    # Later rows overwrite earlier ones, so each group keeps its newest row
+    return {
+        (notification.recipient_id, notification.notification_type, notification.group_key): notification
+        for notification in candidates
+    }
+
+
+def dispatch_pending(batch_size=None):
+    """Drain the outbox; returns the number of entries delivered"""
+    total = 0
+    while True:
+        dispatched = dispatch_batch(batch_size)
+        if not dispatched:
+            return total
+        total += dispatched
+
+
+def push(notifications):
+    """Send stored notifications to their recipients' open WebSockets"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for notification in notifications:
+        try:
+            async_to_sync(channel_layer.group_send)(f'notifications_{notification.recipient_id}', {
+                'type': 'notification_message',
+                'notification': NotificationSerializer(notification).data
+            })
+        except Exception:
+            # The notification is stored; clients pick it up on their next fetch
+            logger.exception("Could not push notification %s", notification.pk)
+
+
+def schedule_dispatch():
+    """Run after a transaction that enqueued notifications has committed"""
+    if settings.NOTIFICATIONS_OUTBOX_INLINE:
+        dispatch_pending()
+        return
+    from .tasks import dispatch_notification_outbox
+    try:
+        dispatch_notification_outbox.apply_async(retry=False)
+    except Exception:
+        # The periodic run picks the entries up
+        logger.warning("Could not queue notification dispatch", exc_info=True)
@@ -0,0 +1,11 @@
+from localconnect_backend.pagination import FeedKeysetPagination
+
+
+class NotificationCursorPagination(FeedKeysetPagination):
+    """
+    Newest-first keyset pages for the notification list actions, served from
+    the ``(recipient, ..., created_at)`` indexes
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
@@ -0,0 +1,120 @@
+"""
+Retention of Notification and ChatNotification rows
+
+Two policies decide what is purged:
+
+- age: rows older than their type's TTL in ``NOTIFICATIONS_RETENTION_DAYS``
+  or ``CHAT_NOTIFICATIONS_RETENTION_DAYS`` (``'*'`` covers the other
+  types, None keeps them forever);
+- volume: read rows beyond the newest ``NOTIFICATIONS_MAX_READ_PER_USER``
+  of each user.
+
+``BatchDeleter`` removes matching rows ``NOTIFICATIONS_RETENTION_BATCH_SIZE``
+at a time, each batch in its own short transaction that also releases the
+deleted unread rows from ``UnreadCounter``, pausing
+``NOTIFICATIONS_RETENTION_PAUSE_SECONDS`` between batches. Rows purged and
+batch durations are recorded as ``notifications.retention.<model>.purged``
+and ``notifications.retention.batch_seconds`` in
+``localconnect_backend.metrics``.
+
+``apply_retention`` runs both policies; it is scheduled nightly as
+``notifications.tasks.apply_notification_retention`` and available as
+``manage.py purge_notifications``.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from chat.models import ChatNotification
+from localconnect_backend import metrics
+from .models import Notification, UnreadCounter
+
+# Model, UnreadCounter field and TTL setting of each kind of notification
+RETAINED_MODELS = (
+    (Notification, 'notifications', 'NOTIFICATIONS_RETENTION_DAYS'),
+    (ChatNotification, 'chat_notifications', 'CHAT_NOTIFICATIONS_RETENTION_DAYS'),
+)
+
+
+class BatchDeleter:
+    """Delete the rows of a queryset in short batches, keeping unread counters in step"""
+
+    def __init__(self, batch_size=None, pause=None):
+        self.batch_size = settings.NOTIFICATIONS_RETENTION_BATCH_SIZE if batch_size is None else batch_size
+        self.pause = settings.NOTIFICATIONS_RETENTION_PAUSE_SECONDS if pause is None else pause
+
+    def delete(self, queryset):
+        """Delete every row of ``queryset``; returns the number deleted"""
+        model = queryset.model
+        counter_field = next(field for retained, field, _ in RETAINED_MODELS if retained is model)
+        deleted = 0
+        while True:
+            started = time.monotonic()
+            with transaction.atomic():
+                # Locked, so the read state cannot change before the counters are adjusted
+                batch = list(
+                    queryset.select_for_update().order_by('pk').values_list('pk', 'recipient_id', 'is_read')[
+                        :self.batch_size
+                    ]
+                )
+                if not batch:
+                    return deleted
+                model.objects.filter(pk__in=[pk for pk, _, _ in batch]).delete()
+                unread = Counter(user_id for _, user_id, is_read in batch if not is_read)
+                for user_id, count in unread.items():
+                    UnreadCounter.adjust(user_id, **{counter_field: -count})
+            deleted += len(batch)
+            metrics.observe('notifications.retention.batch_seconds', time.monotonic() - started)
+            metrics.incr(f'notifications.retention.{model._meta.model_name}.purged', len(batch))
+            if len(batch) < self.batch_size:
+                return deleted
+            if self.pause:
+                time.sleep(self.pause)
+
+
+def expired(model, ttl_days, now=None):
+    """Rows of ``model`` older than their type's TTL (``ttl_days`` maps types, or '*', to days)"""
+    now = timezone.now() if now is None else now
+    condition = Q(pk__in=[])
+    named = [notification_type for notification_type in ttl_days if notification_type != '*']
+    for notification_type in named:
+        days = ttl_days[notification_type]
+        if days is not None:
+            condition |= Q(notification_type=notification_type, created_at__lt=now - timedelta(days=days))
+    if ttl_days.get('*') is not None:
+        condition |= Q(created_at__lt=now - timedelta(days=ttl_days['*'])) & ~Q(notification_type__in=named)
+    return model.objects.filter(condition)
+
+
+def over_read_limit(model, limit):
+    """Yield, per user, the querysets of read rows beyond their newest ``limit``"""
+    read = model.objects.filter(is_read=True)
+    users = read.order_by().values('recipient_id').annotate(count=Count('pk')).filter(count__gt=limit)
+    for user_id in users.values_list('recipient_id', flat=True):
+        rows = read.filter(recipient_id=user_id)
+        if not limit:
+            yield rows
+            continue
+        oldest_kept = rows.order_by('-created_at', '-pk').values_list('created_at', 'pk')[limit - 1:limit]
+        for created_at, pk in oldest_kept:
+            yield rows.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+
+def apply_retention(dry_run=False, deleter=None):
+    """Run every policy; returns ``{'<model>.<policy>': rows}`` purged (or that would be)"""
+    deleter = BatchDeleter() if deleter is None else deleter
+    limit = settings.NOTIFICATIONS_MAX_READ_PER_USER
+    results = {}
+    for model, _, ttl_setting in RETAINED_MODELS:
+        name = model._meta.model_name
+        querysets = {'expired': [expired(model, getattr(settings, ttl_setting))]}
+        if limit is not None:
+            querysets['over_read_limit'] = over_read_limit(model, limit)
+        for policy, policy_querysets in querysets.items():
+            results[f'{name}.{policy}'] = sum(
+                queryset.count() if dry_run else deleter.delete(queryset) for queryset in policy_querysets
+            )
+    return results
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Notification
+from .models import Notification, UnreadCounter
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -7,15 +7,20 @@ class NotificationSerializer(serializers.ModelSerializer):
     Serializer for Notification model
     """
     notification_type_display = serializers.CharField(source='get_notification_type_display', read_only=True)
+    actors = serializers.SerializerMethodField()
     time_ago = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
         fields = [
             'id', 'notification_type', 'notification_type_display', 'title', 'message',
-            'data', 'is_read', 'created_at', 'time_ago'
+            'data', 'actor_count', 'actors', 'is_read', 'created_at', 'time_ago'
         ]
-        read_only_fields = ['id', 'created_at', 'time_ago']
+        read_only_fields = ['id', 'actor_count', 'actors', 'created_at', 'time_ago']
+    
+    def get_actors(self, obj):
+        """The latest actors of a folded notification, newest first"""
+        return obj.actors[:Notification.MAX_ACTORS]
     
     def get_time_ago(self, obj):
         """Return human-readable time ago"""
@@ -69,7 +74,7 @@ class NotificationSummarySerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         """Get unread notification count for the user"""
         user = self.context['request'].user
-        return Notification.objects.filter(recipient=user, is_read=False).count()
+        return UnreadCounter.for_user(user).notifications
     
     def get_recent_notifications(self, obj):
         """Get recent notifications for the user"""
@@ -0,0 +1,41 @@
+from django.db.models import Count
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from chat.models import ChatRoom
+from .models import Notification, UnreadCounter
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_counter(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep UnreadCounter.notifications in step with notification creation and
+    read-state changes
+    
+    Runs inside Notification.save's transaction, so the counter commits with
+    the row. Deletes are counted by Notification.delete and bulk changes by
+    their callers.
+    """
+    if not created and update_fields is not None and 'is_read' not in update_fields:
+        return
+    if not created and 'is_read' not in instance.loaded_values:
+        # Unknown previous state
+        UnreadCounter.reconcile([instance.recipient_id])
+        return
+    was_unread = not created and not instance.loaded_values['is_read']
+    if was_unread != (not instance.is_read):
+        UnreadCounter.adjust(instance.recipient_id, notifications=-1 if was_unread else 1)
+
+
+@receiver(pre_delete, sender=ChatRoom)
+def release_chat_room_notifications(sender, instance, **kwargs):
+    """
+    Take the unread ChatNotification rows of a deleted room off their
+    recipients' counters before the delete cascades to them
+    
+    Runs inside the delete's transaction.
+    """
+    unread = instance.notifications.filter(is_read=False).order_by().values('recipient_id').annotate(
+        count=Count('pk')
+    )
+    for row in unread:
+        UnreadCounter.adjust(row['recipient_id'], chat_notifications=-row['count'])
@@ -0,0 +1,15 @@
+from celery import shared_task
+from .outbox import dispatch_pending
+from .retention import apply_retention
+
+
+@shared_task(ignore_result=True)
+def dispatch_notification_outbox():
+    """Store and push every pending notification outbox entry"""
+    return dispatch_pending()
+
+
+@shared_task
+def apply_notification_retention():
+    """Purge notifications past their TTL or beyond the per-user read limit"""
+    return apply_retention()
@@ -0,0 +1,210 @@
+from datetime import timedelta
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chat.models import ChatNotification, ChatParticipant, ChatRoom, Message
+from localconnect_backend.testing import follow_pages
+from posts.models import Comment, Post
+
+from .models import Notification, NotificationOutbox, UnreadCounter
+from .outbox import dispatch_pending
+from .retention import apply_retention
+from .serializers import NotificationSerializer
+
+User = get_user_model()
+
+
+@override_settings(NOTIFICATIONS_OUTBOX_INLINE=True)
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.helper = User.objects.create_user(username='helper', email='helper@example.com', password='pass')
+        self.post = Post.objects.create(
+            title='Help wanted with moving', content='Details about the request go here.', author=self.author
+        )
+
+    def test_comment_notifications_are_stored_and_pushed_after_commit(self):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'notifications_{self.author.pk}', channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=self.post, author=self.helper, content='Happy to help')
+            self.assertFalse(Notification.objects.exists())
+            self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+        notification = self.author.notifications.get()
+        self.assertEqual(notification.dedup_key, f'comment:{comment.pk}')
+        self.assertFalse(NotificationOutbox.objects.exists())
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'notification_message')
+        self.assertEqual(event['notification']['id'], notification.pk)
+
+    def test_redelivered_entries_are_stored_once(self):
+        comment = Comment.objects.create(post=self.post, author=self.helper, content='Happy to help')
+        NotificationOutbox.objects.create(**{
+            field: getattr(NotificationOutbox.objects.get(), field)
+            for field in ('dedup_key', 'recipient', 'notification_type', 'title', 'message', 'data')
+        })
+        self.assertEqual(dispatch_pending(), 2)
+        self.assertEqual(self.author.notifications.filter(dedup_key=f'comment:{comment.pk}').count(), 1)
+
+    def test_comments_on_one_post_are_folded_into_one_notification(self):
+        helpers = [
+            User.objects.create_user(username=f'helper{index}', email=f'helper{index}@example.com', password='pass')
+            for index in range(4)
+        ]
+        for helper in [self.helper, *helpers, helpers[0], self.helper]:
+            Comment.objects.create(post=self.post, author=helper, content='Happy to help')
+            dispatch_pending()
+
+        # Repeat commenters are counted once, however long ago they commented
+        notification = self.author.notifications.get()
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.message, 'helper and 4 others commented on your post')
+        self.assertEqual(NotificationSerializer(notification).data['actors'], ['helper', 'helper0', 'helper3'])
+
+        notification.mark_as_read()
+        Comment.objects.create(post=self.post, author=helpers[0], content='Me too')
+        dispatch_pending()
+        notification.refresh_from_db()
+        self.assertFalse(notification.is_read)
+        self.assertEqual(UnreadCounter.for_user(self.author).notifications, 1)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, title):
+        return Notification.create_notification(self.user, 'SYSTEM', title, 'Details')
+
+    def badge(self):
+        with self.assertNumQueries(1):
+            return self.client.get('/api/notifications/badge/').json()['notifications']
+
+    def test_counters_follow_every_write_path(self):
+        first, second, third = self.notify('One'), self.notify('Two'), self.notify('Three')
+        self.assertEqual(self.badge(), 3)
+
+        first.mark_as_read()
+        second.is_read = True
+        second.save()
+        self.assertEqual(self.badge(), 1)
+        self.client.post('/api/notifications/mark_all_as_unread/')
+        self.assertEqual(self.badge(), 3)
+        third.delete()
+        self.client.post('/api/notifications/mark_all_as_read/')
+        self.notify('Four')
+        self.assertEqual(self.badge(), 1)
+        self.client.delete('/api/notifications/clear_all/')
+        self.assertEqual(self.badge(), 0)
+
+        self.notify('Five')
+        UnreadCounter.objects.update(notifications=7)
+        UnreadCounter.reconcile()
+        self.assertEqual(self.badge(), 1)
+
+    def test_chat_counters_follow_every_write_path(self):
+        sender = User.objects.create_user(username='sender', email='sender@example.com', password='pass')
+        rooms = [ChatRoom.objects.create(name=f'Room {index}', created_by=sender) for index in range(2)]
+        for room in rooms:
+            for user in (self.user, sender):
+                ChatParticipant.objects.create(chat_room=room, user=user)
+
+        def chat_badge():
+            return self.client.get('/api/notifications/badge/').json()['chat']
+
+        def send(room):
+            message = Message.objects.create(chat_room=room, sender=sender, content='Hello')
+            return ChatNotification.create_for_message(message)
+
+        first, = send(rooms[0])
+        send(rooms[0])
+        send(rooms[1])
+        self.assertEqual(chat_badge(), 3)
+        first.mark_as_read()
+        first.mark_as_read()
+        self.assertEqual(chat_badge(), 2)
+
+        self.client.force_authenticate(sender)
+        self.assertEqual(self.client.delete(f'/api/chat/rooms/{rooms[0].id}/').status_code, 204)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(chat_badge(), 1)
+
+        self.client.post('/api/chat/notifications/mark_all_as_read/')
+        self.assertEqual(chat_badge(), 0)
+        send(rooms[1])
+        with override_settings(CHAT_MESSAGE_NOTIFICATIONS='cursor'):
+            call_command('prune_message_notifications', stdout=StringIO())
+        self.assertEqual(UnreadCounter.for_user(self.user).chat_notifications, 0)
+        self.assertFalse(ChatNotification.objects.exists())
+
+
+@override_settings(
+    NOTIFICATIONS_RETENTION_DAYS={'*': 90, 'SYSTEM': 30},
+    NOTIFICATIONS_MAX_READ_PER_USER=2,
+    NOTIFICATIONS_RETENTION_BATCH_SIZE=2,
+    NOTIFICATIONS_RETENTION_PAUSE_SECONDS=0
+)
+class RetentionTests(TestCase):
+    def test_policies_purge_in_batches_and_release_unread_counts(self):
+        user = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+
+        def notify(notification_type, title):
+            return Notification.create_notification(user, notification_type, title, 'Details')
+
+        for title in ('Old system', 'Old system 2', 'Old system 3'):
+            Notification.objects.filter(pk=notify('SYSTEM', title).pk).update(
+                created_at=timezone.now() - timedelta(days=40)
+            )
+        Notification.objects.filter(pk=notify('ADMIN', 'Old admin').pk).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        for title in ('Read 1', 'Read 2', 'Read 3', 'Read 4'):
+            notify('ADMIN', title).mark_as_read()
+
+        results = apply_retention()
+
+        self.assertEqual(results['notification.expired'], 3)
+        self.assertEqual(results['notification.over_read_limit'], 2)
+        self.assertEqual(
+            sorted(user.notifications.values_list('title', flat=True)), ['Old admin', 'Read 3', 'Read 4']
+        )
+        self.assertEqual(UnreadCounter.for_user(user).notifications, 1)
+
+
+class NotificationListActionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        for index in range(12):
+            Notification.create_notification(
+                self.user, 'ADMIN' if index % 3 else 'SYSTEM', f'Notice {index}', f'Garden update {index}'
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_actions_return_newest_first_keyset_pages(self):
+        expected = list(
+            self.user.notifications.filter(notification_type='ADMIN').order_by('-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+        pages = follow_pages(self.client, '/api/notifications/by_type/', {'type': 'ADMIN', 'page_size': 3})
+        self.assertEqual([item['id'] for page in pages for item in page['results']], expected)
+        previous = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+        pages = follow_pages(self.client, '/api/notifications/search/', {'q': 'garden update 1', 'page_size': 3})
+        self.assertEqual(
+            sorted(item['title'] for page in pages for item in page['results']),
+            ['Notice 1', 'Notice 10', 'Notice 11']
+        )
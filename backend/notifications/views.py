@@ -2,10 +2,18 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
-from .models import Notification
+from localconnect_backend import conditional
+
+from chat.models import ChatParticipant
+
+from .models import Notification, UnreadCounter
+from .pagination import NotificationCursorPagination
+from .retention import BatchDeleter
 from .serializers import (
     NotificationSerializer, NotificationCreateSerializer,
     NotificationUpdateSerializer, NotificationSummarySerializer
@@ -19,6 +27,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     """
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
     serializer_class = NotificationSerializer
+    # Served by NotificationCursorPagination
+    cursor_paginated_actions = ('unread', 'by_type', 'search')
     
     def get_queryset(self):
         """Filter notifications for the current user"""
@@ -34,24 +44,62 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return NotificationSummarySerializer
         return NotificationSerializer
     
+    @property
+    def paginator(self):
+        """Keyset pages for the filtered list actions, which can span many notifications"""
+        if not hasattr(self, '_paginator') and self.action in self.cursor_paginated_actions:
+            self._paginator = NotificationCursorPagination()
+        return super().paginator
+    
     def perform_create(self, serializer):
         """Set the recipient to the current user"""
         serializer.save(recipient=self.request.user)
     
+    def paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get unread notifications"""
-        unread_notifications = self.get_queryset().filter(is_read=False)
-        serializer = self.get_serializer(unread_notifications, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(self.get_queryset().filter(is_read=False))
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get notification summary (unread count, recent notifications)"""
+        """
+        Get notification summary (unread count, recent notifications)
+        
+        Supports conditional GET: validators come from one aggregate over the
+        user's notifications, checked before anything is serialized.
+        """
+        validators = conditional.aggregate_validators(self.get_queryset())
+        precondition = conditional.check_preconditions(request, validators)
+        if precondition is not None:
+            return precondition
+        
         # Create a dummy object for the serializer
         dummy_notification = Notification()
         serializer = NotificationSummarySerializer(dummy_notification, context={'request': request})
-        return Response(serializer.data)
+        return conditional.set_validators(Response(serializer.data), request, validators)
+    
+    @action(detail=False, methods=['get'])
+    def badge(self, request):
+        """
+        Unread counts for the navbar badge, read from the user's counters
+        
+        In the 'cursor' chat notification mode unread chat messages come from
+        the user's read positions instead of stored notifications.
+        """
+        counter = UnreadCounter.for_user(request.user)
+        chat = counter.chat_notifications
+        if settings.CHAT_MESSAGE_NOTIFICATIONS == 'cursor':
+            chat += ChatParticipant.unread_messages(request.user)
+        return Response({
+            'notifications': counter.notifications,
+            'chat': chat,
+            'total': counter.notifications + chat
+        })
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
@@ -72,10 +120,14 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
         """Mark all notifications as read"""
-        updated_count = self.get_queryset().filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        now = timezone.now()
+        with transaction.atomic():
+            updated_count = self.get_queryset().filter(is_read=False).update(
+                is_read=True,
+                read_at=now,
+                updated_at=now
+            )
+            UnreadCounter.adjust(request.user.pk, notifications=-updated_count)
         return Response({
             'message': f'Marked {updated_count} notifications as read',
             'updated_count': updated_count
@@ -84,10 +136,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_as_unread(self, request):
         """Mark all notifications as unread"""
-        updated_count = self.get_queryset().filter(is_read=True).update(
-            is_read=False,
-            read_at=None
-        )
+        with transaction.atomic():
+            updated_count = self.get_queryset().filter(is_read=True).update(
+                is_read=False,
+                read_at=None,
+                updated_at=timezone.now()
+            )
+            UnreadCounter.adjust(request.user.pk, notifications=updated_count)
         return Response({
             'message': f'Marked {updated_count} notifications as unread',
             'updated_count': updated_count
@@ -96,7 +151,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['delete'])
     def clear_all(self, request):
         """Delete all notifications for the user"""
-        deleted_count = self.get_queryset().delete()[0]
+        # Short batches keep row locks brief for users with many notifications
+        deleted_count = BatchDeleter(pause=0).delete(self.get_queryset())
         return Response({
             'message': f'Deleted {deleted_count} notifications',
             'deleted_count': deleted_count
@@ -111,12 +167,15 @@ class NotificationViewSet(viewsets.ModelViewSet):
         else:
             queryset = self.get_queryset()
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(queryset)
     
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Search notifications by title or message"""
+        """
+        Search notifications by title or message
+        
+        On PostgreSQL the substring match is served by trigram indexes.
+        """
         query = request.query_params.get('q', '')
         if query:
             queryset = self.get_queryset().filter(
@@ -125,5 +184,4 @@ class NotificationViewSet(viewsets.ModelViewSet):
         else:
             queryset = self.get_queryset()
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data) 
\ No newline at end of file
+        return self.paginated_response(queryset) 
\ No newline at end of file
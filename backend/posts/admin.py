@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Comment
+from .models import Post, Comment, PostDailyRollup
 
 
 @admin.register(Post)
@@ -8,6 +8,7 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ['category', 'status', 'created_at', 'author']
     search_fields = ['title', 'content', 'location', 'author__username']
     readonly_fields = ['created_at', 'updated_at', 'comment_count']
+    list_select_related = ['author']
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -26,10 +27,6 @@ class PostAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    
-    def comment_count(self, obj):
-        return obj.comment_count
-    comment_count.short_description = 'Comments'
 
 
 @admin.register(Comment)
@@ -38,6 +35,7 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ['created_at', 'author', 'post__category']
     search_fields = ['content', 'author__username', 'post__title']
     readonly_fields = ['created_at', 'updated_at', 'depth', 'reply_count']
+    list_select_related = ['author', 'post', 'parent']
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -60,11 +58,11 @@ class CommentAdmin(admin.ModelAdmin):
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content'
-    
-    def depth(self, obj):
-        return obj.depth
-    depth.short_description = 'Depth'
-    
-    def reply_count(self, obj):
-        return obj.reply_count
-    reply_count.short_description = 'Replies'
+
+
+@admin.register(PostDailyRollup)
+class PostDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'category', 'status', 'count']
+    list_filter = ['category', 'status']
+    date_hierarchy = 'date'
+    readonly_fields = ['date', 'category', 'status', 'count']
@@ -0,0 +1,77 @@
+from collections import defaultdict
+from django.conf import settings
+from localconnect_backend.pagination import KeysetPagination
+from .models import Comment
+
+
+class CommentTree:
+    """
+    The non-deleted comments of a post (or of the subtree below ``root``),
+    loaded in one query with their authors and linked into a tree in memory.
+
+    Replies are returned ``COMMENT_TREE_MAX_REPLIES`` per comment, down to
+    ``COMMENT_TREE_MAX_DEPTH`` levels below the starting point. Where replies
+    are cut off, the parent gets a ``more_replies`` cursor that continues them
+    through ``replies(comment_id, after=cursor)``. Replies of a deleted
+    comment are hidden along with it.
+    """
+
+    def __init__(self, post_id, max_depth=None, max_replies=None, root=None):
+        self.max_depth = settings.COMMENT_TREE_MAX_DEPTH if max_depth is None else max_depth
+        self.max_replies = settings.COMMENT_TREE_MAX_REPLIES if max_replies is None else max_replies
+        self.cursors = KeysetPagination()
+        self.by_id = {}
+        self.children = defaultdict(list)
+
+        comments = Comment.objects.filter(post_id=post_id, is_deleted=False)
+        self.cursors.fields = self.cursors.get_fields(comments)
+        if root is not None:
+            # Index range scan over the materialized path
+            comments = comments.filter(path__startswith=root.path)
+        for comment in comments.select_related('author').order_by('created_at', 'id'):
+            self.by_id[comment.id] = comment
+            self.children[comment.parent_id].append(comment)
+
+    def roots(self):
+        """Return the top-level comments with their reply trees attached"""
+        roots, _ = self._attach(None, self.max_depth, limit=None)
+        return roots
+
+    def replies(self, comment_id, after=None):
+        """
+        Return ``(replies, more_replies)`` for a comment, optionally
+        continuing from a ``more_replies`` cursor
+        """
+        comment = self.by_id.get(comment_id)
+        if comment is None:
+            return [], None
+        return self._attach(comment_id, comment.depth + 1 + self.max_depth, self.max_replies, after)
+
+    def subtree(self, comment_id):
+        """Return the comment with its reply tree attached, or None if it is not in the tree"""
+        comment = self.by_id.get(comment_id)
+        if comment is not None:
+            comment.tree_replies, comment.more_replies = self.replies(comment_id)
+        return comment
+
+    def _attach(self, parent_id, stop_depth, limit, after=None):
+        children = self.children.get(parent_id, [])
+        if after:
+            position = self._decode(after)
+            children = [child for child in children if (child.created_at, child.id) > position]
+        shown = children if limit is None else children[:limit]
+
+        for child in shown:
+            if child.depth >= stop_depth:
+                # Replies are created after their parent, so the parent's own
+                # position is a cursor to the start of its replies
+                child.tree_replies = []
+                child.more_replies = self.cursors.encode_cursor(child) if self.children.get(child.id) else None
+            else:
+                child.tree_replies, child.more_replies = self._attach(child.id, stop_depth, self.max_replies)
+
+        more = self.cursors.encode_cursor(shown[-1]) if len(shown) < len(children) else None
+        return shown, more
+
+    def _decode(self, cursor):
+        return tuple(self.cursors.decode_cursor(cursor))
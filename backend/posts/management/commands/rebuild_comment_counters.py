@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.models import Post, Comment
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.comment_count and Comment.reply_count from the comments table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int, action='append', dest='post_ids', help='Only rebuild this post (repeatable)')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        comments = Comment.objects.all()
+        if options['post_ids']:
+            posts = posts.filter(pk__in=options['post_ids'])
+            comments = comments.filter(post_id__in=options['post_ids'])
+
+        with transaction.atomic():
+            post_rows = Post.refresh_comment_counts(posts)
+            comment_rows = Comment.refresh_reply_counts(comments)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt comment counters for {post_rows} posts and {comment_rows} comments"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from posts.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the post full-text search index (search_vector on PostgreSQL)"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        rows = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt search index for {rows} posts with {type(backend).__name__}"
+        ))
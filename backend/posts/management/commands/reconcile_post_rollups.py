@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from posts.models import PostDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute PostDailyRollup buckets from the posts table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only reconcile the last N days (default: all days)')
+
+    def handle(self, *args, **options):
+        date_from = None
+        if options['days']:
+            date_from = timezone.localdate() - timedelta(days=options['days'] - 1)
+
+        buckets = PostDailyRollup.reconcile(date_from=date_from)
+
+        scope = f"the last {options['days']} days" if date_from else "all days"
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {buckets} post rollup buckets for {scope}"))
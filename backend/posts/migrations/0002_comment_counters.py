@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counters(apps, schema_editor):
+    """Count existing non-deleted comments per post and replies per comment"""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+
+    comments = Comment.objects.filter(
+        post=OuterRef('pk'), is_deleted=False
+    ).order_by().values('post').annotate(count=Count('pk')).values('count')
+    Post.objects.update(comment_count=Coalesce(Subquery(comments), 0))
+
+    replies = Comment.objects.filter(
+        parent=OuterRef('pk'), is_deleted=False
+    ).order_by().values('parent').annotate(count=Count('pk')).values('count')
+    Comment.objects.update(reply_count=Coalesce(Subquery(replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of non-deleted direct replies'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of non-deleted comments on this post'),
+        ),
+        migrations.RunPython(backfill_comment_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['comment_count'], name='posts_post_comment_27981d_idx'),
+        ),
+    ]
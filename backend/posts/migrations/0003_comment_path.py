@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+def backfill_comment_paths(apps, schema_editor):
+    """Compute path and depth for existing comments, one post at a time"""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+
+    for post_id in Post.objects.values_list('id', flat=True).iterator():
+        comments = {
+            comment.id: comment
+            for comment in Comment.objects.filter(post_id=post_id).only('id', 'parent')
+        }
+
+        def path_of(comment):
+            if not comment.path:
+                parent = comments.get(comment.parent_id)
+                prefix = path_of(parent) if parent is not None else ''
+                comment.path = f'{prefix}{comment.id:010d}/'
+                comment.depth = comment.path.count('/') - 1
+            return comment.path
+
+        for comment in comments.values():
+            path_of(comment)
+        Comment.objects.bulk_update(comments.values(), ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_comment_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Nesting level (0 for top-level comments)'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Thread path, e.g. 0000000001/0000000007/', max_length=1000),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
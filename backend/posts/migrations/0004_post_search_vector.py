@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:50
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index and initial vectors; other databases use the in-process index"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Post = apps.get_model('posts', 'Post')
+    posts = Post._meta.db_table
+    users = Post._meta.get_field('author').related_model._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX post_search_vector_idx ON {posts} USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        f"""
+        UPDATE {posts} SET search_vector =
+            setweight(to_tsvector('simple', coalesce({posts}.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce({posts}.content, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce({posts}.location, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce({posts}.category, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce({users}.username, '')), 'D')
+        FROM {users} WHERE {users}.id = {posts}.author_id
+        """
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS post_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_comment_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:56
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostDailyRollup = apps.get_model('posts', 'PostDailyRollup')
+    counts = Post.objects.filter(is_deleted=False).annotate(
+        date=TruncDate('created_at')
+    ).order_by().values('date', 'category', 'status').annotate(count=Count('pk'))
+    PostDailyRollup.objects.bulk_create([PostDailyRollup(**row) for row in counts], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Creation date of the posts (in TIME_ZONE)')),
+                ('category', models.CharField(choices=[('GENERAL', 'General'), ('FOOD', 'Food & Groceries'), ('TRANSPORT', 'Transportation'), ('MEDICAL', 'Medical & Health'), ('EDUCATION', 'Education'), ('TECHNOLOGY', 'Technology'), ('OTHER', 'Other')], max_length=20)),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('IN_PROGRESS', 'In Progress'), ('CLOSED', 'Closed'), ('RESOLVED', 'Resolved')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Post daily rollup',
+                'verbose_name_plural': 'Post daily rollups',
+                'ordering': ['date', 'category', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'category', 'status'), name='post_rollup_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
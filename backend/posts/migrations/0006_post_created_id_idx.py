@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_daily_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at', 'id'], name='post_created_id_idx'),
+        ),
+    ]
@@ -1,14 +1,22 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr, TruncDate
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinLengthValidator
 from django.utils import timezone
+from localconnect_backend.tracking import DirtyFieldsMixin, exclude_maintained_fields
 
 User = get_user_model()
 
-class Post(models.Model):
+
+class Post(DirtyFieldsMixin, models.Model):
     """
     Post model for help requests and community posts
     """
+    # Snapshotted for statistics rollups and status change events (posts.signals)
+    tracked_fields = ('is_deleted', 'created_at', 'category', 'status')
+    
     class Category(models.TextChoices):
         GENERAL = 'GENERAL', 'General'
         FOOD = 'FOOD', 'Food & Groceries'
@@ -70,6 +78,19 @@ class Post(models.Model):
         help_text="Soft delete flag"
     )
     
+    # Denormalized counters (maintained by posts.signals)
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of non-deleted comments on this post"
+    )
+    
+    # Weighted full-text document (maintained by posts.search on PostgreSQL)
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -83,34 +104,60 @@ class Post(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['author']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['comment_count']),
+            # Keyset pagination of the feed
+            models.Index(fields=['created_at', 'id'], name='post_created_id_idx'),
         ]
     
     def __str__(self):
         return f"{self.title} by {self.author.username}"
     
-    @property
-    def comment_count(self):
-        """Get the number of comments on this post"""
-        return self.comments.filter(is_deleted=False).count()
+    def save(self, *args, **kwargs):
+        """Save the post and its statistics rollup updates (posts.signals) atomically"""
+        exclude_maintained_fields(self, kwargs, ['comment_count', 'search_vector'])
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    @classmethod
+    def refresh_comment_counts(cls, queryset=None):
+        """Recompute ``comment_count`` from the comments table"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        counts = Comment.objects.filter(
+            post=OuterRef('pk'),
+            is_deleted=False
+        ).order_by().values('post').annotate(count=Count('pk')).values('count')
+        return queryset.update(comment_count=Coalesce(Subquery(counts), 0))
     
     def soft_delete(self):
         """Soft delete the post"""
         self.is_deleted = True
-        self.save(update_fields=['is_deleted'])
+        self.save(update_fields=['is_deleted', 'updated_at'])
     
     def can_be_edited_by(self, user):
         """Check if user can edit this post"""
-        return user == self.author or user.is_admin
+        return self.editable_by(user, self.author_id)
     
     def can_be_deleted_by(self, user):
         """Check if user can delete this post"""
-        return user == self.author or user.is_admin
+        return self.deletable_by(user, self.author_id)
+    
+    @staticmethod
+    def editable_by(user, author_id):
+        """Edit rule by author id, for serialized posts that are not loaded as models"""
+        return user.pk == author_id or user.is_admin
+    
+    @staticmethod
+    def deletable_by(user, author_id):
+        return user.pk == author_id or user.is_admin
 
 
-class Comment(models.Model):
+class Comment(DirtyFieldsMixin, models.Model):
     """
     Comment model for posts with threading support
     """
+    # Snapshotted for the denormalized counters (posts.signals)
+    tracked_fields = ('is_deleted', 'post', 'parent')
+    
     # Content
     content = models.TextField(
         validators=[MinLengthValidator(1)],
@@ -147,6 +194,28 @@ class Comment(models.Model):
         help_text="Soft delete flag"
     )
     
+    # Denormalized counters (maintained by posts.signals)
+    reply_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of non-deleted direct replies"
+    )
+    
+    # Materialized path: zero-padded ids of the ancestors and the comment itself
+    path = models.CharField(
+        max_length=1000,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Thread path, e.g. 0000000001/0000000007/"
+    )
+    
+    depth = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Nesting level (0 for top-level comments)"
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -165,30 +234,184 @@ class Comment(models.Model):
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
     
-    @property
-    def reply_count(self):
-        """Get the number of replies to this comment"""
-        return self.replies.filter(is_deleted=False).count()
+    PATH_SEGMENT_WIDTH = 10
+    # Deepest nesting level whose path still fits the column
+    MAX_DEPTH = path.max_length // (PATH_SEGMENT_WIDTH + 1) - 1
+    
+    @classmethod
+    def path_segment(cls, comment_id):
+        return f'{comment_id:0{cls.PATH_SEGMENT_WIDTH}d}/'
+    
+    def save(self, *args, **kwargs):
+        """
+        Save the comment and its counter updates (posts.signals) atomically
+        
+        New comments get their path and depth; moving a comment to another
+        parent rewrites the paths of its whole subtree.
+        """
+        exclude_maintained_fields(self, kwargs, ['reply_count', 'path', 'depth'])
+        with transaction.atomic():
+            if self._state.adding:
+                parent_path = self._parent_path()
+                self.depth = parent_path.count('/')
+                if self.depth > self.MAX_DEPTH:
+                    raise ValueError(f"Comments can be nested at most {self.MAX_DEPTH} levels deep")
+                super().save(*args, **kwargs)
+                self.path = parent_path + self.path_segment(self.pk)
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+                return
+            
+            update_fields = kwargs.get('update_fields')
+            if self.path and (update_fields is None or 'parent' in update_fields) and self.parent_moved():
+                self.move_subtree()
+            super().save(*args, **kwargs)
+    
+    def _parent_path(self):
+        if self.parent_id is None:
+            return ''
+        return Comment.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
     
     @property
-    def depth(self):
-        """Get the depth of this comment in the thread"""
-        depth = 0
-        parent = self.parent
-        while parent:
-            depth += 1
-            parent = parent.parent
-        return depth
+    def ancestor_ids(self):
+        """Ids of the ancestors, from the top-level comment down"""
+        return [int(segment) for segment in self.path.split('/')[:-2]]
+    
+    def parent_moved(self):
+        """Whether ``parent`` no longer matches the stored path"""
+        ancestors = self.ancestor_ids
+        return (ancestors[-1] if ancestors else None) != self.parent_id
+    
+    def move_subtree(self):
+        """Rewrite path and depth of this comment and its descendants for a new parent"""
+        old_path = self.path
+        new_path = self._parent_path() + self.path_segment(self.pk)
+        if new_path.startswith(old_path):
+            raise ValueError("A comment cannot be moved below its own replies")
+        
+        delta = new_path.count('/') - old_path.count('/')
+        if delta > 0 and self.depth + delta + self.subtree_height() > self.MAX_DEPTH:
+            raise ValueError(f"Comments can be nested at most {self.MAX_DEPTH} levels deep")
+        Comment.objects.filter(path__startswith=old_path).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + delta
+        )
+        self.path = new_path
+        self.depth += delta
+    
+    def subtree_height(self):
+        """Levels of replies below this comment (0 for a new comment or a leaf)"""
+        if not self.path:
+            return 0
+        deepest = Comment.objects.filter(path__startswith=self.path).aggregate(depth=Max('depth'))['depth']
+        return deepest - self.depth
+    
+    def ancestors(self):
+        """Ancestors of this comment, top-level first"""
+        return Comment.objects.filter(pk__in=self.ancestor_ids).order_by('depth')
+    
+    def descendants(self):
+        """All replies below this comment, in thread order (one index range scan)"""
+        return Comment.objects.filter(path__startswith=self.path).exclude(pk=self.pk).order_by('path')
+    
+    @classmethod
+    def refresh_reply_counts(cls, queryset=None):
+        """Recompute ``reply_count`` from the comments table"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        counts = cls.objects.filter(
+            parent=OuterRef('pk'),
+            is_deleted=False
+        ).order_by().values('parent').annotate(count=Count('pk')).values('count')
+        return queryset.update(reply_count=Coalesce(Subquery(counts), 0))
     
     def soft_delete(self):
         """Soft delete the comment"""
         self.is_deleted = True
-        self.save(update_fields=['is_deleted'])
+        self.save(update_fields=['is_deleted', 'updated_at'])
     
     def can_be_edited_by(self, user):
         """Check if user can edit this comment"""
-        return user == self.author or user.is_admin
+        return self.editable_by(user, self.author_id)
     
     def can_be_deleted_by(self, user):
         """Check if user can delete this comment"""
-        return user == self.author or user.is_admin or user.can_moderate_posts()
+        return self.deletable_by(user, self.author_id)
+    
+    @staticmethod
+    def editable_by(user, author_id):
+        """Edit rule by author id, for serialized comments that are not loaded as models"""
+        return user.pk == author_id or user.is_admin
+    
+    @staticmethod
+    def deletable_by(user, author_id):
+        return user.pk == author_id or user.is_admin or user.can_moderate_posts()
+
+
+class PostDailyRollup(models.Model):
+    """
+    Number of non-deleted posts created on a day, per category and status
+    
+    Maintained incrementally by posts.signals and reconciled against the
+    posts table by ``reconcile_post_rollups``; post statistics read only
+    these rows.
+    """
+    date = models.DateField(help_text="Creation date of the posts (in TIME_ZONE)")
+    category = models.CharField(max_length=20, choices=Post.Category.choices)
+    status = models.CharField(max_length=20, choices=Post.Status.choices)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Post daily rollup"
+        verbose_name_plural = "Post daily rollups"
+        ordering = ['date', 'category', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category', 'status'], name='post_rollup_unique_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.category}/{self.status}: {self.count}"
+    
+    @classmethod
+    def adjust(cls, date, category, status, delta):
+        """
+        Add ``delta`` to a bucket, creating it on first use
+        
+        A decrement the bucket cannot cover means it has drifted from the
+        posts table (rows written without signals); the day is reconciled
+        instead of letting the count go negative.
+        """
+        bucket = cls.objects.filter(date=date, category=category, status=status)
+        if delta < 0:
+            if not bucket.filter(count__gte=-delta).update(count=F('count') + delta):
+                cls.reconcile(date, date)
+            return
+        if bucket.update(count=F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(date=date, category=category, status=status, count=delta)
+        except IntegrityError:
+            # Created concurrently
+            bucket.update(count=F('count') + delta)
+    
+    @classmethod
+    def reconcile(cls, date_from=None, date_to=None):
+        """
+        Recompute the buckets of a date range (inclusive, open ended when
+        None) from the posts table; returns the number of buckets written
+        """
+        posts = Post.objects.filter(is_deleted=False).annotate(date=TruncDate('created_at'))
+        buckets = cls.objects.all()
+        if date_from is not None:
+            posts = posts.filter(date__gte=date_from)
+            buckets = buckets.filter(date__gte=date_from)
+        if date_to is not None:
+            posts = posts.filter(date__lte=date_to)
+            buckets = buckets.filter(date__lte=date_to)
+        
+        counts = posts.order_by().values('date', 'category', 'status').annotate(count=Count('pk'))
+        with transaction.atomic():
+            # Lock the range so incremental updates wait for the rewrite
+            list(buckets.select_for_update().values_list('pk', flat=True))
+            buckets.delete()
+            cls.objects.bulk_create([cls(**row) for row in counts], batch_size=1000)
+        return len(counts)
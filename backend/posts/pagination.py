@@ -0,0 +1,44 @@
+from rest_framework.exceptions import NotFound, ParseError
+from localconnect_backend.pagination import FeedKeysetPagination
+
+
+class PostCursorPagination(FeedKeysetPagination):
+    """
+    Opt-in keyset pages for the posts feed (``?pagination=cursor``)
+
+    Pages follow whatever ordering the filters left on the queryset
+    (``-created_at`` by default, any of the view's ``ordering_fields`` or
+    search rank), with ``id`` added as a tie-breaker. No COUNT query is run
+    and deep pages cost the same as the first. Cursors carry their
+    ordering, so a cursor from another ordering is rejected.
+    """
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(field, str) and field != '?' for field in ordering):
+            # Cursors can only hold the values of named fields and annotations
+            raise ParseError('This ordering is not supported with cursor pagination')
+        ordering = [field.replace('pk', 'id') if field.lstrip('-') == 'pk' else field for field in ordering]
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            # Unique tie-breaker, in the direction of the primary ordering
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return tuple(ordering)
+
+    def encode_cursor(self, instance):
+        """Like the base cursor, with the ordering it belongs to as the first value"""
+        return self.dump_cursor([','.join(self.ordering)] + self.cursor_values(instance))
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        ordering, *values = self.load_cursor(cursor) or [None]
+        if ordering != ','.join(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return self.parse_values(values)
@@ -0,0 +1,110 @@
+"""
+Versioned response cache for the posts list and detail endpoints
+
+Bodies are cached under the request's path and normalized query string plus
+the current version of each namespace they depend on: ``posts`` for lists
+and ``post:<id>`` for a post's detail (which embeds its comments).
+``posts.signals`` bumps the versions after Post and Comment writes commit,
+so stale bodies are never read again and simply expire.
+
+Cached bodies are shared by all users: the per-user ``can_edit`` and
+``can_delete`` flags are filled in on every response from the author ids in
+the body (see ``apply_permissions``).
+
+``POSTS_RESPONSE_CACHE_ALIAS`` picks the Django cache: the per-process
+``default`` (local memory, also used by tests) or ``shared`` (Redis) when
+several workers serve the API. Lookups are counted as
+``posts.response_cache.hit`` and ``.miss`` in ``localconnect_backend.metrics``.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from localconnect_backend import metrics
+from .models import Comment, Post
+
+
+class ResponseCache:
+    def __init__(self, alias=None, ttl=None):
+        self.cache = caches[settings.POSTS_RESPONSE_CACHE_ALIAS if alias is None else alias]
+        self.ttl = settings.POSTS_RESPONSE_CACHE_TTL_SECONDS if ttl is None else ttl
+
+    @staticmethod
+    def _version_key(namespace):
+        return f'posts:response:version:{namespace}'
+
+    @staticmethod
+    def _initial_version():
+        # Never reuse a version after the counter is evicted
+        return time.time_ns() // 1000
+
+    def versions(self, namespaces):
+        keys = [self._version_key(namespace) for namespace in namespaces]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.cache.add(key, self._initial_version(), None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+    def bump(self, *namespaces):
+        """Invalidate every body cached under these namespaces"""
+        for namespace in namespaces:
+            key = self._version_key(namespace)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, self._initial_version(), None)
+
+    def key(self, request, namespaces):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        )
+        # Pagination links are absolute, so the host is part of the body
+        signature = repr((request.get_host(), request.path, params, self.versions(namespaces)))
+        return 'posts:response:' + hashlib.sha256(signature.encode()).hexdigest()
+
+    def get(self, key):
+        data = self.cache.get(key)
+        metrics.incr('posts.response_cache.hit' if data is not None else 'posts.response_cache.miss')
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.ttl)
+
+
+def apply_permissions(data, user):
+    """Set ``can_edit``/``can_delete`` for ``user`` on serialized posts and their comments"""
+    if isinstance(data, dict) and 'results' in data:
+        data = data['results']
+    for post in data if isinstance(data, list) else [data]:
+        _set_flags(post, Post, user)
+        for comment in post.get('comments', ()):
+            _apply_comment_permissions(comment, user)
+    return data
+
+
+def _apply_comment_permissions(comment, user):
+    _set_flags(comment, Comment, user)
+    for reply in comment.get('replies', ()):
+        _apply_comment_permissions(reply, user)
+
+
+def _set_flags(item, model, user):
+    author_id = item['author']['id']
+    authenticated = user.is_authenticated
+    item['can_edit'] = authenticated and model.editable_by(user, author_id)
+    item['can_delete'] = authenticated and model.deletable_by(user, author_id)
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """Return the process-wide posts response cache"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
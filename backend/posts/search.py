@@ -0,0 +1,281 @@
+"""
+Full-text search for posts
+
+On PostgreSQL posts carry a ``search_vector`` column (weighted tsvector,
+GIN-indexed) that is refreshed from ``posts.signals`` on every save; queries
+are matched with ``@@``, ranked with ``ts_rank`` and highlighted with
+``ts_headline``. Other databases (SQLite in tests and local development) use
+an in-process inverted index with the same tokenization, prefix matching and
+field weights.
+
+Weights: title A, content B, location and category C, author username D.
+Terms are OR-ed and each matches words starting with it.
+"""
+import bisect
+import json
+import re
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from rest_framework.filters import OrderingFilter
+from .models import Post
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TERMS = 10
+
+# Field weights and their ts_rank default values
+SEARCH_FIELDS = (('title', 'A'), ('content', 'B'), ('location', 'C'), ('category', 'C'), ('author__username', 'D'))
+WEIGHT_VALUES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+INDEXED_FIELDS = {'title', 'content', 'location', 'category', 'author'}
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+HEADLINE_WORDS = 35
+
+
+def search_terms(query):
+    """Lowercased word terms of a search query, as the 'simple' text search config splits them"""
+    return [term.lower() for term in TOKEN_PATTERN.findall(query or '')][:MAX_TERMS]
+
+
+class PostgresSearchBackend:
+    """tsvector/GIN search with ts_rank ordering and ts_headline snippets"""
+    config = 'simple'
+
+    def vector(self):
+        username = Subquery(
+            get_user_model().objects.filter(pk=OuterRef('author_id')).values('username')[:1]
+        )
+        vector = None
+        for field, weight in SEARCH_FIELDS:
+            source = username if field == 'author__username' else field
+            part = SearchVector(source, weight=weight, config=self.config)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def tsquery(self, terms):
+        return SearchQuery(' | '.join(f'{term}:*' for term in terms), search_type='raw', config=self.config)
+
+    def index(self, post):
+        Post.objects.filter(pk=post.pk).update(search_vector=self.vector())
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self):
+        return Post.objects.update(search_vector=self.vector())
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        tsquery = self.tsquery(terms)
+        # ts_rank returns real; as double precision the rank in a cursor
+        # compares equal to the stored value when it comes back
+        return queryset.filter(search_vector=tsquery).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), tsquery), FloatField())
+        )
+
+    def highlights(self, posts, query):
+        """``{post_id: {'title': html, 'content': html}}`` for one page of results"""
+        terms = search_terms(query)
+        if not terms or not posts:
+            return {}
+        tsquery = self.tsquery(terms)
+        options = {'config': self.config, 'start_sel': HIGHLIGHT_START, 'stop_sel': HIGHLIGHT_STOP}
+        rows = Post.objects.filter(pk__in=[post.pk for post in posts]).annotate(
+            title_headline=SearchHeadline('title', tsquery, highlight_all=True, **options),
+            content_headline=SearchHeadline(
+                'content', tsquery, max_words=HEADLINE_WORDS, min_words=HEADLINE_WORDS // 2, **options
+            )
+        ).values_list('pk', 'title_headline', 'content_headline')
+        return {pk: {'title': title, 'content': content} for pk, title, content in rows}
+
+
+class InvertedIndexSearchBackend:
+    """
+    In-process inverted index for databases without full-text search.
+
+    Built from the database on first use and kept current by the same
+    signals that refresh the Postgres column. Tokens are kept sorted so a
+    prefix term is a bisect range.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)   # token -> {post_id: score}
+        self._documents = {}                 # post_id -> tokens
+        self._tokens = []
+        self._built = False
+        self._lock = threading.RLock()
+
+    def _fields(self):
+        return [field for field, _ in SEARCH_FIELDS]
+
+    def _add(self, row):
+        scores = defaultdict(float)
+        for field, weight in SEARCH_FIELDS:
+            for token in search_terms(row[field]):
+                scores[token] += WEIGHT_VALUES[weight]
+        post_id = row['pk']
+        self._documents[post_id] = set(scores)
+        for token, score in scores.items():
+            if token not in self._postings:
+                bisect.insort(self._tokens, token)
+            self._postings[token][post_id] = score
+
+    def _discard(self, post_id):
+        for token in self._documents.pop(post_id, ()):
+            postings = self._postings[token]
+            postings.pop(post_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._tokens = []
+            for row in Post.objects.values('pk', *self._fields()).iterator():
+                self._add(row)
+            self._built = True
+            return len(self._documents)
+
+    def index(self, post):
+        # Applied after commit so rolled-back saves never reach the index
+        transaction.on_commit(lambda: self._reindex(post.pk))
+
+    def remove(self, post_id):
+        transaction.on_commit(lambda: self._reindex(post_id))
+
+    def _reindex(self, post_id):
+        with self._lock:
+            if not self._built:
+                return
+            self._discard(post_id)
+            row = Post.objects.filter(pk=post_id).values('pk', *self._fields()).first()
+            if row is not None:
+                self._add(row)
+
+    def scores(self, terms):
+        """``{post_id: rank}`` of posts matching any term as a word prefix"""
+        with self._lock:
+            self._ensure_built()
+            scores = defaultdict(float)
+            for term in terms:
+                position = bisect.bisect_left(self._tokens, term)
+                while position < len(self._tokens) and self._tokens[position].startswith(term):
+                    for post_id, score in self._postings[self._tokens[position]].items():
+                        scores[post_id] += score
+                    position += 1
+            return scores
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        scores = self.scores(terms)
+        if not scores:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        # Scores are sums of a few field weights, so posts share a handful
+        # of distinct ranks; each rank is one membership test
+        ranks = defaultdict(list)
+        for post_id, score in scores.items():
+            ranks[score].append(post_id)
+        vendor = connections[queryset.db].vendor
+        return queryset.filter(pk__in=self._id_set(list(scores), vendor)).annotate(
+            search_rank=Case(
+                *[When(pk__in=self._id_set(post_ids, vendor), then=Value(score)) for score, post_ids in ranks.items()],
+                default=Value(0.0),
+                output_field=FloatField()
+            )
+        )
+
+    def _id_set(self, post_ids, vendor):
+        """
+        Post ids for an ``__in`` lookup. SQLite gets them as one JSON array
+        parameter (parsed once by json_each) to stay within its bound
+        variable limit; other databases take the plain list.
+        """
+        if vendor == 'sqlite':
+            return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(post_ids),))
+        return post_ids
+
+    def highlights(self, posts, query):
+        terms = search_terms(query)
+        if not terms:
+            return {}
+        return {
+            post.pk: {
+                'title': headline(post.title, terms, highlight_all=True),
+                'content': headline(post.content, terms)
+            }
+            for post in posts
+        }
+
+
+def headline(text, terms, highlight_all=False, max_words=HEADLINE_WORDS):
+    """Escape ``text`` and mark words matching ``terms``, trimmed around the first match"""
+
+    def matches(token):
+        return any(token.lower().startswith(term) for term in terms)
+
+    words = (text or '').split()
+    if not highlight_all and len(words) > max_words:
+        first = next(
+            (index for index, word in enumerate(words) if any(matches(token) for token in TOKEN_PATTERN.findall(word))),
+            0
+        )
+        start = max(min(first - max_words // 3, len(words) - max_words), 0)
+        words = words[start:start + max_words]
+    text, parts, position = ' '.join(words), [], 0
+    for match in TOKEN_PATTERN.finditer(text):
+        if matches(match.group()):
+            parts.append(escape(text[position:match.start()]))
+            parts.append(f'{HIGHLIGHT_START}{escape(match.group())}{HIGHLIGHT_STOP}')
+            position = match.end()
+    parts.append(escape(text[position:]))
+    return ''.join(parts)
+
+
+class SearchRankOrderingFilter(OrderingFilter):
+    """
+    Ordering filter that sorts search results by relevance unless the client
+    asks for another ordering (``?ordering=rank`` is accepted too)
+    """
+
+    def get_default_ordering(self, view):
+        if search_terms(view.request.query_params.get('search')):
+            return ['-search_rank', '-created_at']
+        return super().get_default_ordering(view)
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        has_rank = 'search_rank' in queryset.query.annotations
+        rank_fields = [field.replace('rank', 'search_rank') for field in fields if field.lstrip('-') == 'rank']
+        valid = super().remove_invalid_fields(queryset, fields, view, request)
+        return (rank_fields if has_rank else []) + valid
+
+
+_backends = {}
+
+
+def get_search_backend():
+    """Return the search backend for the default database"""
+    path = settings.POSTS_SEARCH_BACKEND
+    if not path:
+        path = 'posts.search.PostgresSearchBackend' if connection.vendor == 'postgresql' else 'posts.search.InvertedIndexSearchBackend'
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
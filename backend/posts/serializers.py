@@ -1,10 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from .comment_tree import CommentTree
 from .models import Post, Comment
 
 User = get_user_model()
 
 
+def validate_comment_depth(parent, comment=None):
+    """Reject a parent that would nest ``comment`` and its replies beyond ``Comment.MAX_DEPTH``"""
+    height = comment.subtree_height() if comment is not None else 0
+    if parent is not None and parent.depth + 1 + height > Comment.MAX_DEPTH:
+        raise serializers.ValidationError(f"Comments can be nested at most {Comment.MAX_DEPTH} levels deep")
+    return parent
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user information in posts and comments"""
     class Meta:
@@ -13,9 +22,15 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class CommentSerializer(serializers.ModelSerializer):
-    """Serializer for comments with nested replies"""
+    """
+    Serializer for comments with nested replies
+    
+    Replies come from a ``CommentTree`` per post, shared through the
+    serializer context, so a whole thread is loaded with one query.
+    """
     author = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField()
     reply_count = serializers.ReadOnlyField()
     depth = serializers.ReadOnlyField()
     can_edit = serializers.SerializerMethodField()
@@ -25,16 +40,31 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = [
             'id', 'content', 'author', 'post', 'parent',
-            'created_at', 'updated_at', 'replies', 'reply_count',
+            'created_at', 'updated_at', 'replies', 'more_replies', 'reply_count',
             'depth', 'can_edit', 'can_delete'
         ]
         read_only_fields = ['author', 'created_at', 'updated_at', 'replies', 'reply_count', 'depth']
     
+    def get_tree(self, obj):
+        """Return the comment tree of the comment's post, built once per request"""
+        trees = self.context.setdefault('comment_trees', {})
+        if obj.post_id not in trees:
+            trees[obj.post_id] = CommentTree(obj.post_id)
+        return trees[obj.post_id]
+    
+    def attach_replies(self, obj):
+        if not hasattr(obj, 'tree_replies'):
+            obj.tree_replies, obj.more_replies = self.get_tree(obj).replies(obj.id)
+    
     def get_replies(self, obj):
         """Get nested replies for this comment"""
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.filter(is_deleted=False), many=True, context=self.context).data
-        return []
+        self.attach_replies(obj)
+        return CommentSerializer(obj.tree_replies, many=True, context=self.context).data
+    
+    def get_more_replies(self, obj):
+        """Cursor for replies left out of this response, if any"""
+        self.attach_replies(obj)
+        return obj.more_replies
     
     def get_can_edit(self, obj):
         """Check if current user can edit this comment"""
@@ -50,6 +80,9 @@ class CommentSerializer(serializers.ModelSerializer):
             return obj.can_be_deleted_by(request.user)
         return False
     
+    def validate_parent(self, parent):
+        return validate_comment_depth(parent, self.instance)
+    
     def create(self, validated_data):
         """Create a new comment with the current user as author"""
         request = self.context.get('request')
@@ -76,9 +109,10 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'created_at', 'updated_at', 'comments', 'comment_count']
     
     def get_comments(self, obj):
-        """Get top-level comments for this post"""
-        top_level_comments = obj.comments.filter(is_deleted=False, parent=None)
-        return CommentSerializer(top_level_comments, many=True, context=self.context).data
+        """Get top-level comments for this post with their reply trees"""
+        tree = CommentTree(obj.id)
+        self.context.setdefault('comment_trees', {})[obj.id] = tree
+        return CommentSerializer(tree.roots(), many=True, context=self.context).data
     
     def get_can_edit(self, obj):
         """Check if current user can edit this post"""
@@ -106,6 +140,7 @@ class PostListSerializer(serializers.ModelSerializer):
     """Simplified serializer for post listings"""
     author = UserSerializer(read_only=True)
     comment_count = serializers.ReadOnlyField()
+    search_highlight = serializers.SerializerMethodField()
     can_edit = serializers.SerializerMethodField()
     can_delete = serializers.SerializerMethodField()
     
@@ -113,10 +148,14 @@ class PostListSerializer(serializers.ModelSerializer):
         model = Post
         fields = [
             'id', 'title', 'category', 'location', 'status',
-            'author', 'created_at', 'comment_count', 'can_edit', 'can_delete'
+            'author', 'created_at', 'comment_count', 'search_highlight', 'can_edit', 'can_delete'
         ]
         read_only_fields = ['author', 'created_at', 'comment_count']
     
+    def get_search_highlight(self, obj):
+        """Title and content snippets with matched terms in <mark>, when listing search results"""
+        return getattr(obj, 'search_highlight', None)
+    
     def get_can_edit(self, obj):
         """Check if current user can edit this post"""
         request = self.context.get('request')
@@ -152,6 +191,9 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ['content', 'post', 'parent']
     
+    def validate_parent(self, parent):
+        return validate_comment_depth(parent)
+    
     def create(self, validated_data):
         """Create a new comment with the current user as author"""
         request = self.context.get('request')
@@ -1,6 +1,149 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Post, Comment
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from .models import Post, Comment, PostDailyRollup
+from .response_cache import get_response_cache
+from .search import INDEXED_FIELDS, get_search_backend
+from .suggestions import get_suggestion_index
+
+# Sent inside Post.save's transaction when a saved post's status changed,
+# with ``post``, ``old_status`` and ``new_status``
+post_status_changed = Signal()
+
+
+def comment_counter_key(values):
+    """
+    What a comment contributes to the denormalized counters, from its field
+    values (``comment.__dict__`` or ``comment.loaded_values``): whether it
+    is counted (not soft deleted), and the post and parent it is counted on.
+    None when a field was deferred and the state is unknown.
+    """
+    if not all(field in values for field in ('is_deleted', 'post_id', 'parent_id')):
+        return None
+    return (not values['is_deleted'], values['post_id'], values['parent_id'])
+
+
+def adjust_comment_counters(post_id, parent_id, delta):
+    Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') + delta)
+    if parent_id is not None:
+        Comment.objects.filter(pk=parent_id).update(reply_count=F('reply_count') + delta)
+    transaction.on_commit(lambda: get_suggestion_index().adjust_popularity(post_id, delta))
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_counters(sender, instance, created, **kwargs):
+    """
+    Keep Post.comment_count and Comment.reply_count in step with comment
+    creation, soft deletion and restoration
+    
+    Runs inside Comment.save's transaction, so counters commit with the row.
+    """
+    old = (False, None, None) if created else comment_counter_key(instance.loaded_values)
+    new = comment_counter_key(instance.__dict__)
+    if old is None or new is None:
+        # Unknown previous state: recount what this comment can affect
+        Post.refresh_comment_counts(Post.objects.filter(pk=instance.post_id))
+        if instance.parent_id is not None:
+            Comment.refresh_reply_counts(Comment.objects.filter(pk=instance.parent_id))
+    elif old != new:
+        if old[0]:
+            adjust_comment_counters(old[1], old[2], -1)
+        if new[0]:
+            adjust_comment_counters(new[1], new[2], 1)
+
+
+@receiver(post_delete, sender=Comment)
+def release_comment_counters(sender, instance, **kwargs):
+    """Decrement counters when a counted comment is hard deleted"""
+    key = comment_counter_key(instance.__dict__)
+    if key is not None and key[0]:
+        adjust_comment_counters(key[1], key[2], -1)
+
+
+def post_rollup_key(values):
+    """
+    The statistics bucket a post is counted in, from its field values:
+    whether it is counted (not soft deleted), its creation date, category
+    and status. None when a field was deferred and the state is unknown.
+    """
+    if not all(values.get(field) is not None for field in ('is_deleted', 'created_at', 'category', 'status')):
+        return None
+    return (not values['is_deleted'], timezone.localdate(values['created_at']), values['category'], values['status'])
+
+
+@receiver(post_save, sender=Post)
+def update_post_rollups(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Move the post between PostDailyRollup buckets on creation, status or
+    category changes, soft deletion and restoration
+    
+    Runs inside Post.save's transaction. Only fields in ``update_fields`` are
+    taken as written. When the previous state is unknown the post's day is
+    reconciled instead.
+    """
+    old = (False, None, None, None) if created else post_rollup_key(instance.loaded_values)
+    values = instance.__dict__
+    if update_fields is not None:
+        values = {**instance.loaded_values, **{field: values[field] for field in update_fields if field in values}}
+    new = post_rollup_key(values)
+    if old is None or new is None:
+        day = timezone.localdate(Post.objects.filter(pk=instance.pk).values_list('created_at', flat=True).get())
+        PostDailyRollup.reconcile(day, day)
+    elif old != new:
+        if old[0]:
+            PostDailyRollup.adjust(old[1], old[2], old[3], -1)
+        if new[0]:
+            PostDailyRollup.adjust(new[1], new[2], new[3], 1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    """Refresh the post's search document when an indexed field may have changed"""
+    if update_fields is None or INDEXED_FIELDS.intersection(update_fields):
+        get_search_backend().index(instance)
+
+
+@receiver(post_save, sender=Post)
+def update_post_suggestions(sender, instance, **kwargs):
+    """Keep search suggestions in step with post edits and soft deletion"""
+    transaction.on_commit(lambda: get_suggestion_index().update(instance))
+
+
+@receiver(post_delete, sender=Post)
+def release_post_rollup(sender, instance, **kwargs):
+    """Take a hard-deleted post out of its statistics bucket"""
+    key = post_rollup_key(instance.__dict__)
+    if key is not None and key[0]:
+        PostDailyRollup.adjust(key[1], key[2], key[3], -1)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+    transaction.on_commit(lambda: get_suggestion_index().remove(instance.pk))
+
+
+def expire_responses(*namespaces):
+    response_cache = get_response_cache()
+    response_cache.bump(*namespaces)
+    # Again after commit, in case the old state was re-cached in the meantime
+    transaction.on_commit(lambda: response_cache.bump(*namespaces))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def expire_post_responses(sender, instance, **kwargs):
+    """Retire cached post lists and this post's detail"""
+    expire_responses('posts', f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_comment_responses(sender, instance, **kwargs):
+    """Comments change their post's detail and its comment_count in lists"""
+    expire_responses('posts', f'post:{instance.post_id}')
 
 
 @receiver(post_save, sender=Comment)
@@ -34,21 +177,25 @@ def create_reply_notification(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=Post)
-def create_post_status_notification(sender, instance, **kwargs):
+def emit_post_status_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Send post_status_changed when a save changed the status (no query needed)"""
+    if created or (update_fields is not None and 'status' not in update_fields):
+        return
+    old_status = instance.get_dirty_fields().get('status')
+    if old_status is not None:
+        post_status_changed.send(
+            sender=Post, post=instance, old_status=old_status, new_status=instance.status
+        )
+
+
+@receiver(post_status_changed)
+def create_post_status_notification(sender, post, old_status, new_status, **kwargs):
     """
     Create notification when post status changes
     """
-    if instance.pk:  # Only for existing posts
-        try:
-            from notifications.models import Notification
-            # Get the old status from the database
-            old_instance = Post.objects.get(pk=instance.pk)
-            if old_instance.status != instance.status:
-                Notification.create_post_status_notification(
-                    instance, 
-                    old_instance.status, 
-                    instance.status
-                )
-        except (ImportError, Post.DoesNotExist):
-            # Notifications app not available or post doesn't exist
-            pass 
\ No newline at end of file
+    try:
+        from notifications.models import Notification
+        Notification.create_post_status_notification(post, old_status, new_status)
+    except ImportError:
+        # Notifications app not available
+        pass
@@ -0,0 +1,266 @@
+"""
+In-memory prefix index behind ``PostViewSet.search_suggestions``
+
+Titles, locations and categories of visible posts are kept as phrases in a
+sorted array of search keys (the phrase from each of its first words on),
+so a keystroke is a bisect plus a short range scan with no database access.
+Short prefixes that match many phrases are answered from a second array of
+phrases ordered by score instead, stopping as soon as enough are found.
+Titles, locations and categories have separate arrays.
+
+A phrase is ranked by its best post, where a post scores
+``log(1 + comment_count) + age decay``; the decay is folded into the
+creation timestamp so scores never need recomputing as time passes.
+
+The index is built when the server starts (see ``warm``), follows post
+saves and comment counters in this process, and is rebuilt in the
+background every ``POSTS_SUGGESTIONS_REFRESH_SECONDS`` to pick up changes
+made by other processes.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Kinds of phrase and how many of each a response may hold
+SUGGESTION_KINDS = (('title', 5), ('category', 3), ('location', 3))
+MAX_SUGGESTIONS = 10
+MIN_QUERY_LENGTH = 2
+# Phrases are searchable from each of their first words on
+MAX_KEY_WORDS = 8
+# Prefix ranges longer than this are answered by walking phrases in score order
+MAX_RANGE_SCAN = 2000
+CACHE_SIZE = 1024
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def search_keys(normalized):
+    words = normalized.split(' ')
+    return [' '.join(words[start:]) for start in range(min(len(words), MAX_KEY_WORDS))]
+
+
+def post_score(created_at, comment_count):
+    """Popularity plus recency, with recency halving every POSTS_SUGGESTIONS_HALF_LIFE_DAYS"""
+    half_life = settings.POSTS_SUGGESTIONS_HALF_LIFE_DAYS * 86400
+    return math.log1p(comment_count) + created_at.timestamp() * math.log(2) / half_life
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._keys = {kind: [] for kind, _ in SUGGESTION_KINDS}      # sorted (search key, phrase)
+        self._ranked = {kind: [] for kind, _ in SUGGESTION_KINDS}    # sorted (-score, phrase)
+        self._phrases = {}         # phrase -> {'text', 'posts': {post_id: score}, 'score'}
+        self._posts = {}           # post_id -> {'phrases', 'created_at', 'comment_count'}
+        self._cache = {}
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._building = threading.Lock()
+
+    # Building
+
+    def rebuild(self):
+        """Load every visible post; the new index replaces the old one atomically"""
+        phrases, posts = {}, {}
+        rows = Post.objects.filter(is_deleted=False).values_list(
+            'pk', 'title', 'category', 'location', 'created_at', 'comment_count'
+        )
+        for pk, title, category, location, created_at, comment_count in rows.iterator():
+            score = post_score(created_at, comment_count)
+            post_phrases = set()
+            for phrase, text in self._phrases_of(title, category, location):
+                post_phrases.add(phrase)
+                entry = phrases.setdefault(phrase, {'text': text, 'posts': {}, 'score': score})
+                entry['posts'][pk] = score
+                entry['score'] = max(entry['score'], score)
+            posts[pk] = {'phrases': post_phrases, 'created_at': created_at, 'comment_count': comment_count}
+        keys = {kind: [] for kind, _ in SUGGESTION_KINDS}
+        ranked = {kind: [] for kind, _ in SUGGESTION_KINDS}
+        for phrase, entry in phrases.items():
+            keys[phrase[0]].extend((key, phrase) for key in search_keys(phrase[1]))
+            ranked[phrase[0]].append((-entry['score'], phrase))
+        for kind, _ in SUGGESTION_KINDS:
+            keys[kind].sort()
+            ranked[kind].sort()
+
+        with self._lock:
+            self._keys, self._ranked, self._phrases, self._posts = keys, ranked, phrases, posts
+            self._cache = {}
+            self._built_at = time.monotonic()
+        return len(posts)
+
+    def refresh_in_background(self):
+        """Rebuild in a thread unless a rebuild is already running"""
+        if not self._building.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Search suggestion index rebuild failed")
+            finally:
+                self._building.release()
+
+        threading.Thread(target=run, name='post-suggestions', daemon=True).start()
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            # Not warmed at startup (e.g. in a shell): build once, in line
+            with self._building:
+                if self._built_at is None:
+                    self.rebuild()
+        elif time.monotonic() - self._built_at > settings.POSTS_SUGGESTIONS_REFRESH_SECONDS:
+            self.refresh_in_background()
+
+    # Incremental updates
+
+    def _phrases_of(self, title, category, location):
+        for kind, text in (('title', title), ('category', category), ('location', location)):
+            normalized = normalize(text)
+            if normalized:
+                yield (kind, normalized), text.strip()
+
+    def _remove_sorted(self, items, item):
+        position = bisect.bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def _set_score(self, phrase, entry):
+        """Recompute a phrase's score from its posts and move it in the ranked array"""
+        score = max(entry['posts'].values())
+        if score != entry['score']:
+            self._remove_sorted(self._ranked[phrase[0]], (-entry['score'], phrase))
+            bisect.insort(self._ranked[phrase[0]], (-score, phrase))
+            entry['score'] = score
+
+    def _add(self, post_id, title, category, location, created_at, comment_count):
+        score = post_score(created_at, comment_count)
+        phrases = set()
+        for phrase, text in self._phrases_of(title, category, location):
+            phrases.add(phrase)
+            entry = self._phrases.get(phrase)
+            if entry is None:
+                entry = self._phrases[phrase] = {'text': text, 'posts': {}, 'score': score}
+                bisect.insort(self._ranked[phrase[0]], (-score, phrase))
+                for key in search_keys(phrase[1]):
+                    bisect.insort(self._keys[phrase[0]], (key, phrase))
+            entry['posts'][post_id] = score
+            self._set_score(phrase, entry)
+        self._posts[post_id] = {'phrases': phrases, 'created_at': created_at, 'comment_count': comment_count}
+
+    def _discard(self, post_id):
+        post = self._posts.pop(post_id, None)
+        if post is None:
+            return None
+        for phrase in post['phrases']:
+            entry = self._phrases[phrase]
+            del entry['posts'][post_id]
+            if entry['posts']:
+                self._set_score(phrase, entry)
+                continue
+            del self._phrases[phrase]
+            self._remove_sorted(self._ranked[phrase[0]], (-entry['score'], phrase))
+            for key in search_keys(phrase[1]):
+                self._remove_sorted(self._keys[phrase[0]], (key, phrase))
+        return post
+
+    def update(self, post):
+        """Re-index a saved post (soft-deleted posts are dropped)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            previous = self._discard(post.pk)
+            if not post.is_deleted:
+                # The instance's comment_count may be stale; counters are followed separately
+                comment_count = previous['comment_count'] if previous else post.comment_count
+                self._add(post.pk, post.title, post.category, post.location, post.created_at, comment_count)
+            self._cache = {}
+
+    def remove(self, post_id):
+        with self._lock:
+            if self._discard(post_id) is not None:
+                self._cache = {}
+
+    def adjust_popularity(self, post_id, delta):
+        """Follow a comment counter change without reloading the post"""
+        with self._lock:
+            post = self._posts.get(post_id)
+            if post is None:
+                return
+            post['comment_count'] = max(post['comment_count'] + delta, 0)
+            score = post_score(post['created_at'], post['comment_count'])
+            for phrase in post['phrases']:
+                entry = self._phrases[phrase]
+                entry['posts'][post_id] = score
+                self._set_score(phrase, entry)
+            self._cache = {}
+
+    # Queries
+
+    def _best(self, kind, query, limit):
+        """The ``limit`` best phrases of a kind with a word starting with ``query``"""
+        keys = self._keys[kind]
+        start = bisect.bisect_left(keys, (query,))
+        stop = bisect.bisect_left(keys, (query + '\U0010ffff',), start)
+        if stop - start <= MAX_RANGE_SCAN:
+            phrases = {keys[position][1] for position in range(start, stop)}
+            return sorted(phrases, key=lambda phrase: self._phrases[phrase]['score'], reverse=True)[:limit]
+
+        # Many matches: walk the kind's phrases best first, a match turns up quickly
+        best = []
+        for _, phrase in self._ranked[kind]:
+            if phrase[1].startswith(query) or f' {query}' in phrase[1]:
+                best.append(phrase)
+                if len(best) == limit:
+                    break
+        return best
+
+    def suggest(self, query):
+        """Return up to MAX_SUGGESTIONS phrases with a word starting with ``query``, best first"""
+        query = normalize(query)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            cached = self._cache.get(query)
+            if cached is not None:
+                return cached
+
+            ranked = []
+            for kind, limit in SUGGESTION_KINDS:
+                ranked.extend(self._best(kind, query, limit))
+            ranked.sort(key=lambda phrase: self._phrases[phrase]['score'], reverse=True)
+
+            suggestions, seen = [], set()
+            for phrase in ranked:
+                text = self._phrases[phrase]['text']
+                if text.lower() not in seen:
+                    seen.add(text.lower())
+                    suggestions.append(text)
+            suggestions = suggestions[:MAX_SUGGESTIONS]
+
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache = {}
+            self._cache[query] = suggestions
+            return suggestions
+
+
+_index = SuggestionIndex()
+
+
+def get_suggestion_index():
+    return _index
+
+
+def warm():
+    """Build the index in the background when a server process starts"""
+    if settings.POSTS_SUGGESTIONS_WARM_ON_STARTUP:
+        _index.refresh_in_background()
@@ -0,0 +1,11 @@
+from datetime import timedelta
+from celery import shared_task
+from django.utils import timezone
+from .models import PostDailyRollup
+
+
+@shared_task
+def reconcile_post_rollups(days=None):
+    """Recompute post statistics rollups, for the last ``days`` days or all of them"""
+    date_from = timezone.localdate() - timedelta(days=days - 1) if days else None
+    return PostDailyRollup.reconcile(date_from=date_from)
@@ -1,3 +1,437 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ParseError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from localconnect_backend.testing import follow_pages
+from notifications.outbox import dispatch_pending
+
+from .comment_tree import CommentTree
+from .models import Comment, Post, PostDailyRollup
+from .pagination import PostCursorPagination
+from .serializers import CommentSerializer, PostListSerializer
+from .signals import post_status_changed
+from .search import InvertedIndexSearchBackend, headline
+from .suggestions import SuggestionIndex
+
+User = get_user_model()
+
+
+class InvertedIndexSearchTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.titled = Post.objects.create(
+            title='Garden tools to borrow', content='A ladder and gloves for the weekend.', author=self.author
+        )
+        self.mentioned = Post.objects.create(
+            title='Laptop repair needed', content='Screen broke while working in the garden shed.', author=self.author
+        )
+        Post.objects.create(title='Ride to the airport', content='Early on Friday morning, please.', author=self.author)
+        self.backend = InvertedIndexSearchBackend()
+
+    def search(self, query):
+        return list(self.backend.search(Post.objects.all(), query).order_by('-search_rank'))
+
+    def test_title_matches_rank_above_content_matches(self):
+        self.assertEqual(self.search('garden'), [self.titled, self.mentioned])
+
+    def test_terms_match_word_prefixes(self):
+        self.assertEqual(self.search('lapt'), [self.mentioned])
+        self.assertEqual(self.search('nothing'), [])
+
+    def test_query_parameters_do_not_grow_with_matches(self):
+        def parameters():
+            return len(self.backend.search(Post.objects.all(), 'garden').query.sql_with_params()[1])
+
+        before = parameters()
+        Post.objects.bulk_create([
+            Post(title=f'Garden party {index}', content='Bring a chair.', author=self.author) for index in range(50)
+        ])
+        self.backend.rebuild()
+        self.assertEqual(len(self.backend.scores(['garden'])), 52)
+        self.assertEqual(parameters(), before)
+
+    def test_index_follows_committed_edits(self):
+        self.search('garden')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.backend.index(self.mentioned)
+            self.mentioned.content = 'Screen broke.'
+            self.mentioned.save()
+            self.backend.index(self.mentioned)
+        self.assertEqual(self.search('garden'), [self.titled])
+
+    def test_headline_escapes_and_marks_matches(self):
+        self.assertEqual(
+            headline('<b>Garden</b> gardening', ['garden']),
+            '&lt;b&gt;<mark>Garden</mark>&lt;/b&gt; <mark>gardening</mark>'
+        )
+
+
+class SuggestionIndexTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.quiet = Post.objects.create(
+            title='Garden tools to borrow', content='A ladder and gloves for the weekend.',
+            location='Riverside', author=self.author
+        )
+        self.busy = Post.objects.create(
+            title='Community garden cleanup', content='Bring gloves, we have bags and rakes.',
+            location='Garden City', author=self.author
+        )
+        Post.objects.filter(pk=self.busy.pk).update(comment_count=12)
+        self.index = SuggestionIndex()
+        self.index.rebuild()
+
+    def test_suggestions_match_word_prefixes_best_first(self):
+        self.assertEqual(
+            self.index.suggest('gard'),
+            ['Community garden cleanup', 'Garden City', 'Garden tools to borrow']
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.suggest('river'), ['Riverside'])
+
+    def test_updates_follow_saves_and_soft_deletes(self):
+        self.quiet.title = 'Power drill to borrow'
+        self.index.update(self.quiet)
+        self.assertEqual(self.index.suggest('drill'), ['Power drill to borrow'])
+        self.assertNotIn('Garden tools to borrow', self.index.suggest('garden'))
+
+        self.busy.is_deleted = True
+        self.index.update(self.busy)
+        self.assertEqual(self.index.suggest('garden'), [])
+
+
+class CommentCounterTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.posts = [
+            Post.objects.create(title=f'Help wanted number {index}', content='Details go here.', author=self.author)
+            for index in range(2)
+        ]
+
+    def comment(self, post, parent=None):
+        return Comment.objects.create(post=post, parent=parent, author=self.author, content='Happy to help')
+
+    def counts(self):
+        return (
+            dict(Post.objects.values_list('pk', 'comment_count')),
+            dict(Comment.objects.filter(reply_count__gt=0).values_list('pk', 'reply_count'))
+        )
+
+    def test_counters_follow_create_soft_delete_and_move(self):
+        first, second = self.comment(self.posts[0]), self.comment(self.posts[0])
+        reply = self.comment(self.posts[0], parent=first)
+        self.comment(self.posts[1])
+        self.assertEqual(self.counts(), ({self.posts[0].pk: 3, self.posts[1].pk: 1}, {first.pk: 1}))
+
+        reply.parent = second
+        reply.save()
+        self.assertEqual(self.counts(), ({self.posts[0].pk: 3, self.posts[1].pk: 1}, {second.pk: 1}))
+
+        reply.soft_delete()
+        first.soft_delete()
+        self.assertEqual(self.counts(), ({self.posts[0].pk: 1, self.posts[1].pk: 1}, {}))
+        reply.is_deleted = False
+        reply.save()
+        second.delete()
+        self.assertEqual(self.counts(), ({self.posts[0].pk: 0, self.posts[1].pk: 1}, {}))
+
+        # A stale instance must not overwrite the maintained counters
+        stale = Post.objects.get(pk=self.posts[1].pk)
+        self.comment(self.posts[1])
+        stale.title = 'Help wanted with moving'
+        stale.save()
+        counts = self.counts()
+        Post.refresh_comment_counts()
+        Comment.refresh_reply_counts()
+        self.assertEqual(self.counts(), counts)
+        self.assertEqual(counts[0][self.posts[1].pk], 2)
+
+
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.post = Post.objects.create(title='Help wanted with moving', content='Details go here.', author=self.author)
+        self.root = self.comment()
+        self.replies = [self.comment(self.root) for _ in range(3)]
+        self.nested = self.comment(self.comment(self.replies[0]))
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def comment(self, parent=None):
+        return Comment.objects.create(post=self.post, parent=parent, author=self.author, content='Happy to help')
+
+    def ids(self, comments):
+        return [comment.id for comment in comments]
+
+    def test_tree_is_truncated_with_more_replies_cursors(self):
+        with self.assertNumQueries(1):
+            tree = CommentTree(self.post.id, max_depth=2, max_replies=2)
+        root, = tree.roots()
+        self.assertEqual(self.ids(root.tree_replies), self.ids(self.replies[:2]))
+        replies, more = tree.replies(self.root.id, after=root.more_replies)
+        self.assertEqual((self.ids(replies), more), ([self.replies[2].id], None))
+
+        # Depth 2 is cut off; its replies continue from the cursor
+        child, = root.tree_replies[0].tree_replies
+        self.assertEqual(child.tree_replies, [])
+        replies, _ = tree.replies(child.id, after=child.more_replies)
+        self.assertEqual(self.ids(replies), [self.nested.id])
+
+    def test_deleted_comment_hides_its_replies(self):
+        self.replies[0].soft_delete()
+        root, = CommentTree(self.post.id).roots()
+        self.assertEqual(self.ids(root.tree_replies), self.ids(self.replies[1:]))
+        self.assertEqual(CommentTree(self.post.id).replies(self.replies[0].id), ([], None))
+
+    def test_replies_endpoint_pages_with_cursor(self):
+        with self.settings(COMMENT_TREE_MAX_REPLIES=2):
+            response = self.client.get(f'/api/comments/{self.root.id}/replies/').json()
+            self.assertEqual([reply['id'] for reply in response['results']], self.ids(self.replies[:2]))
+            response = self.client.get(
+                f'/api/comments/{self.root.id}/replies/', {'cursor': response['more_replies']}
+            ).json()
+        self.assertEqual(([reply['id'] for reply in response['results']], response['more_replies']), (
+            [self.replies[2].id], None
+        ))
+        self.assertEqual(
+            self.client.get(f'/api/comments/{self.root.id}/replies/', {'cursor': 'nope'}).status_code, 404
+        )
+
+
+class CommentPathTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='neighbour', email='neighbour@example.com', password='pass', email_verified=True
+        )
+        self.post = Post.objects.create(title='Help wanted with moving', content='Details go here.', author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def comment(self, parent=None):
+        return Comment.objects.create(post=self.post, parent=parent, author=self.author, content='Happy to help')
+
+    def paths(self):
+        return {comment.pk: (comment.path, comment.depth) for comment in Comment.objects.all()}
+
+    def test_move_rewrites_the_subtree(self):
+        first, second = self.comment(), self.comment()
+        reply = self.comment(first)
+        nested = self.comment(reply)
+        segment = Comment.path_segment
+        self.assertEqual(self.paths()[nested.pk], (segment(first.pk) + segment(reply.pk) + segment(nested.pk), 2))
+
+        reply.parent = second
+        reply.save()
+        self.assertEqual(self.paths()[reply.pk], (segment(second.pk) + segment(reply.pk), 1))
+        self.assertEqual(self.paths()[nested.pk], (segment(second.pk) + segment(reply.pk) + segment(nested.pk), 2))
+        self.assertEqual(list(second.descendants()), [reply, nested])
+
+        reply.parent = None
+        reply.save()
+        self.assertEqual(self.paths()[nested.pk], (segment(reply.pk) + segment(nested.pk), 1))
+
+        reply.parent = nested
+        with self.assertRaises(ValueError):
+            reply.save()
+
+    def test_nesting_depth_is_limited(self):
+        top = self.comment()
+        reply = self.comment(top)
+        deep = self.comment(reply)
+        other = self.comment()
+        with mock.patch.object(Comment, 'MAX_DEPTH', 2):
+            response = self.client.post('/api/comments/', {
+                'post': self.post.pk, 'parent': deep.pk, 'content': 'Too deep'
+            })
+            self.assertEqual(response.status_code, 400)
+            with self.assertRaises(ValueError):
+                self.comment(deep)
+
+            # Below other, the replies of top would reach depth 3
+            serializer = CommentSerializer(top, data={'parent': other.pk}, partial=True)
+            self.assertFalse(serializer.is_valid())
+            top.parent = other
+            with self.assertRaises(ValueError):
+                top.save()
+
+
+class PostDailyRollupTests(TestCase):
+    def buckets(self):
+        return set(PostDailyRollup.objects.filter(count__gt=0).values_list('category', 'status', 'count'))
+
+    def test_signals_match_reconciled_counts(self):
+        author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        posts = [
+            Post.objects.create(
+                title=f'Help wanted number {index}', content='Details about the request go here.',
+                category=Post.Category.FOOD, author=author
+            )
+            for index in range(4)
+        ]
+        posts[0].status = Post.Status.CLOSED
+        posts[0].save()
+        posts[1].category = Post.Category.MEDICAL
+        posts[1].save()
+        # Not written, so not counted
+        posts[1].status = Post.Status.CLOSED
+        posts[1].save(update_fields=['title'])
+        posts[2].soft_delete()
+        posts[3].delete()
+
+        expected = {('FOOD', 'CLOSED', 1), ('MEDICAL', 'OPEN', 1)}
+        self.assertEqual(self.buckets(), expected)
+        PostDailyRollup.reconcile()
+        self.assertEqual(self.buckets(), expected)
+
+    def test_deleting_uncounted_posts_never_leaves_negative_buckets(self):
+        author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        Post.objects.create(title='Counted post', content='Details about the request go here.', author=author)
+        Post.objects.bulk_create([
+            Post(title=f'Bulk post {index}', content='Written without signals.', author=author) for index in range(3)
+        ])
+        for post in Post.objects.filter(title__startswith='Bulk')[:2]:
+            post.delete()
+        # The second delete finds the bucket empty and reconciles the day
+        self.assertEqual(self.buckets(), {('GENERAL', 'OPEN', 2)})
+        author.delete()
+        self.assertFalse(PostDailyRollup.objects.filter(count__lt=0).exists())
+        self.assertEqual(self.buckets(), set())
+
+
+class PostStatusChangeTests(TestCase):
+    def test_status_change_is_detected_without_reading_the_row_back(self):
+        author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        Post.objects.create(title='Help wanted with moving', content='Details about the request go here.', author=author)
+        post = Post.objects.get()
+        received = []
+        post_status_changed.connect(lambda **kwargs: received.append(kwargs), weak=False, dispatch_uid='test')
+        self.addCleanup(post_status_changed.disconnect, dispatch_uid='test')
+
+        post.title = 'Help wanted with moving boxes'
+        post.save()
+        # A status change that is not written is not announced, and stays pending
+        post.status = Post.Status.CLOSED
+        post.save(update_fields=['title'])
+        self.assertEqual(received, [])
+        post.status = Post.Status.RESOLVED
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+
+        self.assertEqual([(event['old_status'], event['new_status']) for event in received], [('OPEN', 'RESOLVED')])
+        self.assertFalse(any('FROM "posts_post"' in query['sql'] for query in queries.captured_queries))
+        dispatch_pending()
+        self.assertEqual(author.notifications.get().data['old_status'], 'OPEN')
+
+
+class PostCursorPaginationTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        for index in range(12):
+            Post.objects.create(
+                title=f'Help wanted number {index}', content='Details about the request go here.',
+                category=Post.Category.FOOD if index % 2 else Post.Category.GENERAL, author=author
+            )
+        # Ties on comment_count and created_at are broken by id
+        Post.objects.filter(pk__in=Post.objects.values('pk')[:6]).update(comment_count=3)
+        self.client = APIClient()
+        self.client.force_authenticate(author)
+
+    def walk(self, params):
+        return follow_pages(self.client, '/api/posts/', {'pagination': 'cursor', 'page_size': 5, **params})
+
+    def test_pages_follow_the_requested_ordering_and_filters(self):
+        for params in ({}, {'ordering': 'comment_count'}, {'category': 'FOOD', 'ordering': '-title'}):
+            expected = [post['id'] for post in self.client.get('/api/posts/', params).json()['results']]
+            pages = self.walk(params)
+            self.assertEqual([post['id'] for page in pages for post in page['results']], expected)
+            previous = self.client.get(pages[-1]['previous']).json()
+            self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_search_rank_pages_break_ties_by_id(self):
+        params = {'search': 'help'}
+        expected = [post['id'] for post in self.client.get('/api/posts/', params).json()['results']]
+        pages = self.walk(params)
+        self.assertEqual([post['id'] for page in pages for post in page['results']], expected)
+
+    def test_expression_ordering_is_rejected(self):
+        request = APIRequestFactory().get('/api/posts/', {'pagination': 'cursor'})
+        with self.assertRaises(ParseError):
+            PostCursorPagination().paginate_queryset(Post.objects.order_by(F('title').desc()), Request(request))
+
+    def test_cursor_from_another_ordering_is_rejected(self):
+        response = self.client.get('/api/posts/', {'pagination': 'cursor', 'page_size': 5}).json()
+        self.assertEqual(self.client.get(response['next'] + '&ordering=title').status_code, 404)
+
+
+class PostResponseCacheTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.post = Post.objects.create(
+            title='Help wanted with moving', content='Details about the request go here.', author=self.author
+        )
+        self.client = APIClient()
+
+    def get(self, user, url):
+        self.client.force_authenticate(user)
+        return self.client.get(url).json()
+
+    def test_cached_bodies_are_shared_with_per_user_flags(self):
+        url = f'/api/posts/{self.post.pk}/'
+        self.assertTrue(self.get(self.author, url)['can_edit'])
+        with self.assertNumQueries(0):
+            body = self.get(self.reader, url)
+        self.assertFalse(body['can_edit'])
+        self.assertFalse(body['can_delete'])
+
+    def test_comment_writes_expire_list_and_detail(self):
+        self.assertEqual(self.get(self.reader, '/api/posts/')['results'][0]['comment_count'], 0)
+        self.get(self.reader, f'/api/posts/{self.post.pk}/')
+        Comment.objects.create(post=self.post, author=self.reader, content='Happy to help')
+
+        self.assertEqual(self.get(self.reader, '/api/posts/')['results'][0]['comment_count'], 1)
+        comments = self.get(self.reader, f'/api/posts/{self.post.pk}/')['comments']
+        self.assertEqual([comment['can_edit'] for comment in comments], [True])
+
+
+@override_settings(POSTS_RESPONSE_CACHE_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='neighbour', email='neighbour@example.com', password='pass')
+        for index in range(5):
+            Post.objects.create(
+                title=f'Help wanted number {index}', content='Details about the request go here.', author=self.author
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_malformed_detail_pk(self):
+        self.assertEqual(self.client.get('/api/posts/abc/').status_code, 404)
+        post = Post.objects.first()
+        self.assertEqual(self.client.get(f'/api/posts/0{post.pk}/').status_code, 200)
+
+    def test_unchanged_feed_is_not_serialized_again(self):
+        serialize = mock.patch.object(
+            PostListSerializer, 'to_representation', autospec=True,
+            side_effect=PostListSerializer.to_representation
+        )
+        with serialize as to_representation:
+            first = self.client.get('/api/posts/')
+            for _ in range(3):
+                response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(response.status_code, 304)
+            # Three polls saved 3 x 5 serializations
+            self.assertEqual(to_representation.call_count, 5)
+
+            post = Post.objects.first()
+            Comment.objects.create(post=post, author=self.author, content='Happy to help')
+            response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], first['ETag'])
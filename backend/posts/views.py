@@ -3,11 +3,24 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count as models_Count
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from collections import defaultdict
 from datetime import datetime, timedelta
 
-from .models import Post, Comment
+from localconnect_backend import conditional
+
+from .comment_tree import CommentTree
+from .models import Post, Comment, PostDailyRollup
+from .pagination import PostCursorPagination
+from .response_cache import apply_permissions, get_response_cache
+from .search import SearchRankOrderingFilter, get_search_backend
+from .suggestions import get_suggestion_index
 from .serializers import (
     PostSerializer, PostListSerializer, PostCreateSerializer,
     CommentSerializer, CommentCreateSerializer
@@ -19,11 +32,10 @@ class PostViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Post model with CRUD operations and advanced filtering
     """
-    queryset = Post.objects.filter(is_deleted=False)
+    queryset = Post.objects.filter(is_deleted=False).select_related('author').defer('search_vector')
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, SearchRankOrderingFilter]
     filterset_fields = ['category', 'status', 'author']
-    search_fields = ['title', 'content', 'location', 'author__username']
     ordering_fields = ['created_at', 'updated_at', 'title', 'comment_count']
     ordering = ['-created_at']
     
@@ -70,20 +82,10 @@ class PostViewSet(viewsets.ModelViewSet):
         if author:
             queryset = queryset.filter(author__username__icontains=author)
         
-        # Advanced search
+        # Full-text search, ranked by relevance (see posts.search)
         search_query = self.request.query_params.get('search', None)
         if search_query:
-            search_terms = search_query.split()
-            search_q = Q()
-            for term in search_terms:
-                search_q |= (
-                    Q(title__icontains=term) |
-                    Q(content__icontains=term) |
-                    Q(location__icontains=term) |
-                    Q(author__username__icontains=term) |
-                    Q(category__icontains=term)
-                )
-            queryset = queryset.filter(search_q)
+            queryset = get_search_backend().search(queryset, search_query)
         
         # Date range filtering
         date_from = self.request.query_params.get('date_from', None)
@@ -116,19 +118,95 @@ class PostViewSet(viewsets.ModelViewSet):
                 month_ago = now - timedelta(days=30)
                 queryset = queryset.filter(created_at__gte=month_ago)
         
-        # Popularity filtering (by comment count) - only annotate when needed
+        # Popularity filtering (by the stored comment count)
         min_comments = self.request.query_params.get('min_comments', None)
         if min_comments:
             try:
                 min_comments_int = int(min_comments)
-                queryset = queryset.annotate(
-                    comment_count_annotated=models_Count('comments', filter=Q(comments__is_deleted=False))
-                ).filter(comment_count_annotated__gte=min_comments_int)
+                queryset = queryset.filter(comment_count__gte=min_comments_int)
             except ValueError:
                 pass
         
         return queryset
     
+    @property
+    def paginator(self):
+        """Page numbers by default; keyset pages with ?pagination=cursor (see PostCursorPagination)"""
+        if not hasattr(self, '_paginator') and self.request.query_params.get('pagination') == 'cursor':
+            self._paginator = PostCursorPagination()
+        return super().paginator
+    
+    def paginate_queryset(self, queryset):
+        """Attach highlighted search snippets to the posts of the current page"""
+        page = super().paginate_queryset(queryset)
+        search_query = self.request.query_params.get('search', None)
+        if search_query and self.action == 'list':
+            posts = page if page is not None else list(queryset)
+            highlights = get_search_backend().highlights(posts, search_query)
+            for post in posts:
+                post.search_highlight = highlights.get(post.pk)
+            return page if page is not None else posts
+        return page
+    
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(['posts'], self.list_validators, super().list, request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Normalised, so validators never see a malformed pk and '05' shares the cache of '5'
+        try:
+            pk = Post._meta.pk.to_python(kwargs['pk'])
+        except ValidationError:
+            raise Http404
+        return self.cached_response(
+            [f'post:{pk}'], lambda: self.detail_validators(pk),
+            super().retrieve, request, *args, **kwargs
+        )
+    
+    def list_validators(self):
+        """Latest update and count of the filtered posts and of their comments"""
+        posts = self.filter_queryset(self.get_queryset())
+        return conditional.combine_validators(
+            conditional.aggregate_validators(posts, comments=Sum('comment_count')),
+            conditional.aggregate_validators(Comment.objects.filter(post__in=posts.values('pk')))
+        )
+    
+    def detail_validators(self, pk):
+        """Latest update and count of the post and of its visible comments"""
+        return conditional.combine_validators(
+            conditional.aggregate_validators(Post.objects.filter(pk=pk, is_deleted=False)),
+            conditional.aggregate_validators(Comment.objects.filter(post_id=pk, is_deleted=False))
+        )
+    
+    def cached_response(self, namespaces, get_validators, build, request, *args, **kwargs):
+        """
+        Serve a read with conditional GET (localconnect_backend.conditional)
+        and the versioned response cache (posts.response_cache)
+        
+        Cached bodies keep the validators they were built with, so a cache
+        hit or a 304 needs no query; per-user permission flags are filled in
+        for this request.
+        """
+        entry = None
+        if settings.POSTS_RESPONSE_CACHE_ENABLED:
+            cache = get_response_cache()
+            key = cache.key(request, namespaces)
+            entry = cache.get(key)
+        
+        validators = entry['validators'] if entry else get_validators()
+        precondition = conditional.check_preconditions(request, validators)
+        if precondition is not None:
+            return precondition
+        
+        if entry is None:
+            response = build(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {'data': response.data, 'validators': validators}
+            if settings.POSTS_RESPONSE_CACHE_ENABLED:
+                cache.set(key, entry)
+        apply_permissions(entry['data'], request.user)
+        return conditional.set_validators(Response(entry['data']), request, validators)
+    
     def perform_create(self, serializer):
         """Set the author to the current user"""
         serializer.save(author=self.request.user)
@@ -179,70 +257,75 @@ class PostViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def search_suggestions(self, request):
-        """Get search suggestions based on existing posts"""
-        query = request.query_params.get('q', '')
-        if not query or len(query) < 2:
-            return Response([])
-        
-        # Get suggestions from titles, categories, and locations
-        suggestions = []
-        
-        # Title suggestions
-        title_suggestions = Post.objects.filter(
-            title__icontains=query,
-            is_deleted=False
-        ).values_list('title', flat=True)[:5]
-        suggestions.extend(title_suggestions)
-        
-        # Category suggestions
-        category_suggestions = Post.objects.filter(
-            category__icontains=query,
-            is_deleted=False
-        ).values_list('category', flat=True).distinct()[:3]
-        suggestions.extend(category_suggestions)
-        
-        # Location suggestions
-        location_suggestions = Post.objects.filter(
-            location__icontains=query,
-            is_deleted=False
-        ).values_list('location', flat=True).distinct()[:3]
-        suggestions.extend(location_suggestions)
-        
-        return Response(list(set(suggestions))[:10])
+        """Get search suggestions from the in-memory prefix index (no database access)"""
+        return Response(get_suggestion_index().suggest(request.query_params.get('q', '')))
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Get post statistics for analytics"""
-        total_posts = Post.objects.filter(is_deleted=False).count()
-        open_posts = Post.objects.filter(status=Post.Status.OPEN, is_deleted=False).count()
-        closed_posts = Post.objects.filter(status=Post.Status.CLOSED, is_deleted=False).count()
+        """
+        Get post statistics for analytics, read from the daily rollups
         
-        # Category distribution
-        category_stats = Post.objects.filter(is_deleted=False).values('category').annotate(
-            count=models_Count('id')
-        )
+        ``date_from``/``date_to`` (YYYY-MM-DD, inclusive) limit the totals, the
+        category distribution and the ``daily`` series to posts created in
+        that range.
+        """
+        try:
+            date_from = self.parse_date(request.query_params.get('date_from'))
+            date_to = self.parse_date(request.query_params.get('date_to'))
+        except ValueError:
+            return Response(
+                {'error': 'date_from and date_to must be dates in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Recent activity (posts created in last 7 days)
-        week_ago = datetime.now() - timedelta(days=7)
-        recent_posts = Post.objects.filter(
-            created_at__gte=week_ago,
-            is_deleted=False
-        ).count()
+        rollups = PostDailyRollup.objects.order_by()
+        if date_from:
+            rollups = rollups.filter(date__gte=date_from)
+        if date_to:
+            rollups = rollups.filter(date__lte=date_to)
+        
+        # One pass over the (day, category, status) buckets
+        by_status = defaultdict(int)
+        by_category = defaultdict(int)
+        by_date = defaultdict(int)
+        for day, category, post_status, count in rollups.values_list('date', 'category', 'status', 'count'):
+            by_status[post_status] += count
+            by_category[category] += count
+            by_date[day] += count
+        
+        # Recent activity (posts created in the last 7 days, today included)
+        week_ago = timezone.localdate() - timedelta(days=6)
+        recent_posts = PostDailyRollup.objects.filter(date__gte=week_ago).aggregate(
+            total=Coalesce(Sum('count'), 0)
+        )['total']
         
         return Response({
-            'total_posts': total_posts,
-            'open_posts': open_posts,
-            'closed_posts': closed_posts,
+            'total_posts': sum(by_status.values()),
+            'open_posts': by_status[Post.Status.OPEN],
+            'closed_posts': by_status[Post.Status.CLOSED],
             'recent_posts': recent_posts,
-            'category_distribution': list(category_stats)
+            'category_distribution': [
+                {'category': category, 'count': count}
+                for category, count in sorted(by_category.items()) if count
+            ],
+            'daily': [
+                {'date': day, 'count': count}
+                for day, count in sorted(by_date.items()) if count
+            ],
+            'date_from': date_from,
+            'date_to': date_to,
         })
+    
+    @staticmethod
+    def parse_date(value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
 
 
 class CommentViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Comment model with CRUD operations and threading
     """
-    queryset = Comment.objects.filter(is_deleted=False)
+    queryset = Comment.objects.filter(is_deleted=False).select_related('author')
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrAdmin]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['post', 'author', 'parent']
@@ -295,10 +378,23 @@ class CommentViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def replies(self, request, pk=None):
-        """Get all replies to a specific comment"""
+        """Get replies to a specific comment (?cursor=<more_replies> continues them)"""
         comment = self.get_object()
-        replies = comment.replies.filter(is_deleted=False)
-        serializer = self.get_serializer(replies, many=True)
+        tree = CommentTree(comment.post_id, root=comment)
+        replies, more_replies = tree.replies(comment.id, after=request.query_params.get('cursor'))
+        context = self.get_serializer_context()
+        context['comment_trees'] = {comment.post_id: tree}
+        serializer = self.get_serializer(replies, many=True, context=context)
+        return Response({'results': serializer.data, 'more_replies': more_replies})
+    
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """Get a comment with its nested replies, loaded with one path range scan"""
+        comment = self.get_object()
+        tree = CommentTree(comment.post_id, root=comment)
+        context = self.get_serializer_context()
+        context['comment_trees'] = {comment.post_id: tree}
+        serializer = self.get_serializer(tree.subtree(comment.id), context=context)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -330,12 +426,9 @@ class CommentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Get top-level comments for the post
-        top_level_comments = Comment.objects.filter(
-            post_id=post_id_int,
-            parent=None,
-            is_deleted=False
-        ).order_by('created_at')
-        
-        serializer = self.get_serializer(top_level_comments, many=True)
+        # Load the whole thread in one query and nest it in memory
+        tree = CommentTree(post.id)
+        context = self.get_serializer_context()
+        context['comment_trees'] = {post.id: tree}
+        serializer = self.get_serializer(tree.roots(), many=True, context=context)
         return Response(serializer.data)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for chat group broadcasts: JSON encodes per message
+Compares the legacy per-recipient handler (json.dumps in every consumer)
+with pre-encoded broadcast frames (json.dumps once per message).
+Usage: python tests/benchmark_broadcast.py [members] [messages]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
+
+import django
+django.setup()
+
+from channels.layers import InMemoryChannelLayer
+from chat.broadcast import group_send_frame
+from chat.consumers import ChatConsumer
+
+
+class CountingJSON:
+    """Wrap json.dumps to count how many times a payload is encoded"""
+
+    def __init__(self):
+        self.calls = 0
+        self._dumps = json.dumps
+
+    def __enter__(self):
+        def counting_dumps(*args, **kwargs):
+            self.calls += 1
+            return self._dumps(*args, **kwargs)
+        json.dumps = counting_dumps
+        return self
+
+    def __exit__(self, *exc):
+        json.dumps = self._dumps
+
+
+def sample_message(index):
+    return {
+        'id': f'message-{index}',
+        'content': 'Is anyone heading to the community garden this weekend?',
+        'message_type': 'text',
+        'file_url': '',
+        'file_name': '',
+        'file_size': 0,
+        'sender': {'id': 'user-1', 'username': 'neighbour', 'profile_picture': None},
+        'created_at': '2025-01-01T12:00:00+00:00',
+        'is_edited': False,
+        'edited_at': None,
+    }
+
+
+async def make_room(members):
+    """Create a channel layer group with ``members`` consumers attached"""
+    layer = InMemoryChannelLayer(capacity=10000)
+    consumers = []
+    for _ in range(members):
+        consumer = ChatConsumer()
+        consumer.channel_name = await layer.new_channel()
+        consumer.sent = 0
+
+        async def send(text_data=None, bytes_data=None, close=False, _consumer=consumer):
+            _consumer.sent += 1
+
+        consumer.send = send
+        await layer.group_add('chat_benchmark', consumer.channel_name)
+        consumers.append(consumer)
+    return layer, consumers
+
+
+async def legacy_chat_message(consumer, event):
+    """The former per-recipient handler: every consumer encodes the frame itself"""
+    await consumer.send(text_data=json.dumps({
+        'type': 'chat_message',
+        'message': event['message']
+    }))
+
+
+async def deliver(layer, consumers, handler=None):
+    """Receive one event per consumer and dispatch it to ``handler`` or the consumer's own handler"""
+    for consumer in consumers:
+        event = await layer.receive(consumer.channel_name)
+        if handler is not None:
+            await handler(consumer, event)
+        else:
+            await getattr(consumer, event['type'].replace('.', '_'))(event)
+
+
+async def run_legacy(members, messages):
+    layer, consumers = await make_room(members)
+    with CountingJSON() as counter:
+        started = time.perf_counter()
+        for index in range(messages):
+            await layer.group_send('chat_benchmark', {
+                'type': 'chat_message',
+                'message': sample_message(index),
+            })
+            await deliver(layer, consumers, legacy_chat_message)
+        elapsed = time.perf_counter() - started
+    return counter.calls, elapsed
+
+
+async def run_broadcast(members, messages):
+    layer, consumers = await make_room(members)
+    with CountingJSON() as counter:
+        started = time.perf_counter()
+        for index in range(messages):
+            await group_send_frame(layer, 'chat_benchmark', {
+                'type': 'chat_message',
+                'message': sample_message(index),
+            })
+            await deliver(layer, consumers)
+        elapsed = time.perf_counter() - started
+    return counter.calls, elapsed
+
+
+def report(label, encodes, elapsed, messages):
+    print(f"{label:<22} encodes/message: {encodes / messages:>7.1f}   "
+          f"total: {elapsed * 1000:>8.1f} ms   per message: {elapsed * 1000 / messages:>6.2f} ms")
+
+
+if __name__ == "__main__":
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f"🧪 Broadcasting {messages} messages to a room with {members} members")
+    print("=" * 50)
+
+    encodes, elapsed = asyncio.run(run_legacy(members, messages))
+    report("Per-recipient encode", encodes, elapsed, messages)
+
+    encodes, elapsed = asyncio.run(run_broadcast(members, messages))
+    report("Pre-encoded frame", encodes, elapsed, messages)
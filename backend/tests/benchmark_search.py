@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for post search: legacy icontains OR filter vs the search backend
+Creates a throwaway test database from the configured settings (as
+``manage.py test`` does), seeds ``posts`` synthetic posts into it, then
+times both queries for a few search strings. The configured database itself
+is never written to.
+Usage: python tests/benchmark_search.py [posts] [repeats]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
+
+import django
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.test.utils import setup_databases, teardown_databases
+from posts.models import Post
+from posts.search import get_search_backend
+
+WORDS = (
+    'garden tools ladder lift groceries pharmacy tutor laptop repair bike '
+    'neighbour weekend moving boxes dog walking pickup school library park '
+    'volunteer soup kitchen ride airport printer router sofa fridge'
+).split()
+QUERIES = ['garden', 'laptop repair', 'ride airport', 'volunt', 'nothingmatches']
+BATCH_SIZE = 5000
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def seed(count):
+    rng = random.Random(42)
+    User = get_user_model()
+    author, _ = User.objects.get_or_create(username='search_benchmark', defaults={'email': 'search_benchmark@example.com'})
+    categories = [value for value, _ in Post.Category.choices]
+    for start in range(0, count, BATCH_SIZE):
+        Post.objects.bulk_create([
+            Post(
+                title=sentence(rng, 6),
+                content=sentence(rng, 40),
+                category=rng.choice(categories),
+                location=rng.choice(['Springfield', 'Riverside', 'Hillcrest', 'Lakeview']),
+                author=author,
+            )
+            for _ in range(start, min(start + BATCH_SIZE, count))
+        ])
+    return author
+
+
+def legacy_search(query):
+    search_q = Q()
+    for term in query.split():
+        search_q |= (
+            Q(title__icontains=term) |
+            Q(content__icontains=term) |
+            Q(location__icontains=term) |
+            Q(author__username__icontains=term) |
+            Q(category__icontains=term)
+        )
+    return list(Post.objects.filter(is_deleted=False).filter(search_q).order_by('-created_at')[:20])
+
+
+def backend_search(query):
+    queryset = get_search_backend().search(Post.objects.filter(is_deleted=False), query)
+    return list(queryset.order_by('-search_rank', '-created_at')[:20])
+
+
+def timed(function, query, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        function(query)
+    return (time.perf_counter() - started) * 1000 / repeats
+
+
+if __name__ == "__main__":
+    posts = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        print(f"🧪 Searching {posts} posts with {type(get_search_backend()).__name__}")
+        print("=" * 50)
+
+        seed(posts)
+        started = time.perf_counter()
+        get_search_backend().rebuild()
+        print(f"Index build: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        for query in QUERIES:
+            legacy = timed(legacy_search, query, repeats)
+            ranked = timed(backend_search, query, repeats)
+            print(f"{query!r:<18} icontains: {legacy:>8.1f} ms   search backend: {ranked:>8.1f} ms")
+    finally:
+        teardown_databases(databases, verbosity=0)
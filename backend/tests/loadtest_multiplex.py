@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Load test comparing per-room chat sockets with the multiplexed socket
+Connects USERS users to ROOMS rooms each, first with one ChatConsumer socket
+per room plus a NotificationConsumer socket, then with a single
+MultiplexConsumer socket per user, and reports the server's memory and file
+descriptors per active user for both models.
+
+Run the server first (python run_asgi.py), then on the same machine:
+Usage: python tests/loadtest_multiplex.py --server-pid <daphne pid> [--users 50] [--rooms 30]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localconnect_backend.settings')
+
+import django
+django.setup()
+
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from chat.models import ChatRoom, ChatParticipant
+
+
+def seed(users, rooms):
+    """Create load test users, each participating in the same set of rooms"""
+    owner, _ = User.objects.get_or_create(username='loadtest_owner')
+    room_objs = [
+        ChatRoom.objects.get_or_create(name=f'Load test room {index}', created_by=owner)[0]
+        for index in range(rooms)
+    ]
+
+    tokens = []
+    for index in range(users):
+        user, _ = User.objects.get_or_create(username=f'loadtest_user_{index}')
+        for room in room_objs:
+            ChatParticipant.objects.get_or_create(chat_room=room, user=user)
+        tokens.append(str(AccessToken.for_user(user)))
+    return tokens, [str(room.id) for room in room_objs]
+
+
+def server_usage(pid):
+    """Return (open file descriptors, resident memory in KiB) of the server"""
+    fds = len(os.listdir(f'/proc/{pid}/fd'))
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return fds, int(line.split()[1])
+    return fds, 0
+
+
+async def open_per_room(base_url, tokens, room_ids):
+    sockets = []
+    for token in tokens:
+        for room_id in room_ids:
+            socket = await websockets.connect(f'{base_url}/ws/chat/{room_id}/?token={token}')
+            await socket.recv()  # connection_established
+            sockets.append(socket)
+        socket = await websockets.connect(f'{base_url}/ws/notifications/?token={token}')
+        await socket.recv()
+        sockets.append(socket)
+    return sockets
+
+
+async def open_multiplexed(base_url, tokens, room_ids):
+    sockets = []
+    for token in tokens:
+        socket = await websockets.connect(f'{base_url}/ws/multiplex/?token={token}')
+        await socket.recv()  # connection_established
+        for room_id in room_ids:
+            await socket.send(json.dumps({'type': 'subscribe', 'room_id': room_id}))
+            await socket.recv()  # subscribed
+        sockets.append(socket)
+    return sockets
+
+
+async def measure(label, opener, args, tokens, room_ids):
+    before_fds, before_rss = server_usage(args.server_pid)
+    sockets = await opener(args.url, tokens, room_ids)
+    await asyncio.sleep(args.settle)
+    after_fds, after_rss = server_usage(args.server_pid)
+
+    users = len(tokens)
+    print(f"{label:<14} sockets: {len(sockets):>6}   "
+          f"fds/user: {(after_fds - before_fds) / users:>6.1f}   "
+          f"memory/user: {(after_rss - before_rss) / users:>8.1f} KiB")
+
+    for socket in sockets:
+        await socket.close()
+    await asyncio.sleep(args.settle)
+
+
+async def main(args, tokens, room_ids):
+    print(f"🧪 {args.users} users x {args.rooms} rooms against {args.url} (pid {args.server_pid})")
+    print("=" * 50)
+    await measure("Per-room", open_per_room, args, tokens, room_ids)
+    await measure("Multiplexed", open_multiplexed, args, tokens, room_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server-pid', type=int, required=True)
+    parser.add_argument('--url', default='ws://localhost:8000')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=30)
+    parser.add_argument('--settle', type=float, default=2.0, help='seconds to wait before sampling')
+    args = parser.parse_args()
+
+    tokens, room_ids = seed(args.users, args.rooms)
+    asyncio.run(main(args, tokens, room_ids))